@@ -0,0 +1,162 @@
+"""
+Tokens de acceso de la API.
+
+El token es un JWT firmado con SECRET_KEY que lleva el id, el nombre y el rol
+del usuario. Verificarlo no requiere consultas a la base: sólo se comprueba la
+firma, la expiración y la lista de revocaciones, que vive en el alias 'auth'
+de CACHES. Con varios procesos ese alias tiene que ser compartido (Redis):
+check_revocation_store se ejecuta al arrancar la API y lo exige.
+"""
+import time
+import uuid
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+
+ADMIN_GROUP = "Administrador"
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
+
+_REVOKED_TOKEN_KEY = "auth:revoked-token:{}"
+_REVOKED_USER_KEY = "auth:revoked-user:{}"
+REVOCATION_CACHE = "auth"
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    """Datos del usuario autenticado tal como vienen en el token."""
+    user_id: int
+    username: str
+    role: str
+    jti: str
+    issued_at: float
+    expires_at: int
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == ADMIN_GROUP
+
+
+def token_lifetime_seconds() -> int:
+    """
+    Vigencia de los tokens. Una revocación se guarda en CACHES['auth'] durante
+    este tiempo; con más de un proceso de la API ese alias debe apuntar a Redis
+    (REDIS_URL), o un token revocado seguiría valiendo en los otros procesos.
+    """
+    return settings.API_TOKEN_EXPIRE_MINUTES * 60
+
+
+def create_access_token(user_id: int, username: str, role: str) -> str:
+    """
+    Emite un token firmado para el usuario.
+
+    Args:
+        user_id: Id del usuario
+        username: Nombre de usuario
+        role: Nombre del grupo del usuario ("Administrador", "Lectura" o "")
+    """
+    # iat con fracción de segundo (NumericDate lo admite): un token emitido en
+    # el mismo segundo que una revocación, pero después, sigue siendo válido
+    issued_at = time.time()
+    payload = {
+        "sub": str(user_id),
+        "username": username,
+        "role": role,
+        "jti": uuid.uuid4().hex,
+        "iat": issued_at,
+        "exp": int(issued_at) + token_lifetime_seconds(),
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.API_ALGORITHM)
+
+
+def credentials_error(detail: str = "Token inválido o expirado") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+
+
+def decode_access_token(token: str) -> TokenClaims:
+    """
+    Verifica el token y devuelve sus claims.
+
+    Raises:
+        HTTPException: 401 si la firma no es válida, el token expiró o fue revocado
+    """
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.API_ALGORITHM])
+        claims = TokenClaims(
+            user_id=int(payload["sub"]),
+            username=payload["username"],
+            role=payload.get("role", ""),
+            jti=payload["jti"],
+            issued_at=float(payload["iat"]),
+            expires_at=int(payload["exp"]),
+        )
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise credentials_error()
+
+    if is_revoked(claims):
+        raise credentials_error("Token revocado")
+    return claims
+
+
+def revocation_cache():
+    return caches[REVOCATION_CACHE]
+
+
+def check_revocation_store() -> None:
+    """
+    Verifica que las revocaciones se vean desde todos los procesos de la API.
+
+    Raises:
+        ImproperlyConfigured: si API_REQUIRE_SHARED_REVOCATIONS está activo y
+            CACHES['auth'] es una caché en memoria del proceso
+    """
+    if settings.API_REQUIRE_SHARED_REVOCATIONS and isinstance(revocation_cache(), LocMemCache):
+        raise ImproperlyConfigured(
+            "CACHES['auth'] es LocMemCache: con varios procesos un token revocado "
+            "seguiría valiendo en los demás. Configure REDIS_URL."
+        )
+
+
+def is_revoked(claims: TokenClaims) -> bool:
+    revoked = revocation_cache().get_many([
+        _REVOKED_TOKEN_KEY.format(claims.jti),
+        _REVOKED_USER_KEY.format(claims.user_id),
+    ])
+    if _REVOKED_TOKEN_KEY.format(claims.jti) in revoked:
+        return True
+    revoked_before = revoked.get(_REVOKED_USER_KEY.format(claims.user_id))
+    return revoked_before is not None and claims.issued_at <= revoked_before
+
+
+def revoke_token(claims: TokenClaims) -> None:
+    """Revoca un token puntual (cierre de sesión) hasta su expiración."""
+    timeout = max(claims.expires_at - int(time.time()), 1)
+    revocation_cache().set(_REVOKED_TOKEN_KEY.format(claims.jti), True, timeout)
+
+
+def revoke_user_tokens(user_id: int) -> None:
+    """
+    Revoca todos los tokens emitidos hasta ahora para el usuario. Se usa al
+    eliminarlo, desactivarlo o cambiarle la contraseña o el grupo, ya que el
+    token no vuelve a consultar esos datos en la base.
+    """
+    revocation_cache().set(_REVOKED_USER_KEY.format(user_id), time.time(), token_lifetime_seconds())
+
+
+async def get_current_claims(token: str = Depends(oauth2_scheme)) -> TokenClaims:
+    """Dependencia de FastAPI con los claims del token de la petición."""
+    # La consulta de revocaciones puede ir a Redis: fuera del event loop. No
+    # toca la base, así que no hace falta el hilo único de Django
+    return await sync_to_async(decode_access_token, thread_sensitive=False)(token)
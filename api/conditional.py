@@ -0,0 +1,78 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Response, status
+
+# Las respuestas condicionales usan ETags débiles: identifican el contenido
+# (filtros + versión de la tabla), no la representación byte a byte
+
+
+def weak_etag(*parts: Any) -> str:
+    """ETag débil a partir de los valores que determinan la respuesta"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True si el cliente ya tiene la versión ``etag`` (If-None-Match, comparación débil)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def http_date(value: datetime) -> str:
+    """Fecha en formato HTTP (Last-Modified)"""
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _modified_since(if_modified_since: Optional[str], last_modified: Optional[datetime]) -> bool:
+    if not if_modified_since or last_modified is None:
+        return True
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return True
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Las fechas HTTP no tienen fracciones de segundo
+    return last_modified.replace(microsecond=0) > since
+
+
+def is_not_modified(
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+    etag: str,
+    last_modified: Optional[datetime] = None,
+) -> bool:
+    """
+    True si se puede responder 304. If-None-Match tiene prioridad: sólo si el
+    cliente no lo envía se usa If-Modified-Since.
+    """
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if if_modified_since:
+        return not _modified_since(if_modified_since, last_modified)
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Respuesta 304 sin cuerpo, con los mismos validadores que la respuesta completa"""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, last_modified))
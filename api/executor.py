@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+
+class ExecutorOverloaded(Exception):
+    """Se lanza cuando el ejecutor ya tiene el máximo de tareas pendientes."""
+
+
+class LatencyMetrics:
+    """
+    Métricas de latencia de un ejecutor: tiempo en cola (desde que se envía la
+    tarea hasta que un hilo la toma) y tiempo de cómputo.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._queued = deque(maxlen=window)
+        self._compute = deque(maxlen=window)
+        self.completed = 0
+        self.rejected = 0
+
+    def record(self, queued_seconds: float, compute_seconds: float) -> None:
+        with self._lock:
+            self._queued.append(queued_seconds)
+            self._compute.append(compute_seconds)
+            self.completed += 1
+
+    def record_rejection(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    @staticmethod
+    def _summary(samples) -> Dict[str, float]:
+        if not samples:
+            return {'avg_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+        ordered = sorted(samples)
+        return {
+            'avg_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+            'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            'max_ms': round(ordered[-1] * 1000, 3),
+        }
+
+    def snapshot(self) -> Dict:
+        """Resumen de las últimas ``window`` tareas."""
+        with self._lock:
+            return {
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'queued': self._summary(self._queued),
+                'compute': self._summary(self._compute),
+            }
+
+
+class BoundedExecutor:
+    """
+    Pool de hilos dedicado para trabajo de CPU (entrenamiento de modelos) con un
+    límite de tareas pendientes.
+
+    Las corrutinas esperan el resultado sin bloquear el event loop. Cuando ya
+    hay ``max_pending`` tareas en cola o ejecutándose, ``run`` lanza
+    ExecutorOverloaded en lugar de seguir encolando.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, name: str = 'executor'):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.metrics = LatencyMetrics()
+
+    @property
+    def pending(self) -> int:
+        """Tareas en cola o en ejecución."""
+        return self._pending
+
+    def _release(self, _future) -> None:
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        Ejecuta ``func`` en el pool y devuelve su resultado.
+
+        Raises:
+            ExecutorOverloaded: si se alcanzó el límite de tareas pendientes
+        """
+        if not self._slots.acquire(blocking=False):
+            self.metrics.record_rejection()
+            raise ExecutorOverloaded(
+                f"Hay {self.max_pending} tareas pendientes; intente nuevamente más tarde"
+            )
+        with self._pending_lock:
+            self._pending += 1
+
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.metrics.record(started_at - submitted_at, time.perf_counter() - started_at)
+
+        future = self._executor.submit(task)
+        # El lugar se libera cuando la tarea termina (o se cancela), aunque la
+        # corrutina que la espera se haya cancelado antes
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            **self.metrics.snapshot(),
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
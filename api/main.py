@@ -1,13 +1,26 @@
+import asyncio
+import logging
 import os
 import django
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional, Literal
-from datetime import datetime
+from datetime import datetime, timedelta
 from pydantic import BaseModel, conint
 from asgiref.sync import sync_to_async
-from api.predictor import AdvancedStockPredictor
+from api.predictor import forecast_stock, shutdown_process_pool, start_process_pool
+from api.auth import (
+    TokenClaims, check_revocation_store, create_access_token, decode_access_token, get_current_claims,
+    revoke_token, revoke_user_tokens, token_lifetime_seconds
+)
+from api.executor import BoundedExecutor, ExecutorOverloaded
+from api.conditional import is_not_modified, not_modified_response, validator_headers, weak_etag
+from api.realtime import (
+    SubscriberLimitReached, SubscriptionFilter, broker, connect_signals, publish_bulk, sse_events
+)
+from api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor, decode_datetime_cursor
 from decimal import Decimal
 import uuid
 from fastapi.openapi.utils import get_openapi
@@ -17,9 +30,19 @@ import json
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
 django.setup()
 
-from inventory.models import Product, InventoryMovement, CurrentStock, PredictorStock
+from inventory.models import Product, InventoryMovement, CurrentStock, PredictorStock, StockForecast
+from inventory.forecasting import get_forecast_history, forecast_many
+from inventory.services import InsufficientStock, apply_movement, apply_movements_bulk, refresh_stock_cost
+from inventory.search import DEFAULT_SEARCH_LIMIT, search_products
+from inventory.snapshots import stock_as_of, stocks_as_of
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User, Group
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Sistema de Inventario API",
@@ -39,6 +62,9 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Publicar en /api/stream/stock y /api/ws/stock los cambios hechos en este proceso
+connect_signals()
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -48,9 +74,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configurar OAuth2 con la ruta correcta
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
-
 # Modelos Pydantic para la API
 class ProductBase(BaseModel):
     product_name: str
@@ -71,6 +94,25 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True
 
+# Columnas que se pueden pedir con ?fields= en el listado de productos
+PRODUCT_FIELDS = ['product_id'] + list(ProductBase.model_fields)
+
+# Producto con sólo las columnas pedidas (las demás se omiten de la respuesta)
+class ProductFields(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    sku: Optional[str] = None
+    unit_of_measure: Optional[str] = None
+    cost: Optional[float] = None
+    sale_price: Optional[float] = None
+    category: Optional[str] = None
+    location: Optional[str] = None
+    active: Optional[bool] = None
+
+class ProductPage(BaseModel):
+    items: List[ProductFields]
+    next_cursor: Optional[str] = None
+
 # Nuevo modelo Pydantic para predicciones
 class StockPrediction(BaseModel):
     date: str
@@ -79,6 +121,15 @@ class StockPrediction(BaseModel):
     model_used: str
     trend: str
 
+class BatchPredictionRequest(BaseModel):
+    product_ids: List[str]
+    days: conint(gt=0, le=90) = 7
+
+class BatchPredictionResult(BaseModel):
+    product_id: str
+    predictions: List[StockPrediction]
+    error: Optional[str] = None
+
 # Modelos Pydantic para Usuarios
 class UserBase(BaseModel):
     username: str
@@ -135,8 +186,46 @@ class ProductUpdate(BaseModel):
     location: Optional[str] = None
     active: Optional[bool] = None
 
-# Crear instancia del predictor
-stock_predictor = AdvancedStockPredictor()
+# Ejecutor dedicado para entrenar modelos fuera del event loop. Con la cola
+# llena las predicciones responden 503 en lugar de acumular latencia.
+forecast_executor = BoundedExecutor(
+    max_workers=settings.FORECAST_EXECUTOR_WORKERS,
+    max_pending=settings.FORECAST_EXECUTOR_MAX_PENDING,
+    name='forecast'
+)
+
+def forecast_overloaded_error():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="El servicio de predicción está saturado, intente nuevamente en unos segundos",
+        headers={"Retry-After": "1"}
+    )
+
+@app.on_event("startup")
+def check_token_revocations():
+    check_revocation_store()
+
+@app.on_event("startup")
+def start_forecast_pool():
+    # El pool se crea al arrancar, antes de atender peticiones, y no desde
+    # un hilo del ejecutor en la primera predicción
+    start_process_pool(settings.FORECAST_MAX_WORKERS)
+
+@app.on_event("shutdown")
+def stop_forecast_pool():
+    forecast_executor.shutdown(wait=False)
+    shutdown_process_pool()
+
+def _forecast_many_job(product_ids: List[str], days: int):
+    # Corre en un hilo del ejecutor, que no gestiona las conexiones de Django
+    close_old_connections()
+    try:
+        return forecast_many(product_ids, days)
+    finally:
+        close_old_connections()
+
+# Máximo de productos por llamada a /api/predict/batch
+MAX_BATCH_PREDICTION_PRODUCTS = 1000
 
 async def authenticate_user(username: str, password: str):
     try:
@@ -157,19 +246,110 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Usuario o contraseña incorrectos")
-    return {"access_token": user.username, "token_type": "bearer"}
+
+    # El grupo se consulta una sola vez y viaja firmado en el token
+    groups = await sync_to_async(list)(user.groups.values_list('name', flat=True)[:1])
+    role = groups[0] if groups else ""
+    return {
+        "access_token": create_access_token(user.id, user.username, role),
+        "token_type": "bearer",
+        "expires_in": token_lifetime_seconds()
+    }
+
+@app.post("/api/token/revoke", status_code=status.HTTP_204_NO_CONTENT, tags=["Autenticación"], summary="Cerrar sesión")
+async def logout(claims: TokenClaims = Depends(get_current_claims)):
+    """
+    Revoca el token con el que se hace la petición.
+    """
+    await sync_to_async(revoke_token, thread_sensitive=False)(claims)
+    return None
 
 # Endpoints de productos
-@app.get("/api/products/", response_model=List[ProductResponse], tags=["Productos"], summary="Listar productos")
-async def get_products(token: str = Depends(oauth2_scheme)):
+def _product_filters(category: Optional[str], location: Optional[str], active: Optional[bool]) -> dict:
+    filter_kwargs = {}
+    if category is not None:
+        filter_kwargs['category'] = category
+    if location is not None:
+        filter_kwargs['location'] = location
+    if active is not None:
+        filter_kwargs['active'] = active
+    return filter_kwargs
+
+def _product_fields(fields: Optional[str]) -> List[str]:
+    """Columnas pedidas con ``fields=``; product_id va siempre para paginar"""
+    if not fields:
+        return PRODUCT_FIELDS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos desconocidos: {', '.join(unknown)}"
+        )
+    return ['product_id'] + [field for field in PRODUCT_FIELDS if field in requested and field != 'product_id']
+
+def _catalog_version(filter_kwargs: dict):
+    """Cantidad de productos y última modificación: cambia con cualquier alta, baja o edición"""
+    version = Product.objects.filter(**filter_kwargs).aggregate(count=Count('pk'), last=Max('updated_at'))
+    return version['count'], version['last']
+
+def _fetch_product_page(filter_kwargs: dict, fields: List[str], after: Optional[str], limit: int):
+    # Sólo se leen las columnas pedidas
+    queryset = Product.objects.filter(**filter_kwargs).order_by('product_id').values(*fields)
+    if after is not None:
+        queryset = queryset.filter(product_id__gt=after)
+    rows = list(queryset[:limit + 1])
+    page = rows[:limit]
+    return page, page[-1]['product_id'] if len(rows) > limit else None
+
+@app.get(
+    "/api/products/",
+    response_model=ProductPage,
+    response_model_exclude_unset=True,
+    tags=["Productos"],
+    summary="Listar productos"
+)
+async def get_products(
+    response: Response,
+    category: Optional[str] = None,
+    location: Optional[str] = None,
+    active: Optional[bool] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    claims: TokenClaims = Depends(get_current_claims)
+):
     """
-    Obtiene la lista de todos los productos en el inventario.
+    Obtiene el catálogo de productos ordenado por product_id y paginado por
+    cursor, con filtros opcionales por categoría, ubicación y estado.
+
+    Con `fields=product_id,sku,sale_price` sólo se leen y devuelven esas
+    columnas. La respuesta lleva un ETag: si el cliente lo envía en
+    `If-None-Match` y el catálogo no cambió se responde 304 sin leer los productos.
     """
-    products = await sync_to_async(list)(Product.objects.all())
-    return products
+    filter_kwargs = _product_filters(category, location, active)
+    selected = _product_fields(fields)
+    try:
+        after = decode_cursor(cursor, 1)[0] if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    count, last = await sync_to_async(_catalog_version)(filter_kwargs)
+    etag = weak_etag("products", count, last, sorted(filter_kwargs.items()), selected, after, limit)
+    if is_not_modified(if_none_match, if_modified_since, etag, last):
+        return not_modified_response(etag, last)
+
+    items, next_key = await sync_to_async(_fetch_product_page)(filter_kwargs, selected, after, limit)
+    response.headers.update(validator_headers(etag, last))
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(next_key) if next_key else None
+    }
 
 @app.post("/api/products/", response_model=ProductResponse, tags=["Productos"], summary="Crear producto")
-async def create_product(product: ProductCreate, token: str = Depends(oauth2_scheme)):
+async def create_product(product: ProductCreate, claims: TokenClaims = Depends(get_current_claims)):
     """
     Crea un nuevo producto en el inventario.
     """
@@ -180,37 +360,62 @@ async def create_product(product: ProductCreate, token: str = Depends(oauth2_sch
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Declarada antes de /api/products/{product_id} para que "search" no se tome como un id
+@app.get("/api/products/search", response_model=List[ProductResponse], tags=["Productos"], summary="Buscar productos")
+async def search_products_endpoint(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=100),
+    claims: TokenClaims = Depends(get_current_claims)
+):
+    """
+    Busca productos por nombre, SKU o product_id (lector de códigos o
+    autocompletado). Las coincidencias exactas de id o SKU van primero,
+    luego las que empiezan con el texto buscado y luego el resto por similitud.
+    """
+    return await sync_to_async(search_products)(q, limit)
+
 @app.get("/api/products/{product_id}", response_model=ProductResponse, tags=["Productos"], summary="Obtener producto")
-async def get_product(product_id: str, token: str = Depends(oauth2_scheme)):
+async def get_product(
+    product_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    claims: TokenClaims = Depends(get_current_claims)
+):
     """
-    Obtiene los detalles de un producto específico.
+    Obtiene los detalles de un producto específico. Responde 304 si el
+    producto no cambió desde el ETag o la fecha que envía el cliente.
     """
     try:
         product = await sync_to_async(Product.objects.get)(product_id=product_id)
-        return product
     except Product.DoesNotExist:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
+    etag = weak_etag("product", product.product_id, product.updated_at.isoformat())
+    if is_not_modified(if_none_match, if_modified_since, etag, product.updated_at):
+        return not_modified_response(etag, product.updated_at)
+    response.headers.update(validator_headers(etag, product.updated_at))
+    return product
+
 # Nuevo endpoint para predicciones
 @app.get("/api/products/{product_id}/predict", response_model=List[StockPrediction], tags=["Predicción"], summary="Predecir stock")
-async def predict_stock(product_id: str, days: int = 7, token: str = Depends(oauth2_scheme)):
+async def predict_stock(product_id: str, days: int = 7, claims: TokenClaims = Depends(get_current_claims)):
     """
     Realiza una predicción del stock para los próximos días.
+    
+    Se responde con el pronóstico precalculado por `manage.py refresh_forecasts`;
+    sólo se entrena en la petición si todavía no existe o si se piden más días
+    que los precalculados.
     """
     try:
-        # Obtener historial de movimientos
-        movements = await sync_to_async(list)(InventoryMovement.objects.filter(
-            product__product_id=product_id
-        ).order_by('date'))
+        forecast = await sync_to_async(
+            StockForecast.objects.filter(product__product_id=product_id).first
+        )()
+        if forecast is not None and days <= forecast.horizon_days:
+            return forecast.predictions[:days]
         
-        # Preparar datos históricos
-        historical_data = [
-            {
-                'date': movement.date,
-                'quantity': movement.quantity
-            }
-            for movement in movements
-        ]
+        # Obtener historial de movimientos
+        historical_data = await sync_to_async(get_forecast_history)(product_id)
         
         # Si no hay suficientes datos, retornar error
         if len(historical_data) < 2:
@@ -219,25 +424,68 @@ async def predict_stock(product_id: str, days: int = 7, token: str = Depends(oau
                 detail="No hay suficientes datos históricos para hacer una predicción"
             )
         
-        # Realizar predicción
-        predictions = stock_predictor.predict_next_days(historical_data, days)
+        # Realizar predicción en el ejecutor dedicado: forecast_stock no comparte
+        # estado entre peticiones, así que pueden ejecutarse varias a la vez
+        predictions = await forecast_executor.run(
+            forecast_stock, historical_data, days, product_id=product_id
+        )
         
         return predictions
+    except ExecutorOverloaded:
+        raise forecast_overloaded_error()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/predict/batch", response_model=List[BatchPredictionResult], tags=["Predicción"], summary="Predecir stock de varios productos")
+async def predict_stock_batch(request: BatchPredictionRequest, claims: TokenClaims = Depends(get_current_claims)):
+    """
+    Realiza la predicción de stock para una lista de productos en una sola llamada.
+    
+    Los productos con pronóstico precalculado se responden directamente; el resto
+    se entrena en paralelo en un pool de procesos.
+    """
+    if len(request.product_ids) > MAX_BATCH_PREDICTION_PRODUCTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se pueden predecir como máximo {MAX_BATCH_PREDICTION_PRODUCTS} productos por llamada"
+        )
+
+    product_ids = list(dict.fromkeys(request.product_ids))
+    try:
+        forecasts = await forecast_executor.run(_forecast_many_job, product_ids, request.days)
+    except ExecutorOverloaded:
+        raise forecast_overloaded_error()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return [
+        BatchPredictionResult(
+            product_id=product_id,
+            predictions=forecasts.get(product_id, []),
+            error=None if product_id in forecasts else "No hay suficientes datos históricos para hacer una predicción"
+        )
+        for product_id in product_ids
+    ]
+
+@app.get("/api/metrics/forecast", response_model=dict, tags=["Predicción"], summary="Métricas del ejecutor de predicciones")
+async def forecast_metrics(claims: TokenClaims = Depends(get_current_claims)):
+    """
+    Devuelve la ocupación del ejecutor de predicciones y la latencia de las
+    últimas tareas, separando el tiempo en cola del tiempo de cómputo.
+    """
+    return forecast_executor.stats()
+
 # Endpoints de usuarios
 @app.post("/api/users/", response_model=UserResponse, tags=["Usuarios"], summary="Crear usuario")
-async def create_user(user: UserCreate, token: str = Depends(oauth2_scheme)):
+async def create_user(user: UserCreate, claims: TokenClaims = Depends(get_current_claims)):
     """
     Crea un nuevo usuario en el sistema.
     """
     try:
-        # Verificar si el usuario actual es administrador
-        current_user = await sync_to_async(User.objects.get)(username=token)
-        is_admin = await sync_to_async(lambda: current_user.groups.filter(name="Administrador").exists())()
-        
-        if not is_admin:
+        # El rol viene firmado en el token, no hace falta consultar la base
+        if not claims.is_admin:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Solo los administradores pueden crear usuarios"
@@ -287,16 +535,13 @@ async def create_user(user: UserCreate, token: str = Depends(oauth2_scheme)):
         )
 
 @app.delete("/api/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Usuarios"], summary="Eliminar usuario")
-async def delete_user(user_id: int, token: str = Depends(oauth2_scheme)):
+async def delete_user(user_id: int, claims: TokenClaims = Depends(get_current_claims)):
     """
     Elimina un usuario del sistema.
     """
     try:
-        # Verificar si el usuario actual es administrador
-        current_user = await sync_to_async(User.objects.get)(username=token)
-        is_admin = await sync_to_async(lambda: current_user.groups.filter(name="Administrador").exists())()
-        
-        if not is_admin:
+        # El rol viene firmado en el token, no hace falta consultar la base
+        if not claims.is_admin:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Solo los administradores pueden eliminar usuarios"
@@ -306,13 +551,14 @@ async def delete_user(user_id: int, token: str = Depends(oauth2_scheme)):
         user = await sync_to_async(User.objects.get)(id=user_id)
         
         # Evitar que un administrador se elimine a sí mismo
-        if user.id == current_user.id:
+        if user.id == claims.user_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="No puedes eliminarte a ti mismo"
             )
             
         await sync_to_async(user.delete)()
+        await sync_to_async(revoke_user_tokens, thread_sensitive=False)(user.id)
         return None  # Retorna None para un 204 NO_CONTENT
         
     except User.DoesNotExist:
@@ -322,16 +568,15 @@ async def delete_user(user_id: int, token: str = Depends(oauth2_scheme)):
         )
 
 @app.put("/api/users/{user_id}", response_model=UserResponse, tags=["Usuarios"], summary="Actualizar usuario")
-async def update_user(user_id: int, user_update: UserUpdate, token: str = Depends(oauth2_scheme)):
+async def update_user(user_id: int, user_update: UserUpdate, claims: TokenClaims = Depends(get_current_claims)):
     """
     Actualiza la información de un usuario existente.
     """
     try:
-        # Verificar si el usuario actual es administrador
-        current_user = await sync_to_async(User.objects.get)(username=token)
-        is_admin = await sync_to_async(lambda: current_user.groups.filter(name="Administrador").exists())()
+        # El rol viene firmado en el token, no hace falta consultar la base
+        is_admin = claims.is_admin
         
-        if not is_admin and current_user.id != user_id:
+        if not is_admin and claims.user_id != user_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Solo puedes actualizar tu propio usuario o ser administrador"
@@ -366,6 +611,12 @@ async def update_user(user_id: int, user_update: UserUpdate, token: str = Depend
                 )
 
         await sync_to_async(user.save)()
+
+        # Los tokens emitidos llevan el rol y no vuelven a verificar la
+        # contraseña ni el estado, así que dejan de valer si alguno cambia
+        if user_update.password is not None or (is_admin and (
+                user_update.is_active is not None or user_update.group is not None)):
+            await sync_to_async(revoke_user_tokens, thread_sensitive=False)(user.id)
         
         # Refrescar el usuario para obtener los datos actualizados
         user = await sync_to_async(User.objects.get)(id=user.id)
@@ -378,16 +629,13 @@ async def update_user(user_id: int, user_update: UserUpdate, token: str = Depend
         )
 
 @app.put("/api/products/{product_id}", response_model=ProductResponse, tags=["Productos"], summary="Actualizar producto")
-async def update_product(product_id: str, product_update: ProductUpdate, token: str = Depends(oauth2_scheme)):
+async def update_product(product_id: str, product_update: ProductUpdate, claims: TokenClaims = Depends(get_current_claims)):
     """
     Actualiza la información de un producto existente.
     """
     try:
-        # Verificar si el usuario actual es administrador
-        current_user = await sync_to_async(User.objects.get)(username=token)
-        is_admin = await sync_to_async(lambda: current_user.groups.filter(name="Administrador").exists())()
-        
-        if not is_admin:
+        # El rol viene firmado en el token, no hace falta consultar la base
+        if not claims.is_admin:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Solo los administradores pueden actualizar productos"
@@ -415,6 +663,8 @@ async def update_product(product_id: str, product_update: ProductUpdate, token:
             product.active = product_update.active
 
         await sync_to_async(product.save)()
+        if product_update.cost is not None:
+            await sync_to_async(refresh_stock_cost)(product)
         return product
 
     except Product.DoesNotExist:
@@ -443,6 +693,50 @@ class MovementResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BulkMovementRequest(BaseModel):
+    movements: List[MovementCreate]
+
+class BulkMovementResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    product_id: str
+    error: Optional[str] = None
+
+class BulkMovementResponse(BaseModel):
+    created: int
+    rejected: int
+    current_stock: dict
+    results: List[BulkMovementResult]
+
+class MovementPage(BaseModel):
+    items: List[MovementResponse]
+    next_cursor: Optional[str] = None
+
+# Stock de un producto a una fecha, calculado desde el último punto de control
+class StockAsOfResponse(BaseModel):
+    product_id: str
+    quantity: int
+    as_of: datetime
+    checkpoint_date: Optional[datetime] = None
+    checkpoint_movement_id: Optional[str] = None
+
+# Fila de stock modificada, para la sincronización incremental
+class StockChange(BaseModel):
+    product_id: str
+    quantity: int
+    stock_status: str
+    threshold: int
+    last_updated: datetime
+
+class StockChangesPage(BaseModel):
+    items: List[StockChange]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+class StockAsOfPage(BaseModel):
+    items: List[StockAsOfResponse]
+    next_cursor: Optional[str] = None
+
 # Modelo para actualización de stock
 class StockUpdate(BaseModel):
     quantity: conint(gt=0)  # Asegura que la cantidad sea un entero positivo
@@ -456,18 +750,34 @@ MOVEMENT_TYPE_MAPPING = {
     "OUTBOUND": "salida"
 }
 
+def current_stock_quantity(product: Product) -> int:
+    """Stock actual de un producto cargado con select_related('product__currentstock')"""
+    try:
+        return product.currentstock.quantity
+    except CurrentStock.DoesNotExist:
+        return 0
+
+# Máximo de movimientos por llamada a /api/inventory/movements/bulk
+MAX_BULK_MOVEMENTS = 10000
+
+def new_movement_id(movement_type: str) -> str:
+    """Genera un movement_id de 9 caracteres: prefijo I/O y 8 del UUID"""
+    prefix = "I" if movement_type == "entrada" else "O"  # I para entrada (In), O para salida (Out)
+    return f"{prefix}{uuid.uuid4().hex[:8]}"
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Filas leídas por consulta al emitir movimientos como NDJSON
+MOVEMENT_STREAM_CHUNK_SIZE = 1000
+
 # Endpoints de inventario
 @app.post("/api/inventory/movements/", response_model=MovementResponse, tags=["Inventario"], summary="Crear movimiento")
-async def create_movement(movement: MovementCreate, token: str = Depends(oauth2_scheme)):
+async def create_movement(movement: MovementCreate, claims: TokenClaims = Depends(get_current_claims)):
     """
     Registra un nuevo movimiento de inventario (entrada o salida).
     """
     try:
-        # Verificar si el usuario actual es administrador
-        current_user = await sync_to_async(User.objects.get)(username=token)
-        is_admin = await sync_to_async(lambda: current_user.groups.filter(name="Administrador").exists())()
-        
-        if not is_admin:
+        # El rol viene firmado en el token, no hace falta consultar la base
+        if not claims.is_admin:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Solo los administradores pueden registrar movimientos"
@@ -475,52 +785,26 @@ async def create_movement(movement: MovementCreate, token: str = Depends(oauth2_
 
         # Obtener el producto
         product = await sync_to_async(Product.objects.get)(product_id=movement.product_id)
-        
-        # Obtener o crear el registro de stock actual
-        current_stock = await sync_to_async(CurrentStock.objects.get_or_create)(
-            product=product,
-            defaults={'quantity': 0}
-        )
-        current_stock = current_stock[0]  # get_or_create devuelve una tupla (objeto, created)
-
-        # Calcular nuevo stock
-        quantity = movement.quantity
-        if movement.movement_type == "salida":
-            quantity = -quantity
-            # Verificar si hay suficiente stock
-            if current_stock.quantity + quantity < 0:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="No hay suficiente stock disponible"
-                )
 
         # Generar movement_id (máximo 10 caracteres)
-        prefix = "I" if movement.movement_type == "entrada" else "O"  # I para entrada (In), O para salida (Out)
-        unique_id = uuid.uuid4().hex[:8]  # Tomamos solo los primeros 8 caracteres del UUID
-        movement_id = f"{prefix}{unique_id[:8]}"  # Aseguramos que el ID total tenga 9 caracteres (1 del prefijo + 8 del UUID)
-
-        # Crear el movimiento
-        new_movement = InventoryMovement(
+        movement_id = new_movement_id(movement.movement_type)
+
+        # Movimiento y stock se guardan en una sola transacción; la salida sólo
+        # se aplica si el stock alcanza en el momento de escribir
+        new_movement, current_stock = await sync_to_async(apply_movement)(
+            product,
+            'INBOUND' if movement.movement_type == "entrada" else 'OUTBOUND',
+            movement.quantity,
             movement_id=movement_id,
-            product=product,
-            quantity=abs(quantity),  # Guardamos la cantidad en positivo
-            movement_type='INBOUND' if movement.movement_type == "entrada" else 'OUTBOUND',
-            notes=movement.description,  # Cambiado de description a notes
-            date=datetime.now(),
-            order_id=movement_id  # Usar el mismo ID como order_id
+            notes=movement.description
         )
-        await sync_to_async(new_movement.save)()
-
-        # Actualizar stock actual
-        current_stock.quantity += quantity
-        await sync_to_async(current_stock.save)()
 
         # Preparar respuesta
         response_data = {
             "id": new_movement.movement_id,
             "product_id": product.product_id,
             "product_name": product.product_name,
-            "quantity": abs(quantity),
+            "quantity": movement.quantity,
             "movement_type": movement.movement_type,
             "description": new_movement.notes,
             "date": new_movement.date,
@@ -529,6 +813,13 @@ async def create_movement(movement: MovementCreate, token: str = Depends(oauth2_
         
         return MovementResponse(**response_data)
 
+    except InsufficientStock:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No hay suficiente stock disponible"
+        )
+    except HTTPException:
+        raise
     except Product.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -540,80 +831,200 @@ async def create_movement(movement: MovementCreate, token: str = Depends(oauth2_
             detail=str(e)
         )
 
-@app.get("/api/inventory/movements/", response_model=List[MovementResponse], tags=["Inventario"], summary="Listar movimientos")
+@app.post("/api/inventory/movements/bulk", response_model=BulkMovementResponse, tags=["Inventario"], summary="Crear movimientos en lote")
+async def create_movements_bulk(request: BulkMovementRequest, claims: TokenClaims = Depends(get_current_claims)):
+    """
+    Registra muchos movimientos de inventario en una sola llamada.
+    
+    Los productos se validan contra una única consulta, los movimientos se
+    insertan en bloque y el stock de cada producto se actualiza una sola vez
+    con el saldo final, todo en una transacción. Cada movimiento se valida en
+    orden: los que no se pueden aplicar (producto inexistente, stock
+    insuficiente) se informan en `results` sin afectar al resto.
+    """
+    if not claims.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden registrar movimientos"
+        )
+    if len(request.movements) > MAX_BULK_MOVEMENTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se pueden registrar como máximo {MAX_BULK_MOVEMENTS} movimientos por llamada"
+        )
+
+    now = timezone.now()
+    movements = []
+    used_ids = set()
+    for item in request.movements:
+        # Con miles de ids de 8 caracteres hex en un lote, una colisión haría
+        # fallar el INSERT completo
+        movement_id = new_movement_id(item.movement_type)
+        while movement_id in used_ids:
+            movement_id = new_movement_id(item.movement_type)
+        used_ids.add(movement_id)
+        movements.append(InventoryMovement(
+            movement_id=movement_id,
+            product_id=item.product_id,
+            quantity=item.quantity,
+            movement_type='INBOUND' if item.movement_type == "entrada" else 'OUTBOUND',
+            notes=item.description,
+            date=now
+        ))
+
+    try:
+        errors, stock = await sync_to_async(apply_movements_bulk)(movements)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    # bulk_create no emite señales: el lote se publica aparte en el canal en tiempo real
+    await sync_to_async(publish_bulk)(
+        [movement for movement, error in zip(movements, errors) if not error]
+    )
+
+    results = [
+        BulkMovementResult(
+            index=index,
+            id=None if error else movement.movement_id,
+            product_id=movement.product_id,
+            error=error
+        )
+        for index, (movement, error) in enumerate(zip(movements, errors))
+    ]
+    rejected = sum(1 for error in errors if error)
+    return BulkMovementResponse(
+        created=len(movements) - rejected,
+        rejected=rejected,
+        current_stock=stock,
+        results=results
+    )
+
+def _movement_filters(product_id: Optional[str], movement_type: Optional[str],
+                      start_date: Optional[datetime], end_date: Optional[datetime]) -> dict:
+    filter_kwargs = {}
+    if product_id:
+        filter_kwargs["product__product_id"] = product_id
+    if movement_type:
+        # Convertir el tipo de movimiento a formato de base de datos
+        movement_type_upper = movement_type.upper()
+        if movement_type_upper == "OUTBOUND" or movement_type.lower() == "salida":
+            filter_kwargs["movement_type"] = "OUTBOUND"
+        elif movement_type_upper == "INBOUND" or movement_type.lower() == "entrada":
+            filter_kwargs["movement_type"] = "INBOUND"
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Tipo de movimiento inválido. Use 'entrada'/'INBOUND' o 'salida'/'OUTBOUND'"
+            )
+    
+    if start_date:
+        filter_kwargs["date__gte"] = start_date
+    if end_date:
+        filter_kwargs["date__lte"] = end_date
+    return filter_kwargs
+
+def _serialize_movement(movement: InventoryMovement) -> dict:
+    return {
+        "id": movement.movement_id,
+        "product_id": movement.product.product_id,
+        "product_name": movement.product.product_name,
+        "quantity": abs(movement.quantity),
+        # Convertir el tipo de movimiento al formato de respuesta
+        "movement_type": MOVEMENT_TYPE_MAPPING.get(movement.movement_type, movement.movement_type),
+        "description": movement.notes,
+        "date": movement.date,
+        "current_stock": current_stock_quantity(movement.product)
+    }
+
+def _fetch_movement_page(filter_kwargs: dict, after: Optional[list], limit: int):
+    """
+    Lee una página de movimientos ordenados por (date, movement_id) descendente,
+    a continuación de la clave ``after``. Devuelve las filas serializadas y la
+    clave de la última fila si quedan más.
+    """
+    # El stock actual de cada producto viene en el mismo JOIN, sin consultas por fila
+    queryset = (
+        InventoryMovement.objects.filter(**filter_kwargs)
+        .select_related('product', 'product__currentstock')
+        .order_by('-date', '-movement_id')
+    )
+    if after is not None:
+        after_date, after_id = after
+        queryset = queryset.filter(Q(date__lt=after_date) | Q(date=after_date, movement_id__lt=after_id))
+
+    movements = list(queryset[:limit + 1])
+    page = movements[:limit]
+    next_key = None
+    if len(movements) > limit:
+        next_key = [page[-1].date, page[-1].movement_id]
+    return [_serialize_movement(movement) for movement in page], next_key
+
+def _ndjson_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+async def _stream_movements(filter_kwargs: dict, after: Optional[list]):
+    """
+    Emite los movimientos como NDJSON leyendo bloques de MOVEMENT_STREAM_CHUNK_SIZE
+    filas por clave, de modo que nunca se mantiene el resultado completo en memoria.
+    """
+    while True:
+        rows, after = await sync_to_async(_fetch_movement_page)(filter_kwargs, after, MOVEMENT_STREAM_CHUNK_SIZE)
+        if rows:
+            yield "".join(json.dumps(row, default=_ndjson_default) + "\n" for row in rows)
+        if after is None:
+            break
+
+@app.get("/api/inventory/movements/", response_model=MovementPage, tags=["Inventario"], summary="Listar movimientos")
 async def get_movements(
     product_id: Optional[str] = None,
     movement_type: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    token: str = Depends(oauth2_scheme)
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[Literal["json", "ndjson"]] = None,
+    accept: Optional[str] = Header(None),
+    claims: TokenClaims = Depends(get_current_claims)
 ):
     """
-    Obtiene la lista de movimientos de inventario con filtros opcionales.
+    Obtiene los movimientos de inventario con filtros opcionales, del más
+    reciente al más antiguo.
+    
+    La respuesta se pagina por cursor: para la página siguiente se envía el
+    `next_cursor` recibido (es nulo en la última página). Con `format=ndjson`
+    o `Accept: application/x-ndjson` se devuelven todos los movimientos como
+    un stream NDJSON (un objeto JSON por línea) en lugar de una página.
     """
     try:
-        # Construir el filtro base
-        filter_kwargs = {}
-        if product_id:
-            filter_kwargs["product__product_id"] = product_id
-        if movement_type:
-            print(f"Filtering by movement_type: {movement_type}")  # Debug log
-            # Convertir el tipo de movimiento a formato de base de datos
-            movement_type_upper = movement_type.upper()
-            if movement_type_upper == "OUTBOUND" or movement_type.lower() == "salida":
-                filter_kwargs["movement_type"] = "OUTBOUND"
-            elif movement_type_upper == "INBOUND" or movement_type.lower() == "entrada":
-                filter_kwargs["movement_type"] = "INBOUND"
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Tipo de movimiento inválido. Use 'entrada'/'INBOUND' o 'salida'/'OUTBOUND'"
-                )
-        
-        if start_date:
-            filter_kwargs["date__gte"] = start_date
-        if end_date:
-            filter_kwargs["date__lte"] = end_date
-
-        print(f"Applied filters: {filter_kwargs}")  # Debug log
-
-        # Obtener movimientos
-        movements = await sync_to_async(list)(
-            InventoryMovement.objects.filter(**filter_kwargs)
-            .select_related('product')
-            .order_by('-date')
-        )
+        filter_kwargs = _movement_filters(product_id, movement_type, start_date, end_date)
+        after = decode_datetime_cursor(cursor) if cursor else None
 
-        print(f"Found {len(movements)} movements")  # Debug log
+        if format == "ndjson" or (format is None and accept and NDJSON_MEDIA_TYPE in accept):
+            return StreamingResponse(_stream_movements(filter_kwargs, after), media_type=NDJSON_MEDIA_TYPE)
 
-        # Preparar respuesta
-        response_data = []
-        for movement in movements:
-            current_stock = await sync_to_async(CurrentStock.objects.get)(product=movement.product)
-            # Convertir el tipo de movimiento al formato de respuesta
-            movement_type_resp = MOVEMENT_TYPE_MAPPING.get(movement.movement_type, movement.movement_type)
-            response_data.append({
-                "id": movement.movement_id,
-                "product_id": movement.product.product_id,
-                "product_name": movement.product.product_name,
-                "quantity": abs(movement.quantity),
-                "movement_type": movement_type_resp,
-                "description": movement.notes,
-                "date": movement.date,
-                "current_stock": current_stock.quantity
-            })
-        
-        return response_data
+        items, next_key = await sync_to_async(_fetch_movement_page)(filter_kwargs, after, limit)
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(*next_key) if next_key else None
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_movements: {str(e)}")  # Debug log
+        logger.exception("Error al listar movimientos")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
 
 @app.post("/api/inventory/stock/{product_id}/add", response_model=MovementResponse, tags=["Inventario"], summary="Agregar stock")
-async def add_stock(product_id: str, stock_update: StockUpdate, token: str = Depends(oauth2_scheme)):
+async def add_stock(product_id: str, stock_update: StockUpdate, claims: TokenClaims = Depends(get_current_claims)):
     """
     Agrega stock a un producto específico.
     """
@@ -623,10 +1034,10 @@ async def add_stock(product_id: str, stock_update: StockUpdate, token: str = Dep
         movement_type="entrada",
         description=stock_update.description or "Adición de stock"
     )
-    return await create_movement(movement, token)
+    return await create_movement(movement, claims)
 
 @app.post("/api/inventory/stock/{product_id}/remove", response_model=MovementResponse, tags=["Inventario"], summary="Remover stock")
-async def remove_stock(product_id: str, stock_update: StockUpdate, token: str = Depends(oauth2_scheme)):
+async def remove_stock(product_id: str, stock_update: StockUpdate, claims: TokenClaims = Depends(get_current_claims)):
     """
     Remueve stock de un producto específico.
     """
@@ -636,30 +1047,100 @@ async def remove_stock(product_id: str, stock_update: StockUpdate, token: str =
         movement_type="salida",
         description=stock_update.description or "Remoción de stock"
     )
-    return await create_movement(movement, token)
+    return await create_movement(movement, claims)
+
+def _stock_version():
+    """Filas de stock y última modificación del stock o de sus productos"""
+    version = CurrentStock.objects.aggregate(
+        count=Count('pk'), stock_updated=Max('last_updated'), product_updated=Max('product__updated_at')
+    )
+    updates = [value for value in (version['stock_updated'], version['product_updated']) if value is not None]
+    return version['count'], max(updates) if updates else None
+
+def _fetch_current_stock() -> List[dict]:
+    rows = CurrentStock.objects.values_list(
+        'product_id', 'product__product_name', 'quantity', 'product__unit_of_measure', 'last_updated'
+    )
+    return [
+        {
+            "product_id": product_id,
+            "product_name": product_name,
+            "quantity": quantity,
+            "unit_of_measure": unit_of_measure,
+            "last_updated": last_updated
+        }
+        for product_id, product_name, quantity, unit_of_measure, last_updated in rows
+    ]
+
+def _fetch_stock_changes(after: Optional[list], limit: int):
+    """
+    Filas de stock modificadas después de la clave (last_updated, product_id),
+    en orden de clave. Las de los últimos STOCK_CHANGES_LAG_SECONDS se dejan
+    para la próxima consulta: una transacción que todavía no confirmó puede
+    tener un last_updated anterior al de filas ya visibles.
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.STOCK_CHANGES_LAG_SECONDS)
+    queryset = CurrentStock.objects.filter(last_updated__lte=horizon).order_by('last_updated', 'product_id')
+    if after is not None:
+        after_date, after_id = after
+        queryset = queryset.filter(
+            Q(last_updated__gt=after_date) | Q(last_updated=after_date, product_id__gt=after_id)
+        )
+
+    rows = list(queryset.values(
+        'product_id', 'quantity', 'stock_status', 'threshold', 'last_updated'
+    )[:limit + 1])
+    page = rows[:limit]
+    last_key = [page[-1]['last_updated'], page[-1]['product_id']] if page else None
+    return page, last_key, len(rows) > limit
+
+@app.get("/api/inventory/stock/changes", response_model=StockChangesPage, tags=["Inventario"], summary="Cambios de stock desde un cursor")
+async def get_stock_changes(
+    since: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    claims: TokenClaims = Depends(get_current_claims)
+):
+    """
+    Devuelve sólo las filas de stock que cambiaron desde el cursor `since`
+    (sin cursor, todas) y el cursor para la próxima consulta. El cliente
+    guarda `next_cursor` y, mientras `has_more` sea verdadero, sigue pidiendo
+    sin esperar. Las filas pueden repetirse entre consultas: se aplican como
+    reemplazo por product_id.
+    """
+    try:
+        after = decode_datetime_cursor(since) if since else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    items, last_key, has_more = await sync_to_async(_fetch_stock_changes)(after, limit)
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(*last_key) if last_key else since,
+        "has_more": has_more
+    }
 
 @app.get("/api/inventory/stock/", response_model=List[dict], tags=["Inventario"], summary="Obtener stock actual")
-async def get_current_stock(token: str = Depends(oauth2_scheme)):
+async def get_current_stock(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    claims: TokenClaims = Depends(get_current_claims)
+):
     """
     Obtiene el stock actual de todos los productos.
+
+    La respuesta lleva ETag y Last-Modified; con If-None-Match o
+    If-Modified-Since y sin cambios desde entonces se responde 304 sin leer
+    las filas de stock.
     """
     try:
-        # Obtener todos los registros de stock actual
-        stocks = await sync_to_async(list)(
-            CurrentStock.objects.select_related('product').all()
-        )
+        count, last_modified = await sync_to_async(_stock_version)()
+        etag = weak_etag("stock", count, last_modified)
+        if is_not_modified(if_none_match, if_modified_since, etag, last_modified):
+            return not_modified_response(etag, last_modified)
 
-        # Preparar respuesta
-        response_data = []
-        for stock in stocks:
-            response_data.append({
-                "product_id": stock.product.product_id,
-                "product_name": stock.product.product_name,
-                "quantity": stock.quantity,
-                "unit_of_measure": stock.product.unit_of_measure,
-                "last_updated": stock.last_updated
-            })
-        
+        response_data = await sync_to_async(_fetch_current_stock)()
+        response.headers.update(validator_headers(etag, last_modified))
         return response_data
 
     except Exception as e:
@@ -668,6 +1149,151 @@ async def get_current_stock(token: str = Depends(oauth2_scheme)):
             detail=str(e)
         )
 
+def _as_of_response(product_id: str, quantity: int, when: datetime, mark) -> dict:
+    return {
+        "product_id": product_id,
+        "quantity": quantity,
+        "as_of": when,
+        "checkpoint_date": mark[0] if mark else None,
+        "checkpoint_movement_id": mark[1] if mark else None
+    }
+
+def _aware(value: datetime) -> datetime:
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+def _fetch_stock_as_of(product_id: str, when: datetime) -> dict:
+    if not Product.objects.filter(product_id=product_id).exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Producto no encontrado"
+        )
+    quantity, mark = stock_as_of(product_id, when)
+    return _as_of_response(product_id, quantity, when, mark)
+
+def _fetch_stocks_as_of_page(when: datetime, after: Optional[str], limit: int):
+    product_ids = Product.objects.order_by('product_id').values_list('product_id', flat=True)
+    if after is not None:
+        product_ids = product_ids.filter(product_id__gt=after)
+    product_ids = list(product_ids[:limit + 1])
+    page = product_ids[:limit]
+
+    quantities, mark = stocks_as_of(when, page)
+    items = [_as_of_response(product_id, quantities.get(product_id, 0), when, mark) for product_id in page]
+    return items, page[-1] if len(product_ids) > limit else None
+
+@app.get("/api/inventory/stock/as-of", response_model=StockAsOfPage, tags=["Inventario"], summary="Stock de todos los productos a una fecha")
+async def get_stocks_as_of(
+    date: datetime,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    claims: TokenClaims = Depends(get_current_claims)
+):
+    """
+    Obtiene el stock de todos los productos a la fecha indicada, paginado por
+    product_id. Cada página parte de los puntos de control de stock y sólo
+    suma los movimientos posteriores a la última marca anterior a la fecha.
+    """
+    try:
+        after = decode_cursor(cursor, 1)[0] if cursor else None
+        items, next_key = await sync_to_async(_fetch_stocks_as_of_page)(_aware(date), after, limit)
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(next_key) if next_key else None
+        }
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@app.get("/api/inventory/stock/{product_id}/as-of", response_model=StockAsOfResponse, tags=["Inventario"], summary="Stock de un producto a una fecha")
+async def get_stock_as_of(product_id: str, date: datetime, claims: TokenClaims = Depends(get_current_claims)):
+    """
+    Obtiene el stock de un producto a la fecha indicada: la cantidad de su
+    último punto de control anterior a la fecha más los movimientos entre
+    ese punto y la fecha.
+    """
+    return await sync_to_async(_fetch_stock_as_of)(product_id, _aware(date))
+
+# Canal en tiempo real
+@app.get("/api/stream/stock", tags=["Inventario"], summary="Cambios de stock en tiempo real (SSE)")
+async def stream_stock(
+    product_id: Optional[str] = None,
+    category: Optional[str] = None,
+    stock_status: Optional[str] = Query(None, alias="status"),
+    types: Optional[str] = None,
+    claims: TokenClaims = Depends(get_current_claims)
+):
+    """
+    Emite como Server-Sent Events los cambios de stock (`event: stock`) y
+    los movimientos nuevos (`event: movement`) a medida que se confirman.
+
+    Los filtros aceptan varios valores separados por comas. Si el cliente no
+    consume a tiempo recibe `event: overflow` y debe resincronizarse con
+    /api/inventory/stock/changes.
+    """
+    filters = SubscriptionFilter.from_params(product_id, category, stock_status, types)
+    try:
+        subscriber = broker.subscribe(filters)
+    except SubscriberLimitReached:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiadas suscripciones abiertas"
+        )
+    return StreamingResponse(
+        sse_events(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/ws/stock")
+async def websocket_stock(
+    websocket: WebSocket,
+    token: str,
+    product_id: Optional[str] = None,
+    category: Optional[str] = None,
+    stock_status: Optional[str] = Query(None, alias="status"),
+    types: Optional[str] = None
+):
+    """
+    Mismo canal que /api/stream/stock por WebSocket. El token va en
+    `?token=` porque los navegadores no permiten enviar encabezados al abrir
+    un WebSocket. Cada evento se envía como un mensaje JSON.
+    """
+    try:
+        await sync_to_async(decode_access_token, thread_sensitive=False)(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    filters = SubscriptionFilter.from_params(product_id, category, stock_status, types)
+    try:
+        subscriber = broker.subscribe(filters)
+    except SubscriberLimitReached:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    await websocket.accept()
+    # Se escucha al cliente en paralelo sólo para enterarse de que se desconectó
+    receiver = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            sender = asyncio.ensure_future(subscriber.get(settings.REALTIME_HEARTBEAT_SECONDS))
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done:
+                await websocket.send_json(sender.result())
+            else:
+                sender.cancel()
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.ensure_future(websocket.receive())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        broker.unsubscribe(subscriber)
+
 def export_openapi_schema():
     """
     Exporta el esquema OpenAPI a un archivo JSON.
@@ -0,0 +1,48 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+# Tamaño de página por defecto y máximo de los listados paginados por cursor
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Codifica la clave de la última fila devuelta como un cursor opaco
+    (JSON en base64 url-safe). Las fechas se guardan en formato ISO.
+    """
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Decodifica un cursor generado por encode_cursor.
+
+    Raises:
+        ValueError: si el cursor no es válido o no tiene ``size`` valores
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursor inválido") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Cursor inválido")
+    return values
+
+
+def decode_datetime_cursor(cursor: str) -> List[Any]:
+    """
+    Decodifica un cursor (fecha, id) y convierte la fecha a datetime.
+
+    Raises:
+        ValueError: si el cursor no es válido
+    """
+    date_value, key = decode_cursor(cursor, 2)
+    try:
+        return [datetime.fromisoformat(date_value), key]
+    except (TypeError, ValueError) as e:
+        raise ValueError("Cursor inválido") from e
@@ -1,24 +1,487 @@
 import numpy as np
+import pandas as pd
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.preprocessing import StandardScaler
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Hashable, Sequence, Union
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import math
+import multiprocessing
+import os
+import threading
+import time
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Parámetros por defecto del registro de modelos entrenados
+MODEL_REGISTRY_MAX_ENTRIES = 1024
+MODEL_REGISTRY_TTL_SECONDS = 6 * 60 * 60
+
+
+def history_watermark(historical_data: List[Dict]) -> Tuple:
+    """
+    Calcula la marca de agua de un historial: identifica el último movimiento
+    con el que se entrenaría un modelo.
+
+    Además del último movimiento (id/fecha) incluye la cantidad de registros y
+    la primera fecha, porque las vistas que usan una ventana móvil (p. ej. los
+    últimos 30 días) pueden perder movimientos antiguos sin que llegue uno nuevo.
+    """
+    first = historical_data[0]
+    last = historical_data[-1]
+    return (
+        len(historical_data),
+        first['date'],
+        last['date'],
+        last.get('movement_id'),
+    )
+
+
+DatesLike = Union[np.ndarray, pd.Series, pd.DatetimeIndex, Sequence[datetime]]
+
+
+def _history_columns(historical_data: List[Dict]) -> Tuple[List[datetime], np.ndarray]:
+    """Separa un historial en columnas de fechas y cantidades."""
+    dates = [d['date'] for d in historical_data]
+    quantities = np.array([d['quantity'] for d in historical_data])
+    return dates, quantities
+
+
+def _to_datetime_index(dates: DatesLike) -> pd.DatetimeIndex:
+    """
+    Convierte fechas (datetime64, Series de pandas o lista de datetime) a un
+    DatetimeIndex. Las fechas con distintas zonas horarias se normalizan a UTC.
+    """
+    if isinstance(dates, pd.DatetimeIndex):
+        return dates
+    try:
+        return pd.DatetimeIndex(dates)
+    except (TypeError, ValueError):
+        return pd.DatetimeIndex(pd.to_datetime(dates, utc=True))
+
+
+def build_features(dates: DatesLike, base_date) -> np.ndarray:
+    """
+    Calcula de forma vectorizada las features del modelo para cada fecha:
+    días transcurridos desde ``base_date``, día de la semana, día del mes y mes.
+    
+    Returns:
+        Matriz de forma (n, 4)
+    """
+    dates = _to_datetime_index(dates)
+    days_feature = (dates - base_date) // pd.Timedelta(days=1)
+    return np.column_stack([
+        np.asarray(days_feature),
+        dates.dayofweek.to_numpy(),
+        dates.day.to_numpy(),
+        dates.month.to_numpy()
+    ])
+
+
+class ModelRegistry:
+    """
+    Registro en memoria de modelos entrenados por producto.
+
+    Cada entrada guarda el FittedStockModel (modelo ajustado, scaler y confianza)
+    junto con la marca de agua del historial con el que se entrenó. Las entradas se
+    desalojan por LRU (``max_entries``) y por antigüedad (``ttl_seconds``).
+    """
+
+    def __init__(self, max_entries: int = MODEL_REGISTRY_MAX_ENTRIES,
+                 ttl_seconds: float = MODEL_REGISTRY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple, float, FittedStockModel]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, product_id: Hashable, watermark: Tuple) -> Optional["FittedStockModel"]:
+        """
+        Devuelve el modelo entrenado del producto si sigue vigente para la marca
+        de agua indicada, o None si hay que reentrenar.
+        """
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is not None:
+                entry_watermark, stored_at, fitted = entry
+                expired = time.monotonic() - stored_at > self.ttl_seconds
+                if expired or entry_watermark != watermark:
+                    # Un modelo vencido o entrenado con otro historial no sirve más
+                    del self._entries[product_id]
+                else:
+                    self._entries.move_to_end(product_id)
+                    self.hits += 1
+                    return fitted
+            self.misses += 1
+            return None
+
+    def put(self, product_id: Hashable, watermark: Tuple, fitted: "FittedStockModel") -> None:
+        """Guarda el modelo entrenado de un producto desalojando el menos usado."""
+        with self._lock:
+            self._entries[product_id] = (watermark, time.monotonic(), fitted)
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, product_id: Optional[Hashable] = None) -> None:
+        """Elimina la entrada de un producto, o todas si no se indica producto."""
+        with self._lock:
+            if product_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(product_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Registro compartido por todas las instancias del predictor del proceso
+model_registry = ModelRegistry()
+
+
+def _handle_outliers(quantities: np.ndarray, threshold: float = 3.0) -> np.ndarray:
+    """
+    Maneja valores atípicos usando el método Z-score
+    """
+    z_scores = np.abs((quantities - np.mean(quantities)) / np.std(quantities))
+    quantities[z_scores > threshold] = np.median(quantities)
+    return quantities
+
+
+def _detect_trend(quantities: np.ndarray) -> str:
+    """
+    Detecta la tendencia en los datos y considera casos especiales
+    """
+    if len(quantities) < 2:
+        return "No hay suficientes datos para detectar tendencia"
+    
+    # Si el último valor es 0 o muy cercano a 0, es una tendencia a la baja
+    if quantities[-1] <= 0.1:
+        return "Tendencia a la baja"
+    
+    slope = np.polyfit(np.arange(len(quantities)), quantities, 1)[0]
+    
+    # Ajustar los umbrales para ser más sensibles a los cambios
+    if slope > 0.05:
+        return "Tendencia al alza"
+    elif slope < -0.05:
+        return "Tendencia a la baja"
+    else:
+        # Verificar si hay una tendencia clara hacia el umbral crítico
+        if quantities[-1] <= min(quantities[:-1]) and slope < 0:
+            return "Tendencia a la baja"
+        return "Tendencia estable"
+
+
+def _prepare_features(dates: pd.DatetimeIndex, quantities: np.ndarray,
+                      scaler: StandardScaler) -> Tuple[np.ndarray, np.ndarray]:
+    if len(dates) == 0:
+        raise ValueError("No hay datos históricos para procesar")
+    
+    # Detectar y manejar valores atípicos
+    quantities = _handle_outliers(np.array(quantities))
+    
+    # Crear features (días desde el primer registro, día de la semana, del mes y mes)
+    X = build_features(dates, dates.min())
+    
+    # Escalar features
+    X = scaler.fit_transform(X)
+    
+    return X, quantities
+
+
+@dataclass(frozen=True)
+class FittedStockModel:
+    """
+    Modelo de stock entrenado e inmutable, resultado de fit_stock_model.
+    
+    Predecir no modifica ningún estado, así que una misma instancia puede usarse
+    desde varios hilos a la vez sin locks.
+    """
+    model: object
+    model_name: str
+    scaler: StandardScaler
+    confidence_score: float
+    base_date: pd.Timestamp
+    last_date: pd.Timestamp
+    trend: str
+
+    def predict(self, days: int = 7) -> List[Dict]:
+        """
+        Predice el stock para los días siguientes a la última fecha entrenada.
+        
+        Returns:
+            Lista de predicciones con fecha, cantidad predicha y métricas
+        """
+        # Preparar fechas y features para predicción
+        future_dates = self.last_date + pd.to_timedelta(np.arange(1, days + 1), unit='D')
+        X_pred = self.scaler.transform(build_features(future_dates, self.base_date))
+        
+        # Realizar predicción
+        predictions = self.model.predict(X_pred)
+        
+        # Formatear resultados
+        return [
+            {
+                'date': date,
+                'predicted_quantity': max(0, float(quantity)),  # Evitar predicciones negativas
+                'confidence_score': float(self.confidence_score),
+                'model_used': self.model_name,
+                'trend': self.trend
+            }
+            for date, quantity in zip(future_dates.strftime('%Y-%m-%d'), predictions)
+        ]
+
+
+def fit_stock_model(historical_data: List[Dict]) -> FittedStockModel:
+    """
+    Entrena múltiples modelos y devuelve el mejor como un FittedStockModel.
+    
+    Args:
+        historical_data: Lista de diccionarios con {'date': datetime, 'quantity': float}
+            ordenada por fecha
+    """
+    if not historical_data:
+        raise ValueError("No hay datos históricos para procesar")
+    dates, quantities = _history_columns(historical_data)
+    return fit_stock_model_columns(dates, quantities)
+
+
+def fit_stock_model_columns(dates: DatesLike, quantities: np.ndarray) -> FittedStockModel:
+    """
+    Variante columnar de fit_stock_model (fechas datetime64, Series de pandas o
+    lista de datetime y cantidades alineadas).
+    
+    Cada llamada crea sus propios estimadores y scaler, por lo que puede
+    ejecutarse en paralelo sin compartir estado.
+    """
+    dates = _to_datetime_index(dates)
+    quantities = np.array(quantities)
+    scaler = StandardScaler()
+    X, y = _prepare_features(dates, quantities, scaler)
+    
+    # Dividir datos en entrenamiento y validación
+    split_idx = int(len(X) * 0.8)
+    X_train, X_val = X[:split_idx], X[split_idx:]
+    y_train, y_val = y[:split_idx], y[split_idx:]
+    
+    # Entrenar modelos
+    models = {
+        'linear': LinearRegression(),
+        'random_forest': RandomForestRegressor(n_estimators=100, random_state=42)
+    }
+    
+    best_score = -float('inf')
+    best_model = None
+    best_model_name = None
+    
+    for name, model in models.items():
+        model.fit(X_train, y_train)
+        y_pred = model.predict(X_val)
+        score = r2_score(y_val, y_pred)
+        
+        if score > best_score:
+            best_score = score
+            best_model = model
+            best_model_name = name
+            
+    confidence_score = max(0, min(1, best_score))
+    logger.info(f"Mejor modelo: {best_model_name} (Confianza: {confidence_score:.2f})")
+    
+    return FittedStockModel(
+        model=best_model,
+        model_name=best_model_name,
+        scaler=scaler,
+        confidence_score=confidence_score,
+        base_date=dates.min(),
+        last_date=dates.max(),
+        trend=_detect_trend(quantities)
+    )
+
+
+def get_fitted_model(historical_data: List[Dict], product_id: Optional[Hashable] = None,
+                     registry: Optional[ModelRegistry] = None) -> FittedStockModel:
+    """
+    Devuelve el modelo entrenado para un historial, reutilizando el del registro
+    cuando se indica ``product_id`` y el historial no cambió.
+    """
+    if product_id is None:
+        return fit_stock_model(historical_data)
+    
+    registry = registry if registry is not None else model_registry
+    watermark = history_watermark(historical_data)
+    fitted = registry.get(product_id, watermark)
+    if fitted is None:
+        fitted = fit_stock_model(historical_data)
+        registry.put(product_id, watermark, fitted)
+    return fitted
+
+
+def forecast_stock(historical_data: List[Dict], days: int = 7,
+                   product_id: Optional[Hashable] = None,
+                   registry: Optional[ModelRegistry] = None) -> List[Dict]:
+    """
+    Predice el stock para los próximos días sin estado compartido.
+    
+    Es seguro llamarla concurrentemente desde un pool de hilos.
+    
+    Args:
+        historical_data: Datos históricos de stock, ordenados por fecha.
+            Cada registro puede incluir 'movement_id' para identificar
+            el último movimiento entrenado.
+        days: Número de días a predecir
+        product_id: Si se indica, reutiliza el modelo del registro cuando
+            el historial no cambió desde el último entrenamiento
+        registry: Registro de modelos; por defecto el del módulo
+        
+    Returns:
+        Lista de predicciones con fecha, cantidad predicha y métricas
+    """
+    if not historical_data:
+        return []
+    return get_fitted_model(historical_data, product_id, registry).predict(days)
+
+
+# Pool de procesos compartido por predict_many (ver start_process_pool)
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def start_process_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Crea (una sola vez) el pool de procesos que usa predict_many.
+
+    Los procesos se lanzan con el contexto 'spawn': un fork desde un hilo de
+    un proceso con varios hilos (uvicorn y su ejecutor de predicciones)
+    copiaría el event loop, las conexiones abiertas y locks tomados por otros
+    hilos, y el hijo podría quedar bloqueado. El pool vive hasta
+    shutdown_process_pool, así no se levantan procesos en cada llamada.
+
+    Args:
+        max_workers: Procesos del pool; por defecto la cantidad de CPUs
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_workers or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Termina los procesos del pool compartido, si se creó"""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def predict_many(histories: Dict[Hashable, List[Dict]], days: int = 7,
+                 max_workers: Optional[int] = None,
+                 chunk_size: Optional[int] = None,
+                 registry: Optional[ModelRegistry] = None) -> Dict[Hashable, List[Dict]]:
+    """
+    Predice el stock de varios productos repartiendo el entrenamiento en el
+    pool de procesos compartido (start_process_pool).
+    
+    Los productos con un modelo vigente en el registro se resuelven en el
+    proceso actual; el resto se agrupa en bloques de ``chunk_size`` productos
+    que se entrenan en paralelo, y los modelos resultantes se guardan en el
+    registro.
+    
+    Args:
+        histories: Historial de cada producto, indexado por product_id
+        days: Número de días a predecir
+        max_workers: Procesos a usar; por defecto la cantidad de CPUs. Si
+            el pool todavía no existe se crea con esta cantidad.
+        chunk_size: Productos por tarea enviada al pool; por defecto se
+            reparten unas cuatro tareas por proceso
+        registry: Registro de modelos; por defecto el del módulo
+        
+    Returns:
+        Predicciones por product_id. Los productos sin historial o cuyo
+        entrenamiento falla quedan con una lista vacía.
+    """
+    registry = registry if registry is not None else model_registry
+    results = {}
+    pending = []
+    for product_id, history in histories.items():
+        if not history:
+            results[product_id] = []
+            continue
+        fitted = registry.get(product_id, history_watermark(history))
+        if fitted is not None:
+            results[product_id] = fitted.predict(days)
+        else:
+            pending.append((product_id, history))
+
+    if not pending:
+        return results
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers <= 1 or len(pending) == 1:
+        # No vale la pena enviar al pool un único bloque
+        chunk_results = [_fit_chunk(pending)]
+    else:
+        if not chunk_size:
+            chunk_size = max(1, math.ceil(len(pending) / (workers * 4)))
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+        chunk_results = list(start_process_pool(workers).map(_fit_chunk, chunks))
+
+    for chunk in chunk_results:
+        for product_id, fitted in chunk:
+            if fitted is None:
+                results[product_id] = []
+                continue
+            registry.put(product_id, history_watermark(histories[product_id]), fitted)
+            results[product_id] = fitted.predict(days)
+
+    return results
+
+
+def _fit_chunk(chunk: List[Tuple[Hashable, List[Dict]]]) -> List[Tuple[Hashable, Optional[FittedStockModel]]]:
+    """
+    Entrena un bloque de productos. Se ejecuta dentro de los procesos del pool
+    de predict_many y devuelve los modelos para que el proceso principal los
+    guarde en su registro.
+    """
+    results = []
+    for product_id, history in chunk:
+        try:
+            results.append((product_id, fit_stock_model(history)))
+        except Exception as e:
+            logger.error(f"Error al predecir el producto {product_id}: {str(e)}")
+            results.append((product_id, None))
+    return results
+
+
 class AdvancedStockPredictor:
-    def __init__(self):
-        # Modelos de predicción
-        self.linear_model = LinearRegression()
-        self.rf_model = RandomForestRegressor(n_estimators=100, random_state=42)
+    """
+    Interfaz orientada a objetos sobre fit_stock_model / forecast_stock.
+    
+    Guarda en la instancia el último modelo usado (best_model, scaler,
+    confidence_score), por lo que una instancia no debe compartirse entre
+    peticiones concurrentes; para eso están las funciones del módulo.
+    """
+
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        # Los candidatos se crean en fit_stock_model en cada entrenamiento
         self.scaler = StandardScaler()
         self.best_model = None
         self.best_model_name = None
         self.confidence_score = 0.0
+        self.fitted = None
+        self.registry = registry if registry is not None else model_registry
         
     def prepare_data(self, historical_data: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
         """
@@ -33,151 +496,61 @@ class AdvancedStockPredictor:
         if not historical_data:
             raise ValueError("No hay datos históricos para procesar")
             
-        # Convertir fechas a números (días desde el primer registro)
-        dates = np.array([d['date'] for d in historical_data])
-        quantities = np.array([d['quantity'] for d in historical_data])
-        
-        # Detectar y manejar valores atípicos
-        quantities = self._handle_outliers(quantities)
-        
-        # Crear features
-        base_date = min(dates)
-        days_feature = np.array([(d - base_date).days for d in dates])
-        
-        # Añadir características adicionales
-        day_of_week = np.array([d.weekday() for d in dates])
-        day_of_month = np.array([d.day for d in dates])
-        month = np.array([d.month for d in dates])
-        
-        # Combinar features
-        X = np.column_stack([
-            days_feature,
-            day_of_week,
-            day_of_month,
-            month
-        ])
-        
-        # Escalar features
-        X = self.scaler.fit_transform(X)
-        
-        return X, quantities
-        
-    def _handle_outliers(self, quantities: np.ndarray, threshold: float = 3.0) -> np.ndarray:
-        """
-        Maneja valores atípicos usando el método Z-score
+        dates, quantities = _history_columns(historical_data)
+        return self.prepare_columns(dates, quantities)
+
+    def prepare_columns(self, dates: DatesLike, quantities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
-        z_scores = np.abs((quantities - np.mean(quantities)) / np.std(quantities))
-        quantities[z_scores > threshold] = np.median(quantities)
-        return quantities
+        Variante columnar de prepare_data para historiales grandes.
         
-    def _detect_trend(self, quantities: np.ndarray) -> str:
-        """
-        Detecta la tendencia en los datos y considera casos especiales
+        Args:
+            dates: Fechas como arreglo datetime64 de NumPy, Series de pandas o
+                lista de datetime
+            quantities: Cantidades alineadas con las fechas
+            
+        Returns:
+            Tuple con features (X) y target (y)
         """
-        if len(quantities) < 2:
-            return "No hay suficientes datos para detectar tendencia"
-        
-        # Si el último valor es 0 o muy cercano a 0, es una tendencia a la baja
-        if quantities[-1] <= 0.1:
-            return "Tendencia a la baja"
+        return _prepare_features(_to_datetime_index(dates), quantities, self.scaler)
         
-        slope = np.polyfit(np.arange(len(quantities)), quantities, 1)[0]
+    def _handle_outliers(self, quantities: np.ndarray, threshold: float = 3.0) -> np.ndarray:
+        return _handle_outliers(quantities, threshold)
         
-        # Ajustar los umbrales para ser más sensibles a los cambios
-        if slope > 0.05:
-            return "Tendencia al alza"
-        elif slope < -0.05:
-            return "Tendencia a la baja"
-        else:
-            # Verificar si hay una tendencia clara hacia el umbral crítico
-            if quantities[-1] <= min(quantities[:-1]) and slope < 0:
-                return "Tendencia a la baja"
-            return "Tendencia estable"
+    def _detect_trend(self, quantities: np.ndarray) -> str:
+        return _detect_trend(quantities)
+
+    def _use(self, fitted: FittedStockModel) -> None:
+        self.fitted = fitted
+        self.best_model = fitted.model
+        self.best_model_name = fitted.model_name
+        self.scaler = fitted.scaler
+        self.confidence_score = fitted.confidence_score
             
     def train(self, historical_data: List[Dict]) -> None:
         """
         Entrena múltiples modelos y selecciona el mejor
         """
-        X, y = self.prepare_data(historical_data)
-        
-        # Dividir datos en entrenamiento y validación
-        split_idx = int(len(X) * 0.8)
-        X_train, X_val = X[:split_idx], X[split_idx:]
-        y_train, y_val = y[:split_idx], y[split_idx:]
-        
-        # Entrenar modelos
-        models = {
-            'linear': self.linear_model,
-            'random_forest': self.rf_model
-        }
+        self._use(fit_stock_model(historical_data))
         
-        best_score = -float('inf')
-        
-        for name, model in models.items():
-            model.fit(X_train, y_train)
-            y_pred = model.predict(X_val)
-            score = r2_score(y_val, y_pred)
-            
-            if score > best_score:
-                best_score = score
-                self.best_model = model
-                self.best_model_name = name
-                
-        self.confidence_score = max(0, min(1, best_score))
-        logger.info(f"Mejor modelo: {self.best_model_name} (Confianza: {self.confidence_score:.2f})")
-        
-    def predict_next_days(self, historical_data: List[Dict], days: int = 7) -> List[Dict]:
+    def predict_next_days(self, historical_data: List[Dict], days: int = 7,
+                          product_id: Optional[Hashable] = None) -> List[Dict]:
         """
         Predice el stock para los próximos días usando el mejor modelo.
         
-        Args:
-            historical_data: Datos históricos de stock
-            days: Número de días a predecir
-            
-        Returns:
-            Lista de predicciones con fecha, cantidad predicha y métricas
+        Ver forecast_stock para el detalle de los argumentos.
         """
         if not historical_data:
             return []
-            
-        # Entrenar modelos
-        self.train(historical_data)
-        
-        # Preparar fechas para predicción
-        last_date = max(d['date'] for d in historical_data)
-        future_dates = [last_date + timedelta(days=i+1) for i in range(days)]
-        
-        # Crear features para predicción
-        base_date = min(d['date'] for d in historical_data)
-        days_feature = np.array([(d - base_date).days for d in future_dates])
-        day_of_week = np.array([d.weekday() for d in future_dates])
-        day_of_month = np.array([d.day for d in future_dates])
-        month = np.array([d.month for d in future_dates])
-        
-        X_pred = np.column_stack([
-            days_feature,
-            day_of_week,
-            day_of_month,
-            month
-        ])
-        
-        # Escalar features
-        X_pred = self.scaler.transform(X_pred)
-        
-        # Realizar predicción
-        predictions = self.best_model.predict(X_pred)
-        
-        # Detectar tendencia
-        trend = self._detect_trend(np.array([d['quantity'] for d in historical_data]))
+        fitted = get_fitted_model(historical_data, product_id, self.registry)
+        self._use(fitted)
+        return fitted.predict(days)
+
+    def predict_many(self, histories: Dict[Hashable, List[Dict]], days: int = 7,
+                     max_workers: Optional[int] = None,
+                     chunk_size: Optional[int] = None) -> Dict[Hashable, List[Dict]]:
+        """
+        Predice el stock de varios productos en un pool de procesos.
         
-        # Formatear resultados
-        return [
-            {
-                'date': date.strftime('%Y-%m-%d'),
-                'predicted_quantity': max(0, float(quantity)),  # Evitar predicciones negativas
-                'confidence_score': float(self.confidence_score),
-                'model_used': self.best_model_name,
-                'trend': trend
-            }
-            for date, quantity in zip(future_dates, predictions)
-        ] 
\ No newline at end of file
+        Ver la función predict_many del módulo.
+        """
+        return predict_many(histories, days, max_workers, chunk_size, self.registry)
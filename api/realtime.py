@@ -0,0 +1,240 @@
+"""
+Canal de cambios de stock en tiempo real (WebSocket y Server-Sent Events).
+
+Cada escritura de ``CurrentStock`` o ``InventoryMovement`` hecha con save()
+en el proceso de la API se publica al confirmarse la transacción
+(``transaction.on_commit``); los lotes de /api/inventory/movements/bulk se
+publican con ``publish_bulk``. Las escrituras de otros procesos (admin,
+scripts) no llegan a este canal: los clientes que lo necesiten combinan el
+canal con /api/inventory/stock/changes.
+
+Cada suscriptor tiene filtros propios y una cola acotada
+(REALTIME_QUEUE_SIZE). Si el cliente no consume a tiempo, la cola se vacía y
+se le envía un evento ``overflow`` para que se resincronice con
+/api/inventory/stock/changes, en lugar de acumular memoria o frenar a los demás.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from dataclasses import dataclass
+from typing import AsyncIterator, FrozenSet, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from inventory.models import CurrentStock, InventoryMovement
+
+STOCK_EVENT = "stock"
+MOVEMENT_EVENT = "movement"
+OVERFLOW_EVENT = "overflow"
+HEARTBEAT_EVENT = "heartbeat"
+
+
+def _split(value: Optional[str]) -> FrozenSet[str]:
+    return frozenset(part.strip() for part in value.split(",") if part.strip()) if value else frozenset()
+
+
+@dataclass(frozen=True)
+class SubscriptionFilter:
+    """Filtros de un suscriptor; un conjunto vacío acepta cualquier valor"""
+    product_ids: FrozenSet[str] = frozenset()
+    categories: FrozenSet[str] = frozenset()
+    statuses: FrozenSet[str] = frozenset()
+    types: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_params(
+        cls,
+        product_id: Optional[str] = None,
+        category: Optional[str] = None,
+        status: Optional[str] = None,
+        types: Optional[str] = None,
+    ) -> "SubscriptionFilter":
+        """Filtros desde parámetros separados por comas (?category=Bebidas,Lácteos)"""
+        return cls(_split(product_id), _split(category), _split(status), _split(types))
+
+    def matches(self, event: dict) -> bool:
+        if event["type"] == OVERFLOW_EVENT:
+            return True
+        if self.types and event["type"] not in self.types:
+            return False
+        if self.product_ids and event["product_id"] not in self.product_ids:
+            return False
+        if self.categories and event["category"] not in self.categories:
+            return False
+        # El estado sólo filtra los eventos de stock
+        if self.statuses and event["type"] == STOCK_EVENT and event["stock_status"] not in self.statuses:
+            return False
+        return True
+
+
+class Subscriber:
+    """Cola acotada de eventos de un cliente, atada al event loop que la consume"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, filters: SubscriptionFilter, max_queue: int):
+        self.loop = loop
+        self.filters = filters
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflows = 0
+
+    def offer(self, event: dict) -> None:
+        """Encola el evento si pasa los filtros. Se ejecuta en el hilo del loop."""
+        if not self.filters.matches(event):
+            return
+        if self.queue.full():
+            # Cliente lento: se descarta lo pendiente y se le pide resincronizar
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.overflows += 1
+            self.queue.put_nowait({"type": OVERFLOW_EVENT, "dropped_since_connect": self.overflows})
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> dict:
+        """Próximo evento, o un heartbeat si no llega ninguno en ``timeout`` segundos"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return {"type": HEARTBEAT_EVENT}
+
+
+class SubscriberLimitReached(Exception):
+    """Se lanza al superar REALTIME_MAX_SUBSCRIBERS conexiones."""
+
+
+class StockEventBroker:
+    """Reparte los eventos publicados desde cualquier hilo a los suscriptores"""
+
+    def __init__(self):
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, filters: SubscriptionFilter) -> Subscriber:
+        """Registra un suscriptor en el event loop actual"""
+        subscriber = Subscriber(asyncio.get_running_loop(), filters, settings.REALTIME_QUEUE_SIZE)
+        with self._lock:
+            if len(self._subscribers) >= settings.REALTIME_MAX_SUBSCRIBERS:
+                raise SubscriberLimitReached()
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                self.unsubscribe(subscriber)
+
+
+broker = StockEventBroker()
+
+
+def stock_event(stock: CurrentStock) -> dict:
+    return {
+        "type": STOCK_EVENT,
+        "product_id": stock.product_id,
+        "category": stock.product.category,
+        # Las cantidades pueden llegar como Decimal desde la API (MovementCreate)
+        "quantity": int(stock.quantity),
+        "stock_status": stock.stock_status,
+        "threshold": stock.threshold,
+        "last_updated": stock.last_updated.isoformat() if stock.last_updated else None,
+    }
+
+
+def movement_event(movement: InventoryMovement) -> dict:
+    return {
+        "type": MOVEMENT_EVENT,
+        "movement_id": movement.movement_id,
+        "product_id": movement.product_id,
+        "category": movement.product.category,
+        "movement_type": movement.movement_type,
+        "quantity": int(movement.quantity),
+        "date": movement.date.isoformat(),
+    }
+
+
+def _publish_on_commit(events: List[dict]) -> None:
+    transaction.on_commit(lambda: [broker.publish(event) for event in events])
+
+
+# Último save de cada producto en este hilo. Una misma transacción puede
+# guardar el stock más de una vez (apply_movement crea la fila y después
+# recalcula el estado): al confirmar sólo se publica el último.
+_stock_saves = threading.local()
+_stock_sequence = itertools.count()
+
+
+def _stock_saved(sender, instance, **kwargs):
+    if not broker.has_subscribers:
+        return
+    latest = _stock_saves.__dict__.setdefault('latest', {})
+    sequence = latest[instance.product_id] = next(_stock_sequence)
+    event = stock_event(instance)
+
+    def publish():
+        if latest.get(instance.product_id) == sequence:
+            del latest[instance.product_id]
+            broker.publish(event)
+
+    transaction.on_commit(publish)
+
+
+def _movement_saved(sender, instance, created, **kwargs):
+    if created and broker.has_subscribers:
+        _publish_on_commit([movement_event(instance)])
+
+
+def connect_signals() -> None:
+    """Publica en el canal los save() de stock y movimientos de este proceso"""
+    post_save.connect(_stock_saved, sender=CurrentStock, dispatch_uid="realtime-stock")
+    post_save.connect(_movement_saved, sender=InventoryMovement, dispatch_uid="realtime-movement")
+
+
+def publish_bulk(movements: Iterable[InventoryMovement]) -> None:
+    """
+    Publica un lote guardado con bulk_create/bulk_update, que no emite
+    señales: los movimientos y el stock resultante de sus productos.
+    """
+    movements = list(movements)
+    if not movements or not broker.has_subscribers:
+        return
+    product_ids = {movement.product_id for movement in movements}
+    stocks = {
+        stock.product_id: stock
+        for stock in CurrentStock.objects.select_related('product').filter(product_id__in=product_ids)
+    }
+    events = []
+    for movement in movements:
+        if movement.product_id in stocks:
+            movement.product = stocks[movement.product_id].product
+            events.append(movement_event(movement))
+    events.extend(stock_event(stock) for stock in stocks.values())
+    _publish_on_commit(events)
+
+
+async def sse_events(subscriber: Subscriber) -> AsyncIterator[str]:
+    """Eventos del suscriptor en formato text/event-stream, con heartbeats periódicos"""
+    try:
+        while True:
+            event = await subscriber.get(settings.REALTIME_HEARTBEAT_SECONDS)
+            if event["type"] == HEARTBEAT_EVENT:
+                # Comentario SSE: mantiene viva la conexión sin disparar eventos
+                yield ": heartbeat\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broker.unsubscribe(subscriber)
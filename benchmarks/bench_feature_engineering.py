@@ -0,0 +1,73 @@
+"""
+Benchmark de la preparación de features de AdvancedStockPredictor.
+
+Compara el cálculo anterior (una comprensión de lista por feature sobre objetos
+datetime) con build_features, vectorizado sobre un DatetimeIndex.
+
+Uso:
+    python benchmarks/bench_feature_engineering.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.predictor import build_features, _to_datetime_index
+
+
+def legacy_features(dates, base_date):
+    """Implementación previa: cuatro comprensiones de lista y np.column_stack"""
+    days_feature = np.array([(d - base_date).days for d in dates])
+    day_of_week = np.array([d.weekday() for d in dates])
+    day_of_month = np.array([d.day for d in dates])
+    month = np.array([d.month for d in dates])
+    return np.column_stack([days_feature, day_of_week, day_of_month, month])
+
+
+def features_from_list(dates):
+    """Camino por filas: convierte la lista una sola vez, como prepare_columns"""
+    index = _to_datetime_index(dates)
+    return build_features(index, index.min())
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    base = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    offsets = np.sort(rng.integers(0, 5 * 365 * 24 * 3600, args.rows))
+    dates = [base + timedelta(seconds=int(s)) for s in offsets]
+    dates64 = np.datetime64('2020-01-01T00:00:00') + offsets.astype('timedelta64[s]')
+
+    legacy_time, legacy = timed(legacy_features, dates, min(dates))
+    list_time, from_list = timed(features_from_list, dates)
+    array_time, from_array = timed(build_features, dates64, dates64.min())
+
+    assert np.array_equal(legacy, from_list)
+    assert np.array_equal(legacy, from_array)
+
+    print(f"Filas: {args.rows:,}")
+    print(f"Comprensiones de lista (datetime): {legacy_time:8.3f} s")
+    print(f"build_features (lista datetime):   {list_time:8.3f} s  ({legacy_time / list_time:5.1f}x)")
+    print(f"build_features (datetime64):       {array_time:8.3f} s  ({legacy_time / array_time:5.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmark del stock a una fecha con puntos de control (StockSnapshot).
+
+Compara sumar todos los movimientos hasta la fecha (el cálculo sin puntos de
+control) con stock_as_of y stocks_as_of, que parten del último punto de
+control y sólo suman los movimientos posteriores a su marca.
+
+Por defecto genera los datos en una base SQLite temporal. Con --settings-db se
+usa la base configurada en settings (la de docker-compose), con productos de
+prefijo BENCH- que se borran al terminar.
+
+Uso:
+    python benchmarks/bench_stock_as_of.py --movements 1000000
+    python benchmarks/bench_stock_as_of.py --movements 50000000 --products 10000 --settings-db
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
+
+import django
+from django.conf import settings
+
+PREFIX = 'BENCH-'
+INSERT_BATCH = 10000
+
+
+def configure(args):
+    if not args.settings_db:
+        path = args.sqlite or os.path.join(tempfile.mkdtemp(), 'bench_stock_as_of.sqlite3')
+        settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}}
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def generate(args):
+    """
+    Inserta los movimientos repartidos en --days días y un punto de control
+    por día para cada producto con movimientos ese día, como la reconciliación nocturna.
+    """
+    from django.db import connection, transaction
+    from inventory.models import Product, InventoryMovement, StockSnapshot
+
+    rng = random.Random(42)
+    product_ids = [f'{PREFIX}{i:06d}' for i in range(args.products)]
+    Product.objects.bulk_create(
+        [
+            Product(
+                product_id=product_id, product_name=product_id, sku=product_id,
+                unit_of_measure='UN', cost=1, sale_price=2, category='Bench', location='B1'
+            )
+            for product_id in product_ids
+        ],
+        batch_size=1000
+    )
+
+    movement_sql = (
+        f'INSERT INTO {InventoryMovement._meta.db_table} '
+        '(movement_id, date, product_id, movement_type, quantity, order_id) VALUES (%s, %s, %s, %s, %s, %s)'
+    )
+    base = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    per_day = max(1, args.movements // args.days)
+    step = timedelta(seconds=86400 / per_day)
+    balances = dict.fromkeys(product_ids, 0)
+    # El INSERT es SQL directo: las fechas se convierten como lo haría el ORM
+    adapt = connection.ops.adapt_datetimefield_value
+    number = 0
+
+    for day in range(args.days):
+        start = base + timedelta(days=day)
+        touched = set()
+        rows = []
+        count = per_day if day < args.days - 1 else args.movements - number
+        for i in range(count):
+            product_id = rng.choice(product_ids)
+            quantity = rng.randint(1, 20)
+            if balances[product_id] >= quantity and rng.random() < 0.5:
+                movement_type = 'OUTBOUND'
+                balances[product_id] -= quantity
+            else:
+                movement_type = 'INBOUND'
+                balances[product_id] += quantity
+            movement_id = f'B{number:09d}'
+            rows.append((movement_id, adapt(start + step * i), product_id, movement_type, quantity, movement_id))
+            touched.add(product_id)
+            number += 1
+            if len(rows) >= INSERT_BATCH:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(movement_sql, rows)
+                rows = []
+        if rows:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(movement_sql, rows)
+
+        # Marca del día: el último movimiento insertado
+        mark_date, mark_id = start + step * (count - 1), f'B{number - 1:09d}'
+        StockSnapshot.objects.bulk_create(
+            [
+                StockSnapshot(product_id=product_id, quantity=balances[product_id],
+                              as_of_date=mark_date, as_of_movement_id=mark_id)
+                for product_id in touched
+            ],
+            batch_size=1000
+        )
+    return product_ids, base, base + timedelta(days=args.days)
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--movements', type=int, default=1_000_000)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--queries', type=int, default=20, help='Consultas por producto a fechas aleatorias')
+    parser.add_argument('--sqlite', help='Archivo SQLite a usar en lugar de uno temporal')
+    parser.add_argument('--settings-db', action='store_true', help='Usar la base configurada en settings')
+    args = parser.parse_args()
+
+    configure(args)
+    from inventory.models import Product, InventoryMovement
+    from inventory.services import net_quantities
+    from inventory.snapshots import stock_as_of, stocks_as_of
+
+    start = time.perf_counter()
+    product_ids, first, last = generate(args)
+    print(f"Movimientos: {args.movements:,}  Productos: {args.products:,}  Días: {args.days}")
+    print(f"Carga de datos: {time.perf_counter() - start:8.1f} s")
+
+    try:
+        rng = random.Random(7)
+        span = (last - first).total_seconds()
+        queries = [
+            (rng.choice(product_ids), first + timedelta(seconds=rng.uniform(0, span)))
+            for _ in range(args.queries)
+        ]
+
+        def full_scan_one():
+            return [
+                net_quantities(InventoryMovement.objects.filter(product_id=product_id, date__lte=when)).get(product_id, 0)
+                for product_id, when in queries
+            ]
+
+        def snapshot_one():
+            return [stock_as_of(product_id, when)[0] for product_id, when in queries]
+
+        when = first + timedelta(seconds=span * 0.75)
+
+        def full_scan_all():
+            return net_quantities(InventoryMovement.objects.filter(product__product_id__startswith=PREFIX, date__lte=when))
+
+        def snapshot_all():
+            return stocks_as_of(when, product_ids)[0]
+
+        scan_one_time, expected_one = timed(full_scan_one)
+        snapshot_one_time, result_one = timed(snapshot_one)
+        scan_all_time, expected_all = timed(full_scan_all)
+        snapshot_all_time, result_all = timed(snapshot_all)
+
+        assert expected_one == result_one
+        assert {product_id: expected_all.get(product_id, 0) for product_id in product_ids} == result_all
+
+        print(f"Un producto, {args.queries} fechas (suma completa):  {scan_one_time:8.3f} s")
+        print(f"Un producto, {args.queries} fechas (stock_as_of):    {snapshot_one_time:8.3f} s  "
+              f"({scan_one_time / snapshot_one_time:5.1f}x)")
+        print(f"Todos los productos (suma completa):      {scan_all_time:8.3f} s")
+        print(f"Todos los productos (stocks_as_of):       {snapshot_all_time:8.3f} s  "
+              f"({scan_all_time / snapshot_all_time:5.1f}x)")
+    finally:
+        if args.settings_db:
+            Product.objects.filter(product_id__startswith=PREFIX).delete()
+
+
+if __name__ == '__main__':
+    main()
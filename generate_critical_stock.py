@@ -9,6 +9,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
 django.setup()
 
 from inventory.models import Product, InventoryMovement, CurrentStock
+from inventory.services import apply_movement
 
 def generate_critical_movements():
     # Seleccionar algunos productos para ponerlos en estado crítico
@@ -40,12 +41,12 @@ def generate_critical_movements():
                     movement_id = f"MC{i+1:03d}{product.product_id[-4:]}"
                     
                     try:
-                        InventoryMovement.objects.create(
+                        apply_movement(
+                            product,
+                            'OUTBOUND',
+                            quantity,
                             movement_id=movement_id,
                             date=timezone.now() - timedelta(hours=random.randint(1, 4)),
-                            product=product,
-                            movement_type='OUTBOUND',
-                            quantity=quantity,
                             order_id=f"CRIT{random.randint(1000, 9999)}",
                             notes=f"Movimiento para generar stock crítico"
                         )
@@ -9,6 +9,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
 django.setup()
 
 from inventory.models import Product, InventoryMovement, CurrentStock
+from inventory.services import InsufficientStock, apply_movement
 
 def generate_movement_data(product, num_days=30):
     # Generar movimientos para los últimos num_days días
@@ -30,6 +31,10 @@ def generate_movement_data(product, num_days=30):
         inbound_min, inbound_max = 5, 10
         outbound_min, outbound_max = 2, 5
     
+    # Se arman todos los movimientos y se aplican en orden cronológico, para
+    # que apply_movement actualice CurrentStock como lo haría la API
+    movements = []
+
     # Generar al menos algunos movimientos para hoy
     today = timezone.now()
     for _ in range(3):  # 3 movimientos garantizados para hoy
@@ -39,19 +44,8 @@ def generate_movement_data(product, num_days=30):
             quantity = random.randint(inbound_min, inbound_max)
         else:
             quantity = random.randint(outbound_min, outbound_max)
-        
-        movement_id = f"M{movement_counter:04d}{product.product_id[-4:]}"
-        movement_counter += 1
-        
-        InventoryMovement.objects.create(
-            movement_id=movement_id,
-            date=today - timedelta(hours=random.randint(0, 8)),  # Distribuir en las últimas 8 horas
-            product=product,
-            movement_type=movement_type,
-            quantity=quantity,
-            order_id=f"ORD{random.randint(10000, 99999)}",
-            notes=f"Movimiento de prueba {movement_type} para {product.product_name}"
-        )
+        # Distribuir en las últimas 8 horas
+        movements.append((today - timedelta(hours=random.randint(0, 8)), movement_type, quantity))
     
     # Generar movimientos históricos
     for day in range(num_days):
@@ -73,22 +67,27 @@ def generate_movement_data(product, num_days=30):
                 if random.random() < 0.05:  # 5% de probabilidad
                     quantity *= random.randint(2, 3)
             
-            movement_id = f"M{movement_counter:04d}{product.product_id[-4:]}"
-            movement_counter += 1
-            
-            try:
-                InventoryMovement.objects.create(
-                    movement_id=movement_id,
-                    date=current_date + timedelta(hours=random.randint(9, 18)),  # Durante horas laborales
-                    product=product,
-                    movement_type=movement_type,
-                    quantity=quantity,
-                    order_id=f"ORD{random.randint(10000, 99999)}",
-                    notes=f"Movimiento de prueba {movement_type} para {product.product_name}"
-                )
-            except Exception as e:
-                print(f"Error al crear movimiento {movement_id}: {str(e)}")
-                continue
+            # Durante horas laborales
+            movements.append((current_date + timedelta(hours=random.randint(9, 18)), movement_type, quantity))
+
+    for date, movement_type, quantity in sorted(movements):
+        movement_id = f"M{movement_counter:04d}{product.product_id[-4:]}"
+        movement_counter += 1
+        try:
+            apply_movement(
+                product,
+                movement_type,
+                quantity,
+                movement_id=movement_id,
+                order_id=f"ORD{random.randint(10000, 99999)}",
+                notes=f"Movimiento de prueba {movement_type} para {product.product_name}",
+                date=date
+            )
+        except InsufficientStock:
+            # Una salida mayor al stock acumulado no se registra, igual que en la API
+            print(f"Salida {movement_id} omitida: no hay stock suficiente")
+        except Exception as e:
+            print(f"Error al crear movimiento {movement_id}: {str(e)}")
 
 def generate_data_for_all_products():
     # Obtener todos los productos
@@ -102,8 +101,10 @@ def generate_data_for_all_products():
 if __name__ == "__main__":
     print("Iniciando generación de datos de prueba...")
     # Eliminar movimientos existentes para evitar duplicados
+    # El stock se vuelve a calcular desde cero con los movimientos nuevos
     InventoryMovement.objects.all().delete()
-    print("Movimientos anteriores eliminados.")
+    CurrentStock.objects.all().delete()
+    print("Movimientos y stock anteriores eliminados.")
     
     generate_data_for_all_products()
     print("\nGeneración de datos completada.")
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User, Group
 from django.forms import ModelForm, Select, ModelChoiceField
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
 from django.contrib.auth.hashers import make_password
-from .models import Product, InventoryMovement, CurrentStock, PredictorStock
+from .models import Product, InventoryMovement, CurrentStock, PredictorStock, StockForecast, StockSnapshot
 
 # Roles disponibles
 AVAILABLE_ROLES = ['Administrador', 'Lectura']
@@ -144,6 +144,17 @@ class PredictorStockAdmin(admin.ModelAdmin):
     list_filter = ('date', 'promotion_active')
     search_fields = ('product__product_name', 'special_event')
 
+@admin.register(StockForecast)
+class StockForecastAdmin(admin.ModelAdmin):
+    list_display = ('product', 'horizon_days', 'model_used', 'confidence_score', 'trend', 'generated_at')
+    search_fields = ('product__product_name',)
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('product', 'quantity', 'as_of_date', 'as_of_movement_id', 'created_at')
+    list_filter = ('as_of_date',)
+    search_fields = ('product__product_name',)
+
 # Desregistrar y volver a registrar User con nuestro CustomUserAdmin
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
@@ -1,21 +1,41 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User, Group
-from django.db import transaction
-from typing import List
+from django.db import close_old_connections, transaction
+from typing import Callable, List
 from .schemas import (
     UserCreate, UserUpdate, UserResponse, ProductUpdate,
     StockMovement, StockUpdate, ProductMovementResponse
 )
 from ..models import Product, InventoryMovement, CurrentStock
-from datetime import datetime
+from ..services import InsufficientStock, apply_movement, refresh_stock_cost, set_stock_level
 import uuid
 
 router = APIRouter()
 
+def unit_of_work(func: Callable):
+    """
+    Convierte una función síncrona que usa el ORM en una corrutina que la
+    ejecuta completa (consultas y transacción) en un hilo del pool.
+
+    Se usa thread_sensitive=False para que las peticiones concurrentes corran
+    en hilos distintos en lugar de turnarse en el único hilo compartido; como
+    esos hilos no pasan por el ciclo de request de Django, cada unidad cierra
+    su conexión al terminar.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
 # Endpoints de Usuarios
-@router.get("/users/", response_model=List[UserResponse])
-async def get_users():
-    users = User.objects.all()
+@unit_of_work
+def _get_users():
+    users = User.objects.prefetch_related('groups')
     return [
         UserResponse(
             id=user.id,
@@ -28,8 +48,12 @@ async def get_users():
         ) for user in users
     ]
 
-@router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int):
+@router.get("/users/", response_model=List[UserResponse])
+async def get_users():
+    return await _get_users()
+
+@unit_of_work
+def _get_user(user_id: int):
     try:
         user = User.objects.get(id=user_id)
         return UserResponse(
@@ -47,8 +71,12 @@ async def get_user(user_id: int):
             detail="Usuario no encontrado"
         )
 
-@router.post("/users/", response_model=UserResponse)
-async def create_user(user_data: UserCreate):
+@router.get("/users/{user_id}", response_model=UserResponse)
+async def get_user(user_id: int):
+    return await _get_user(user_id)
+
+@unit_of_work
+def _create_user(user_data: UserCreate):
     try:
         with transaction.atomic():
             # Verificar si el grupo existe
@@ -90,8 +118,12 @@ async def create_user(user_data: UserCreate):
             detail=str(e)
         )
 
-@router.put("/users/{user_id}", response_model=UserResponse)
-async def update_user(user_id: int, user_data: UserUpdate):
+@router.post("/users/", response_model=UserResponse)
+async def create_user(user_data: UserCreate):
+    return await _create_user(user_data)
+
+@unit_of_work
+def _update_user(user_id: int, user_data: UserUpdate):
     try:
         with transaction.atomic():
             user = User.objects.get(id=user_id)
@@ -140,8 +172,12 @@ async def update_user(user_id: int, user_data: UserUpdate):
             detail=str(e)
         )
 
-@router.delete("/users/{user_id}")
-async def delete_user(user_id: int):
+@router.put("/users/{user_id}", response_model=UserResponse)
+async def update_user(user_id: int, user_data: UserUpdate):
+    return await _update_user(user_id, user_data)
+
+@unit_of_work
+def _delete_user(user_id: int):
     try:
         user = User.objects.get(id=user_id)
         user.delete()
@@ -152,9 +188,13 @@ async def delete_user(user_id: int):
             detail="Usuario no encontrado"
         )
 
+@router.delete("/users/{user_id}")
+async def delete_user(user_id: int):
+    return await _delete_user(user_id)
+
 # Endpoints de Productos
-@router.put("/products/{product_id}", response_model=dict)
-async def update_product(product_id: str, product_data: ProductUpdate):
+@unit_of_work
+def _update_product(product_id: str, product_data: ProductUpdate):
     try:
         product = Product.objects.get(product_id=product_id)
         
@@ -172,6 +212,8 @@ async def update_product(product_id: str, product_data: ProductUpdate):
             product.active = product_data.active
             
         product.save()
+        if product_data.cost is not None:
+            refresh_stock_cost(product)
         return {"message": "Producto actualizado correctamente"}
     except Product.DoesNotExist:
         raise HTTPException(
@@ -179,8 +221,12 @@ async def update_product(product_id: str, product_data: ProductUpdate):
             detail="Producto no encontrado"
         )
 
-@router.delete("/products/{product_id}")
-async def delete_product(product_id: str):
+@router.put("/products/{product_id}", response_model=dict)
+async def update_product(product_id: str, product_data: ProductUpdate):
+    return await _update_product(product_id, product_data)
+
+@unit_of_work
+def _delete_product(product_id: str):
     try:
         product = Product.objects.get(product_id=product_id)
         product.delete()
@@ -191,137 +237,102 @@ async def delete_product(product_id: str):
             detail="Producto no encontrado"
         )
 
+@router.delete("/products/{product_id}")
+async def delete_product(product_id: str):
+    return await _delete_product(product_id)
+
 # Endpoints de Movimientos de Stock
-@router.post("/products/{product_id}/sell", response_model=ProductMovementResponse)
-async def sell_product(product_id: str, movement: StockMovement):
+def _movement_response(inventory_movement: InventoryMovement, current_stock: CurrentStock) -> ProductMovementResponse:
+    return ProductMovementResponse(
+        movement_id=inventory_movement.movement_id,
+        date=inventory_movement.date,
+        product_id=inventory_movement.product_id,
+        movement_type=inventory_movement.movement_type,
+        quantity=inventory_movement.quantity,
+        order_id=inventory_movement.order_id,
+        current_stock=current_stock.quantity
+    )
+
+@unit_of_work
+def _sell_product(product_id: str, movement: StockMovement):
     try:
-        with transaction.atomic():
-            product = Product.objects.get(product_id=product_id)
-            current_stock = CurrentStock.objects.get(product=product)
-            
-            if current_stock.quantity < movement.quantity:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Stock insuficiente"
-                )
-            
-            # Crear movimiento de salida
-            movement_id = f"OUT-{uuid.uuid4().hex[:8].upper()}"
-            inventory_movement = InventoryMovement.objects.create(
-                movement_id=movement_id,
-                date=datetime.now(),
-                product=product,
-                movement_type='OUTBOUND',
-                quantity=movement.quantity,
-                order_id=movement.order_id
-            )
-            
-            # Actualizar stock
-            current_stock.quantity -= movement.quantity
-            current_stock.save()
-            
-            return ProductMovementResponse(
-                movement_id=inventory_movement.movement_id,
-                date=inventory_movement.date,
-                product_id=product.product_id,
-                movement_type=inventory_movement.movement_type,
-                quantity=inventory_movement.quantity,
-                order_id=inventory_movement.order_id,
-                current_stock=current_stock.quantity
-            )
+        product = Product.objects.get(product_id=product_id)
+        # Crear movimiento de salida; apply_movement descuenta el stock sólo si alcanza
+        movement_id = f"OUT-{uuid.uuid4().hex[:6].upper()}"
+        inventory_movement, current_stock = apply_movement(
+            product, 'OUTBOUND', movement.quantity,
+            movement_id=movement_id,
+            order_id=movement.order_id,
+            notes=movement.notes
+        )
+        return _movement_response(inventory_movement, current_stock)
     except Product.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
-    except CurrentStock.DoesNotExist:
+    except InsufficientStock:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Stock no encontrado"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Stock insuficiente"
         )
 
-@router.post("/products/{product_id}/buy", response_model=ProductMovementResponse)
-async def buy_product(product_id: str, movement: StockMovement):
+@router.post("/products/{product_id}/sell", response_model=ProductMovementResponse)
+async def sell_product(product_id: str, movement: StockMovement):
+    return await _sell_product(product_id, movement)
+
+@unit_of_work
+def _buy_product(product_id: str, movement: StockMovement):
     try:
-        with transaction.atomic():
-            product = Product.objects.get(product_id=product_id)
-            current_stock, created = CurrentStock.objects.get_or_create(
-                product=product,
-                defaults={'quantity': 0}
-            )
-            
-            # Crear movimiento de entrada
-            movement_id = f"IN-{uuid.uuid4().hex[:8].upper()}"
-            inventory_movement = InventoryMovement.objects.create(
-                movement_id=movement_id,
-                date=datetime.now(),
-                product=product,
-                movement_type='INBOUND',
-                quantity=movement.quantity,
-                order_id=movement.order_id
-            )
-            
-            # Actualizar stock
-            current_stock.quantity += movement.quantity
-            current_stock.save()
-            
-            return ProductMovementResponse(
-                movement_id=inventory_movement.movement_id,
-                date=inventory_movement.date,
-                product_id=product.product_id,
-                movement_type=inventory_movement.movement_type,
-                quantity=inventory_movement.quantity,
-                order_id=inventory_movement.order_id,
-                current_stock=current_stock.quantity
-            )
+        product = Product.objects.get(product_id=product_id)
+        # Crear movimiento de entrada
+        movement_id = f"IN-{uuid.uuid4().hex[:7].upper()}"
+        inventory_movement, current_stock = apply_movement(
+            product, 'INBOUND', movement.quantity,
+            movement_id=movement_id,
+            order_id=movement.order_id,
+            notes=movement.notes
+        )
+        return _movement_response(inventory_movement, current_stock)
     except Product.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
 
-@router.put("/products/{product_id}/stock", response_model=dict)
-async def update_stock(product_id: str, stock_data: StockUpdate):
+@router.post("/products/{product_id}/buy", response_model=ProductMovementResponse)
+async def buy_product(product_id: str, movement: StockMovement):
+    return await _buy_product(product_id, movement)
+
+@unit_of_work
+def _update_stock(product_id: str, stock_data: StockUpdate):
     try:
-        with transaction.atomic():
-            product = Product.objects.get(product_id=product_id)
-            current_stock, created = CurrentStock.objects.get_or_create(
-                product=product,
-                defaults={'quantity': 0}
-            )
-            
-            # Calcular la diferencia para crear el movimiento
-            difference = stock_data.quantity - current_stock.quantity
-            
-            if difference < 0:
-                # Crear movimiento de ajuste de salida
-                movement_id = f"ADJ-{uuid.uuid4().hex[:8].upper()}"
-                InventoryMovement.objects.create(
-                    movement_id=movement_id,
-                    date=datetime.now(),
-                    product=product,
-                    movement_type='ADJUSTMENT_OUT',
-                    quantity=abs(difference),
-                    order_id=f"ADJ-{movement_id}"
-                )
-            
-            # Actualizar stock
-            current_stock.quantity = stock_data.quantity
-            current_stock.save()
-            
-            return {
-                "message": "Stock actualizado correctamente",
-                "current_stock": current_stock.quantity
-            }
+        product = Product.objects.get(product_id=product_id)
+        # Si el stock baja se registra un movimiento de ajuste de salida
+        movement_id = f"ADJ-{uuid.uuid4().hex[:6].upper()}"
+        current_stock = set_stock_level(product, stock_data.quantity, movement_id)
+        return {
+            "message": "Stock actualizado correctamente",
+            "current_stock": current_stock.quantity
+        }
     except Product.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
+    except InsufficientStock:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El stock no puede ser negativo"
+        )
+
+@router.put("/products/{product_id}/stock", response_model=dict)
+async def update_stock(product_id: str, stock_data: StockUpdate):
+    return await _update_stock(product_id, stock_data)
 
 # Endpoint para listar movimientos de inventario
-@router.get("/inventory/movements/")
-async def get_movements(product_id: str = None, movement_type: str = None):
+@unit_of_work
+def _get_movements(product_id: str = None, movement_type: str = None):
     try:
         # Construir el query base
         query = InventoryMovement.objects.all()
@@ -341,12 +352,16 @@ async def get_movements(product_id: str = None, movement_type: str = None):
                 query = query.filter(movement_type=model_movement_type)
             
         # Obtener los movimientos
-        movements = list(query.select_related('product'))
+        # El stock actual se trae en el mismo JOIN para no consultar por cada fila
+        movements = list(query.select_related('product', 'product__currentstock'))
         
         # Convertir a formato de respuesta manualmente
         response_data = []
         for mov in movements:
-            current_stock = CurrentStock.objects.get(product=mov.product).quantity
+            try:
+                current_stock = mov.product.currentstock.quantity
+            except CurrentStock.DoesNotExist:
+                current_stock = 0
             movement_data = {
                 "movement_id": str(mov.movement_id),
                 "date": mov.date.isoformat(),
@@ -363,4 +378,8 @@ async def get_movements(product_id: str = None, movement_type: str = None):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/inventory/movements/")
+async def get_movements(product_id: str = None, movement_type: str = None):
+    return await _get_movements(product_id, movement_type)
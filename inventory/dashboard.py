@@ -0,0 +1,39 @@
+"""
+Caché de los bloques del dashboard.
+
+Cada bloque de la vista ``home`` (totales, stock crítico, actividad y
+pronósticos) se guarda en la caché de Django con su propio tiempo de vida
+(DASHBOARD_CACHE_TIMEOUTS) y se invalida cuando cambian los datos de los que
+depende: las señales de inventory/signals.py cubren los save()/delete() y las
+escrituras masivas llaman a ``invalidate_dashboard``. Así muchas visitas
+seguidas al dashboard cuestan un solo cálculo por bloque.
+"""
+from typing import Any, Callable, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+
+DASHBOARD_BLOCKS = ('totals', 'critical_stock', 'activity', 'predictions')
+
+
+def _key(block: str) -> str:
+    return f"dashboard:{block}"
+
+
+def get_block(block: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """Devuelve el bloque desde la caché o lo calcula y lo guarda"""
+    value = cache.get(_key(block))
+    if value is None:
+        value = compute()
+        cache.set(_key(block), value, settings.DASHBOARD_CACHE_TIMEOUTS[block])
+    return value
+
+
+def invalidate_blocks(*blocks: str) -> None:
+    """Descarta los bloques indicados para que la próxima visita los recalcule"""
+    cache.delete_many([_key(block) for block in blocks])
+
+
+def invalidate_dashboard() -> None:
+    """Descarta todos los bloques (escrituras masivas que no emiten señales)"""
+    invalidate_blocks(*DASHBOARD_BLOCKS)
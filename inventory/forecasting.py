@@ -0,0 +1,190 @@
+"""
+Pronósticos de stock precalculados.
+
+Los pronósticos se guardan en ``StockForecast`` y los refresca el comando
+``manage.py refresh_forecasts`` (una pasada o como worker con ``--loop``), de
+modo que el dashboard y la API leen filas ya calculadas en lugar de entrenar
+modelos dentro de la petición.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+import logging
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from api.predictor import forecast_stock, predict_many
+from .models import Product, InventoryMovement, StockForecast
+
+logger = logging.getLogger(__name__)
+
+
+def get_forecast_history(product_id: str, history_days: Optional[int] = None) -> List[Dict]:
+    """
+    Obtiene el historial de movimientos usado para pronosticar un producto.
+
+    Args:
+        product_id: Producto a consultar
+        history_days: Ventana de días hacia atrás; por defecto FORECAST_HISTORY_DAYS
+
+    Returns:
+        Lista de diccionarios {'movement_id', 'date', 'quantity'} ordenada por fecha
+    """
+    if history_days is None:
+        history_days = settings.FORECAST_HISTORY_DAYS
+
+    movements = InventoryMovement.objects.filter(product_id=product_id)
+    if history_days:
+        movements = movements.filter(date__gte=timezone.now() - timedelta(days=history_days))
+
+    return list(
+        movements.order_by('date', 'movement_id').values('movement_id', 'date', 'quantity')
+    )
+
+
+def get_forecast_histories(product_ids: Iterable[str], history_days: Optional[int] = None) -> Dict[str, List[Dict]]:
+    """
+    Igual que get_forecast_history pero para varios productos en una sola consulta.
+
+    Returns:
+        Historial de cada producto indexado por product_id (sólo productos con movimientos)
+    """
+    if history_days is None:
+        history_days = settings.FORECAST_HISTORY_DAYS
+
+    movements = InventoryMovement.objects.filter(product_id__in=list(product_ids))
+    if history_days:
+        movements = movements.filter(date__gte=timezone.now() - timedelta(days=history_days))
+
+    histories = defaultdict(list)
+    for movement in movements.order_by('date', 'movement_id').values('product_id', 'movement_id', 'date', 'quantity'):
+        histories[movement.pop('product_id')].append(movement)
+    return dict(histories)
+
+
+def _save_forecast(product_id: str, history: List[Dict], predictions: List[Dict], horizon: int) -> Optional[StockForecast]:
+    if len(history) < 2 or not predictions:
+        StockForecast.objects.filter(product_id=product_id).delete()
+        return None
+
+    forecast, _ = StockForecast.objects.update_or_create(
+        product_id=product_id,
+        defaults={
+            'horizon_days': horizon,
+            'predictions': predictions,
+            'confidence_score': predictions[0]['confidence_score'],
+            'model_used': predictions[0]['model_used'],
+            'trend': predictions[0]['trend'],
+            'last_movement_id': history[-1]['movement_id'],
+            'last_movement_date': history[-1]['date'],
+        }
+    )
+    return forecast
+
+
+def refresh_forecast(product: Product) -> Optional[StockForecast]:
+    """
+    Recalcula y guarda el pronóstico de un producto.
+
+    Si no hay suficientes datos históricos se elimina el pronóstico anterior y
+    se devuelve None.
+    """
+    history = get_forecast_history(product.product_id)
+    horizon = settings.FORECAST_HORIZON_DAYS
+    predictions = []
+    if len(history) >= 2:
+        predictions = forecast_stock(history, horizon, product_id=product.product_id)
+    return _save_forecast(product.product_id, history, predictions, horizon)
+
+
+def stale_products(force: bool = False):
+    """
+    Productos activos cuyo pronóstico falta, quedó viejo o no incluye el último
+    movimiento registrado.
+    """
+    products = Product.objects.filter(active=True)
+    if force:
+        return products
+
+    latest_movement = InventoryMovement.objects.filter(
+        product=OuterRef('pk')
+    ).order_by('-date', '-movement_id')
+    max_age = timezone.now() - timedelta(seconds=settings.FORECAST_MAX_AGE_SECONDS)
+
+    return products.annotate(
+        latest_movement_id=Subquery(latest_movement.values('movement_id')[:1])
+    ).filter(
+        Q(stockforecast__isnull=True, latest_movement_id__isnull=False)
+        | Q(stockforecast__generated_at__lt=max_age)
+        | (Q(stockforecast__isnull=False) & ~Q(stockforecast__last_movement_id=F('latest_movement_id')))
+    )
+
+
+def refresh_forecasts(force: bool = False) -> int:
+    """
+    Recalcula los pronósticos desactualizados, entrenando en paralelo bloques de
+    FORECAST_BATCH_SIZE productos con api.predictor.predict_many.
+
+    Returns:
+        Cantidad de productos procesados
+    """
+    horizon = settings.FORECAST_HORIZON_DAYS
+    # La lista se lee completa antes de escribir: la consulta depende de
+    # StockForecast y un cursor abierto mientras se guardan filas puede
+    # saltear o repetir productos (SQLite no aísla la lectura de la escritura)
+    product_ids = list(stale_products(force=force).values_list('product_id', flat=True))
+    refreshed = 0
+
+    for start in range(0, len(product_ids), settings.FORECAST_BATCH_SIZE):
+        refreshed += _refresh_batch(product_ids[start:start + settings.FORECAST_BATCH_SIZE], horizon)
+    return refreshed
+
+
+def _refresh_batch(product_ids: List[str], horizon: int) -> int:
+    histories = get_forecast_histories(product_ids)
+    trainable = {pid: history for pid, history in histories.items() if len(history) >= 2}
+    predictions = predict_many(
+        trainable,
+        horizon,
+        max_workers=settings.FORECAST_MAX_WORKERS,
+        chunk_size=settings.FORECAST_CHUNK_SIZE
+    )
+
+    refreshed = 0
+    for product_id in product_ids:
+        try:
+            _save_forecast(product_id, histories.get(product_id, []), predictions.get(product_id, []), horizon)
+            refreshed += 1
+        except Exception as e:
+            logger.error(f"Error al guardar el pronóstico de {product_id}: {str(e)}")
+    return refreshed
+
+
+def forecast_many(product_ids: List[str], days: Optional[int] = None) -> Dict[str, List[Dict]]:
+    """
+    Pronósticos para varios productos: usa las filas precalculadas que cubren
+    los días pedidos y entrena en paralelo sólo los productos restantes.
+
+    Returns:
+        Predicciones por product_id; los productos sin datos suficientes no aparecen
+    """
+    days = days or settings.FORECAST_HORIZON_DAYS
+    results = {
+        forecast.product_id: forecast.predictions[:days]
+        for forecast in StockForecast.objects.filter(product_id__in=product_ids, horizon_days__gte=days)
+    }
+
+    missing = [product_id for product_id in product_ids if product_id not in results]
+    if missing:
+        histories = get_forecast_histories(missing)
+        trainable = {pid: history for pid, history in histories.items() if len(history) >= 2}
+        predictions = predict_many(
+            trainable,
+            days,
+            max_workers=settings.FORECAST_MAX_WORKERS,
+            chunk_size=settings.FORECAST_CHUNK_SIZE
+        )
+        results.update({pid: preds for pid, preds in predictions.items() if preds})
+    return results
@@ -0,0 +1,184 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from inventory.models import Product, InventoryMovement
+from inventory.dashboard import invalidate_dashboard
+from inventory.search import invalidate_search_index
+from inventory.services import invalidate_snapshots_before, rebuild_current_stock
+from datetime import datetime, time
+from decimal import Decimal
+import csv
+import gzip
+import json
+
+# Columnas con las que se crea o actualiza el producto si vienen todas en la fila
+PRODUCT_FIELDS = ['product_name', 'sku', 'unit_of_measure', 'cost', 'sale_price', 'category', 'location']
+
+MOVEMENT_TYPES = {
+    'INBOUND': 'INBOUND',
+    'OUTBOUND': 'OUTBOUND',
+    'ADJUSTMENT_OUT': 'ADJUSTMENT_OUT',
+    'ENTRADA': 'INBOUND',
+    'SALIDA': 'OUTBOUND',
+}
+
+class Command(BaseCommand):
+    help = (
+        'Importa movimientos históricos desde un archivo CSV o NDJSON (opcionalmente .gz), '
+        'leyéndolo en streaming e insertando por lotes, y al final reconstruye el stock actual'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Archivo a importar (.csv, .ndjson, .jsonl; admite .gz)')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson'],
+            help='Formato del archivo; por defecto se deduce de la extensión'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Filas por lote de inserción'
+        )
+        parser.add_argument(
+            '--no-rebuild',
+            action='store_true',
+            help='No reconstruir CurrentStock al terminar'
+        )
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = options['format'] or self.detect_format(path)
+        batch_size = options['batch_size']
+
+        # Ids de productos que ya se sabe que existen, para no consultarlos en cada lote
+        self.known_products = set()
+        imported = skipped = 0
+
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8', newline='') as f:
+                rows = csv.DictReader(f) if file_format == 'csv' else self.read_ndjson(f)
+                batch = []
+                for line_number, row in enumerate(rows, start=2 if file_format == 'csv' else 1):
+                    try:
+                        batch.append(self.parse_row(row))
+                    except (KeyError, TypeError, ValueError) as e:
+                        skipped += 1
+                        self.stderr.write(f'Línea {line_number} ignorada: {e}')
+                        continue
+
+                    if len(batch) >= batch_size:
+                        inserted, missing = self.import_batch(batch)
+                        imported, skipped = imported + inserted, skipped + missing
+                        batch = []
+                if batch:
+                    inserted, missing = self.import_batch(batch)
+                    imported, skipped = imported + inserted, skipped + missing
+        except OSError as e:
+            raise CommandError(f'No se pudo leer {path}: {e}')
+
+        self.stdout.write(f'Movimientos importados: {imported}')
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Filas ignoradas: {skipped}'))
+
+        if not options['no_rebuild']:
+            corrected = rebuild_current_stock()
+            self.stdout.write(f'Stock actual reconstruido: {corrected} productos corregidos')
+
+        self.stdout.write(self.style.SUCCESS('Importación completada'))
+
+    def detect_format(self, path):
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        raise CommandError('No se pudo deducir el formato del archivo; use --format')
+
+    def read_ndjson(self, f):
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    def parse_date(self, value):
+        date = parse_datetime(value)
+        if date is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f'fecha inválida: {value}')
+            date = datetime.combine(day, time.min)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        return date
+
+    def parse_row(self, row):
+        movement_type = MOVEMENT_TYPES.get(str(row['movement_type']).upper())
+        if movement_type is None:
+            raise ValueError(f"tipo de movimiento inválido: {row['movement_type']}")
+        quantity = int(row['quantity'])
+        if quantity <= 0:
+            raise ValueError('la cantidad debe ser mayor que cero')
+
+        movement_id = str(row['movement_id'])
+        parsed = {
+            'movement': InventoryMovement(
+                movement_id=movement_id,
+                date=self.parse_date(str(row['date'])),
+                product_id=str(row['product_id']),
+                movement_type=movement_type,
+                quantity=quantity,
+                order_id=row.get('order_id') or movement_id,
+                notes=row.get('notes') or None
+            ),
+            'product': None,
+        }
+        if all(row.get(field) not in (None, '') for field in PRODUCT_FIELDS):
+            parsed['product'] = Product(
+                product_id=str(row['product_id']),
+                product_name=row['product_name'],
+                sku=row['sku'],
+                unit_of_measure=row['unit_of_measure'],
+                cost=Decimal(str(row['cost'])),
+                sale_price=Decimal(str(row['sale_price'])),
+                category=row['category'],
+                location=row['location'],
+            )
+        return parsed
+
+    def import_batch(self, batch):
+        """Inserta un lote en una transacción. Devuelve (importados, ignorados)."""
+        with transaction.atomic():
+            # Upsert de los productos que vienen completos en el archivo
+            products = {row['product'].product_id: row['product'] for row in batch if row['product']}
+            if products:
+                Product.objects.bulk_create(
+                    products.values(),
+                    update_conflicts=True,
+                    unique_fields=['product_id'],
+                    update_fields=PRODUCT_FIELDS + ['updated_at']
+                )
+                self.known_products.update(products)
+                transaction.on_commit(invalidate_search_index)
+
+            unknown = {row['movement'].product_id for row in batch} - self.known_products
+            if unknown:
+                self.known_products.update(
+                    Product.objects.filter(product_id__in=unknown).values_list('product_id', flat=True)
+                )
+
+            movements = [row['movement'] for row in batch if row['movement'].product_id in self.known_products]
+            # Los movement_id ya importados se ignoran, así el archivo se puede reprocesar
+            InventoryMovement.objects.bulk_create(movements, batch_size=1000, ignore_conflicts=True)
+            # bulk_create no emite señales: el historial suele quedar antes de
+            # la última marca de los puntos de control
+            invalidate_snapshots_before(movement.date for movement in movements)
+            transaction.on_commit(invalidate_dashboard)
+
+        missing = len(batch) - len(movements)
+        if missing:
+            self.stderr.write(f'{missing} movimientos ignorados por producto inexistente')
+        return len(movements), missing
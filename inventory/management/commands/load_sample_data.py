@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from inventory.models import Product, InventoryMovement, CurrentStock, PredictorStock
+from inventory.services import apply_movement
 from django.utils import timezone
 import random
 from datetime import timedelta
@@ -127,25 +128,17 @@ class Command(BaseCommand):
                             used_movement_ids.add(movement_id)
                             break
                     
-                    InventoryMovement.objects.create(
+                    # Registrar el movimiento y actualizar el stock actual
+                    apply_movement(
+                        product,
+                        movement_type,
+                        quantity,
                         movement_id=movement_id,
-                        product=product,
-                        quantity=quantity,
-                        movement_type=movement_type,
                         date=date,
                         order_id=f"ORD-{date.strftime('%Y%m%d')}-{random.randint(1,999):03d}",
                         notes=f'{movement_type} de inventario'
                     )
                     
-                    # Actualizar el stock actual
-                    current_stock = CurrentStock.objects.get(product=product)
-                    if movement_type == 'INBOUND':
-                        current_stock.quantity += quantity
-                    else:
-                        current_stock.quantity -= quantity
-                    current_stock.total_inventory_cost = current_stock.quantity * product.cost
-                    current_stock.save()
-                    
                     self.stdout.write(f'Movimiento creado para {product.product_name}: {movement_type} de {quantity} unidades')
 
         # Crear datos de predicción
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from inventory.snapshots import reconcile_stock
+
+class Command(BaseCommand):
+    help = (
+        'Reconcilia CurrentStock con los movimientos usando puntos de control (StockSnapshot): '
+        'sólo se suman los movimientos posteriores a la última marca, y se recalculan los puntos de control '
+        'posteriores a un movimiento cargado con fecha pasada'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recalcular los puntos de control desde todo el historial'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Sólo mostrar las diferencias, sin guardar cambios'
+        )
+
+    def handle(self, *args, **options):
+        differences = reconcile_stock(full=options['full'], dry_run=options['dry_run'])
+
+        for product_id, recorded, expected in differences:
+            recorded = 'sin registro' if recorded is None else recorded
+            self.stdout.write(f'- {product_id}: {recorded} -> {expected}')
+        self.stdout.write(f'Productos con diferencias: {len(differences)}')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Modo --dry-run: no se guardaron cambios'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Reconciliación completada'))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from inventory.forecasting import refresh_forecasts
+import time
+
+class Command(BaseCommand):
+    help = 'Recalcula los pronósticos de stock precalculados (StockForecast)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Ejecutar como worker, repitiendo la actualización periódicamente'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=settings.FORECAST_REFRESH_INTERVAL_SECONDS,
+            help='Segundos entre pasadas cuando se usa --loop'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recalcular todos los productos activos aunque no haya movimientos nuevos'
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        while True:
+            # Antes de cada pasada se descartan las conexiones caídas o vencidas
+            close_old_connections()
+            refreshed = refresh_forecasts(force=force)
+            self.stdout.write(f'Pronósticos actualizados: {refreshed}')
+
+            if not options['loop']:
+                break
+            # Sólo la primera pasada fuerza el recálculo completo; luego se
+            # procesan únicamente los productos con movimientos nuevos
+            force = False
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Actualización de pronósticos completada'))
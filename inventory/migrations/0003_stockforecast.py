@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_currentstock_stock_status_currentstock_threshold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockForecast',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='inventory.product')),
+                ('horizon_days', models.IntegerField(default=7)),
+                ('predictions', models.JSONField(default=list)),
+                ('confidence_score', models.FloatField(default=0)),
+                ('model_used', models.CharField(blank=True, max_length=50)),
+                ('trend', models.CharField(blank=True, max_length=100)),
+                ('last_movement_id', models.CharField(blank=True, max_length=10, null=True)),
+                ('last_movement_date', models.DateTimeField(blank=True, null=True)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stockforecast'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='currentstock',
+            index=models.Index(condition=models.Q(('stock_status__in', ['CRITICAL', 'OUT_OF_STOCK'])), fields=['stock_status'], name='curstock_critical_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['product', 'date', 'movement_id'], name='inv_mov_product_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['date', 'movement_id'], name='inv_mov_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['movement_type', 'date'], name='inv_mov_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['product', 'movement_type', 'quantity'], name='inv_mov_product_type_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:00
+
+from django.db import migrations
+from django.db.models import Case, F, Value, When
+
+
+def refresh_stock_status(apps, schema_editor):
+    # El dashboard ya no recalcula el estado en cada visita: se corrige una vez
+    # con los valores que hubiera dejado desactualizados
+    CurrentStock = apps.get_model('inventory', 'CurrentStock')
+    CurrentStock.objects.update(
+        stock_status=Case(
+            When(quantity__lte=0, then=Value('OUT_OF_STOCK')),
+            When(quantity__lte=F('threshold'), then=Value('CRITICAL')),
+            default=Value('OK')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(refresh_stock_status, migrations.RunPython.noop),
+    ]
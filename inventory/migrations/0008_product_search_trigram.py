@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:00
+
+from django.db import migrations
+
+# Índices sobre UPPER(columna) porque así compara el ORM los icontains en PostgreSQL
+TRIGRAM_INDEXES = {
+    'product_id_trgm_idx': 'product_id',
+    'product_sku_trgm_idx': 'sku',
+    'product_name_trgm_idx': 'product_name',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm sólo existe en PostgreSQL; en SQLite la búsqueda usa el trie de inventory/search.py
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('inventory', 'Product')._meta.db_table
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
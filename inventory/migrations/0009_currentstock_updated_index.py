@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_product_search_trigram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='currentstock',
+            index=models.Index(fields=['last_updated', 'product'], name='curstock_updated_idx'),
+        ),
+    ]
@@ -12,6 +12,8 @@ class Product(models.Model):
     category = models.CharField(max_length=50)
     location = models.CharField(max_length=10)
     active = models.BooleanField(default=True)
+    # Última modificación; junto con la cantidad de filas forma el ETag del catálogo
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.product_name} ({self.product_id})"
@@ -31,6 +33,18 @@ class InventoryMovement(models.Model):
     order_id = models.CharField(max_length=20)
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Historial por producto (predicciones, dashboard) y listados filtrados por producto
+            models.Index(fields=['product', 'date', 'movement_id'], name='inv_mov_product_date_idx'),
+            # Movimientos del día, recientes y paginación por (date, movement_id)
+            models.Index(fields=['date', 'movement_id'], name='inv_mov_date_idx'),
+            # Filtros por tipo ordenados por fecha
+            models.Index(fields=['movement_type', 'date'], name='inv_mov_type_date_idx'),
+            # Totales por producto y tipo (update_stock.py) sin leer la tabla
+            models.Index(fields=['product', 'movement_type', 'quantity'], name='inv_mov_product_type_idx'),
+        ]
+
     def __str__(self):
         return f"{self.movement_id} - {self.product.product_name}"
 
@@ -48,10 +62,23 @@ class CurrentStock(models.Model):
     stock_status = models.CharField(max_length=20, choices=STOCK_STATUS_CHOICES, default='OK')
     threshold = models.IntegerField(default=5)
 
+    class Meta:
+        indexes = [
+            # Índice parcial: sólo los productos críticos o agotados (alertas del dashboard)
+            models.Index(
+                fields=['stock_status'],
+                condition=models.Q(stock_status__in=['CRITICAL', 'OUT_OF_STOCK']),
+                name='curstock_critical_idx'
+            ),
+            # Sincronización incremental: filas modificadas después de un cursor
+            models.Index(fields=['last_updated', 'product'], name='curstock_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.product.product_name} - Qty: {self.quantity}"
 
-    def save(self, *args, **kwargs):
+    def refresh_derived_fields(self):
+        """Recalcula estado y costo total a partir de la cantidad (para bulk_update)"""
         # Actualizar el estado del stock basado en la cantidad y el umbral
         if self.quantity <= 0:
             self.stock_status = 'OUT_OF_STOCK'
@@ -62,7 +89,9 @@ class CurrentStock(models.Model):
         
         # Calcular el costo total del inventario
         self.total_inventory_cost = self.quantity * self.product.cost
-        
+
+    def save(self, *args, **kwargs):
+        self.refresh_derived_fields()
         super().save(*args, **kwargs)
 
 class PredictorStock(models.Model):
@@ -78,3 +107,58 @@ class PredictorStock(models.Model):
 
     def __str__(self):
         return f"{self.product.product_name} - {self.date}"
+
+class StockForecast(models.Model):
+    """Pronóstico precalculado de stock por producto, refrescado por un proceso en segundo plano"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True)
+    horizon_days = models.IntegerField(default=7)
+    predictions = models.JSONField(default=list)
+    confidence_score = models.FloatField(default=0)
+    model_used = models.CharField(max_length=50, blank=True)
+    trend = models.CharField(max_length=100, blank=True)
+    last_movement_id = models.CharField(max_length=10, blank=True, null=True)
+    last_movement_date = models.DateTimeField(blank=True, null=True)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product.product_name} - {self.horizon_days} días ({self.generated_at})"
+
+class StockSnapshot(models.Model):
+    """
+    Cantidad neta de un producto según todos sus movimientos hasta la marca
+    (as_of_date, as_of_movement_id), inclusive. Cada reconciliación agrega una
+    fila por producto con movimientos nuevos, así que también sirven como
+    puntos de control para consultar el stock a una fecha.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    as_of_date = models.DateTimeField()
+    as_of_movement_id = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'as_of_date', 'as_of_movement_id'], name='stock_snapshot_product_mark_uniq'
+            ),
+        ]
+        indexes = [
+            # Última marca global, desde donde sigue la próxima reconciliación
+            models.Index(fields=['as_of_date', 'as_of_movement_id'], name='stock_snapshot_mark_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - Qty: {self.quantity} ({self.as_of_date})"
+
+class StockSnapshotInvalidation(models.Model):
+    """
+    Movimiento cargado con una fecha anterior a la ventana de confirmación
+    (STOCK_SNAPSHOT_LAG_SECONDS). Los puntos de control con as_of_date >= since
+    pueden no incluirlo: las lecturas los ignoran y la próxima reconciliación
+    los descarta y los vuelve a calcular.
+    """
+    since = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Puntos de control desde {self.since}"
@@ -0,0 +1,206 @@
+"""
+Búsqueda de productos por nombre, SKU o product_id.
+
+En PostgreSQL la búsqueda usa los índices trigram (pg_trgm) que crea la
+migración 0008 sobre UPPER(columna), de modo que los ``icontains`` del ORM (y
+los del buscador del admin) no recorren la tabla, y ordena por coincidencia
+exacta, prefijo y similitud. En otras bases (SQLite en los tests y en
+desarrollo) se usa un trie de prefijos en memoria con las palabras de cada
+producto. Las altas, ediciones y bajas de cada proceso actualizan su trie en
+el lugar (inventory.signals) e incrementan una versión del catálogo en la
+caché; los procesos que ven otra versión reconstruyen el suyo.
+"""
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest, Upper
+
+from .models import Product
+
+SEARCH_FIELDS = ('product_id', 'sku', 'product_name')
+DEFAULT_SEARCH_LIMIT = 20
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class PrefixTrie:
+    """
+    Trie de palabras en minúsculas. Cada nodo guarda los productos de todas
+    las palabras que pasan por él, así una búsqueda por prefijo recorre sólo
+    tantos nodos como letras tiene el prefijo. También recuerda las palabras
+    de cada producto para poder quitarlo al editarlo o borrarlo.
+    """
+
+    def __init__(self):
+        self.root: Dict = {}
+        self.words: Dict[str, Set[str]] = {}
+
+    def add(self, word: str, product_id: str) -> None:
+        self.words.setdefault(product_id, set()).add(word)
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+            node.setdefault('$ids', set()).add(product_id)
+
+    def add_product(self, product_id: str, values: Iterable[str]) -> None:
+        for value in values:
+            for word in _tokens(value):
+                self.add(word, product_id)
+
+    def remove_product(self, product_id: str) -> None:
+        for word in self.words.pop(product_id, ()):
+            parent, node = None, self.root
+            for char in word:
+                parent, node = node, node.get(char)
+                if node is None:
+                    break
+                node['$ids'].discard(product_id)
+                if not node['$ids']:
+                    # Los nodos de abajo sólo tienen productos de éste: se podan
+                    del parent[char]
+                    break
+
+    def search(self, prefix: str) -> Set[str]:
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return set()
+        return node.get('$ids', set())
+
+
+# Versión del catálogo en la caché compartida: cada alta, edición o baja la
+# incrementa, así los demás procesos saben que su trie quedó viejo sin
+# consultar la tabla en cada búsqueda
+CATALOG_VERSION_KEY = 'search:catalog-version'
+
+_trie: Optional[PrefixTrie] = None
+_trie_version = None
+_trie_lock = threading.Lock()
+
+
+def _catalog_version() -> int:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Valor inicial distinto cada vez: si la clave se pierde, ningún
+        # proceso confunde su trie con el de la versión nueva
+        cache.add(CATALOG_VERSION_KEY, time.time_ns())
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def _bump_catalog_version() -> int:
+    _catalog_version()
+    return cache.incr(CATALOG_VERSION_KEY)
+
+
+def _get_trie() -> PrefixTrie:
+    """Trie del catálogo; se reconstruye si otro proceso cambió productos"""
+    global _trie, _trie_version
+    with _trie_lock:
+        # La versión se lee antes que las filas: un cambio confirmado en el
+        # medio vuelve a incrementarla y fuerza otra reconstrucción
+        version = _catalog_version()
+        if _trie is None or _trie_version != version:
+            trie = PrefixTrie()
+            for row in Product.objects.values_list(*SEARCH_FIELDS).iterator():
+                trie.add_product(row[0], row)
+            _trie, _trie_version = trie, version
+        return _trie
+
+
+def _update_trie(product_id: str, values: Optional[Tuple[str, ...]]) -> None:
+    global _trie_version
+    with _trie_lock:
+        version = _bump_catalog_version()
+        if _trie is None or _trie_version != version - 1:
+            # Hubo cambios de otros procesos: se reconstruye en la próxima búsqueda
+            return
+        _trie.remove_product(product_id)
+        if values is not None:
+            _trie.add_product(product_id, values)
+        _trie_version = version
+
+
+def index_product(product: Product) -> None:
+    """Actualiza el trie con las palabras actuales de un producto guardado"""
+    _update_trie(product.product_id, tuple(getattr(product, field) for field in SEARCH_FIELDS))
+
+
+def unindex_product(product_id: str) -> None:
+    """Quita del trie un producto borrado"""
+    _update_trie(product_id, None)
+
+
+def invalidate_search_index() -> None:
+    """Fuerza la reconstrucción del trie (escrituras masivas que no emiten señales)"""
+    _bump_catalog_version()
+
+
+def _rank(query: str):
+    """Primero coincidencias exactas de id o SKU (lectores de códigos), luego prefijos"""
+    return Case(
+        When(Q(product_id__iexact=query) | Q(sku__iexact=query), then=Value(0)),
+        When(Q(product_id__istartswith=query) | Q(sku__istartswith=query) | Q(product_name__istartswith=query),
+             then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField()
+    )
+
+
+def _search_postgres(query: str, limit: int) -> List[Product]:
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    words = _tokens(query) or [query.lower()]
+    # Cada palabra debe aparecer en alguna columna; los icontains usan los índices trigram
+    condition = Q()
+    for word in words:
+        condition &= Q(product_id__icontains=word) | Q(sku__icontains=word) | Q(product_name__icontains=word)
+
+    upper = query.upper()
+    similarity = Greatest(*(TrigramSimilarity(Upper(field), upper) for field in SEARCH_FIELDS))
+    return list(
+        Product.objects.filter(condition)
+        .annotate(rank=_rank(query), similarity=similarity)
+        .order_by('rank', '-similarity', 'product_id')[:limit]
+    )
+
+
+def _search_trie(query: str, limit: int) -> List[Product]:
+    words = _tokens(query)
+    if not words:
+        return []
+    trie = _get_trie()
+    matches = None
+    for word in words:
+        ids = trie.search(word)
+        matches = ids if matches is None else matches & ids
+        if not matches:
+            return []
+    return list(
+        Product.objects.filter(product_id__in=matches)
+        .annotate(rank=_rank(query))
+        .order_by('rank', 'product_name', 'product_id')[:limit]
+    )
+
+
+def search_products(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Product]:
+    """
+    Productos cuyo nombre, SKU o product_id contienen todas las palabras de la
+    búsqueda (en SQLite, palabras que empiezan con ellas), ordenados por relevancia.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    if connection.vendor == 'postgresql':
+        return _search_postgres(query, limit)
+    return _search_trie(query, limit)
@@ -0,0 +1,320 @@
+"""
+Escritura de movimientos de inventario.
+
+Todo lo que registra un movimiento (API, router de inventory/api y scripts de
+carga y de datos de prueba) pasa por ``apply_movement`` (o ``apply_movements_bulk``
+para lotes), que guarda el movimiento y ajusta ``CurrentStock`` en la misma
+transacción. La única excepción es ``manage.py import_movements``: inserta el
+historial con bulk_create y al terminar reconstruye ``CurrentStock`` con
+``rebuild_current_stock``. Las salidas se descuentan con un
+UPDATE condicional (``quantity >= n``): la base bloquea la fila y reevalúa la
+condición, de modo que dos salidas concurrentes nunca dejan el stock negativo.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard
+from .models import Product, InventoryMovement, CurrentStock, StockSnapshotInvalidation
+
+INBOUND_TYPES = ('INBOUND',)
+OUTBOUND_TYPES = ('OUTBOUND', 'ADJUSTMENT_OUT')
+# Filas por sentencia en los INSERT/UPDATE masivos
+BULK_BATCH_SIZE = 1000
+
+
+class InsufficientStock(Exception):
+    """Se lanza cuando una salida supera el stock disponible."""
+
+    def __init__(self, product_id: str, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f"No hay suficiente stock disponible de {product_id} para retirar {requested} unidades")
+
+
+def invalidate_snapshots_before(dates: Iterable[datetime]) -> None:
+    """
+    Registra los movimientos cargados con fecha anterior a la ventana de
+    confirmación (cargas de historial, datos de ejemplo): los puntos de
+    control desde la fecha más antigua ya no los incluyen (ver inventory/snapshots.py).
+    Se llama dentro de la transacción que guarda los movimientos.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.STOCK_SNAPSHOT_LAG_SECONDS)
+    # Las fechas sin zona horaria se guardan en la zona actual (con un aviso de Django)
+    dates = [timezone.make_aware(date) if timezone.is_naive(date) else date for date in dates]
+    backdated = [date for date in dates if date <= cutoff]
+    if backdated:
+        StockSnapshotInvalidation.objects.create(since=min(backdated))
+
+
+def apply_movement(
+    product: Product,
+    movement_type: str,
+    quantity,
+    movement_id: str,
+    order_id: Optional[str] = None,
+    notes: Optional[str] = None,
+    date: Optional[datetime] = None,
+) -> Tuple[InventoryMovement, CurrentStock]:
+    """
+    Registra un movimiento y actualiza el stock actual de forma atómica.
+
+    Args:
+        product: Producto afectado
+        movement_type: 'INBOUND', 'OUTBOUND' o 'ADJUSTMENT_OUT'
+        quantity: Cantidad positiva del movimiento
+        movement_id: Id del movimiento
+        order_id: Orden asociada; por defecto el mismo movement_id
+        notes: Observaciones
+        date: Fecha del movimiento; por defecto ahora
+
+    Returns:
+        Tupla (movimiento creado, stock actualizado)
+
+    Raises:
+        InsufficientStock: si es una salida mayor al stock disponible
+        ValueError: si la cantidad no es positiva o el tipo no existe
+    """
+    if quantity <= 0:
+        raise ValueError("La cantidad del movimiento debe ser mayor que cero")
+    if movement_type not in INBOUND_TYPES + OUTBOUND_TYPES:
+        raise ValueError(f"Tipo de movimiento inválido: {movement_type}")
+
+    with transaction.atomic():
+        if movement_type in OUTBOUND_TYPES:
+            # Descontar sólo si alcanza: el UPDATE toma el lock de la fila y
+            # las salidas concurrentes esperan y vuelven a evaluar la condición
+            updated = CurrentStock.objects.filter(
+                product=product, quantity__gte=quantity
+            ).update(quantity=F('quantity') - quantity)
+            if not updated:
+                raise InsufficientStock(product.product_id, quantity)
+        else:
+            _, created = CurrentStock.objects.get_or_create(
+                product=product, defaults={'quantity': quantity}
+            )
+            if not created:
+                CurrentStock.objects.filter(product=product).update(quantity=F('quantity') + quantity)
+
+        movement = InventoryMovement.objects.create(
+            movement_id=movement_id,
+            date=date or timezone.now(),
+            product=product,
+            movement_type=movement_type,
+            quantity=quantity,
+            order_id=order_id or movement_id,
+            notes=notes
+        )
+
+        # La fila ya está bloqueada por esta transacción: se recalculan el
+        # estado y el costo a partir de la cantidad resultante
+        stock = CurrentStock.objects.select_related('product').get(product=product)
+        stock.save(update_fields=['stock_status', 'total_inventory_cost', 'last_updated'])
+
+    return movement, stock
+
+
+def set_stock_level(product: Product, quantity: int, movement_id: str) -> CurrentStock:
+    """
+    Fija el stock de un producto en ``quantity``. Si baja, la diferencia se
+    registra como ADJUSTMENT_OUT con apply_movement.
+    """
+    with transaction.atomic():
+        stock, _ = CurrentStock.objects.get_or_create(product=product, defaults={'quantity': 0})
+        stock = CurrentStock.objects.select_for_update().select_related('product').get(pk=stock.pk)
+
+        difference = quantity - stock.quantity
+        if difference < 0:
+            _, stock = apply_movement(
+                product, 'ADJUSTMENT_OUT', -difference,
+                movement_id=movement_id, order_id=f"ADJ-{movement_id}"
+            )
+        elif difference > 0:
+            stock.quantity = quantity
+            stock.save()
+    return stock
+
+
+def refresh_stock_cost(product: Product) -> None:
+    """
+    Recalcula el costo total del stock de un producto después de cambiar su
+    costo, para que los totales del dashboard se lean sin recalcular.
+    """
+    stock = CurrentStock.objects.filter(product=product).first()
+    if stock is not None:
+        stock.product = product
+        stock.save(update_fields=['stock_status', 'total_inventory_cost'])
+
+
+def apply_movements_bulk(movements: List[InventoryMovement]) -> Tuple[List[Optional[str]], Dict[str, int]]:
+    """
+    Aplica muchos movimientos con una cantidad fija de consultas: un SELECT de
+    productos, un SELECT ... FOR UPDATE del stock, los INSERT con bulk_create y
+    un bulk_update con el saldo final de cada producto, todo en una transacción.
+
+    Los movimientos se validan en orden contra el saldo acumulado de su
+    producto; los que no se pueden aplicar (incluidas las cantidades con
+    decimales) se rechazan sin afectar al resto.
+
+    Args:
+        movements: Movimientos sin guardar, con product_id, movement_type,
+            quantity, movement_id y order_id completos
+
+    Returns:
+        Tupla (error de cada movimiento o None si se aplicó, stock final por producto)
+    """
+    errors: List[Optional[str]] = [None] * len(movements)
+    product_ids = {movement.product_id for movement in movements}
+
+    with transaction.atomic():
+        products = Product.objects.in_bulk(product_ids)
+        stocks = {
+            stock.product_id: stock
+            for stock in CurrentStock.objects.select_for_update().filter(product_id__in=products.keys())
+        }
+        balances = defaultdict(int, {product_id: stock.quantity for product_id, stock in stocks.items()})
+
+        accepted = []
+        for index, movement in enumerate(movements):
+            if movement.product_id not in products:
+                errors[index] = "Producto no encontrado"
+                continue
+            if movement.quantity <= 0:
+                errors[index] = "La cantidad del movimiento debe ser mayor que cero"
+                continue
+            if movement.quantity != int(movement.quantity):
+                # La columna es entera: una fracción dejaría el saldo distinto del historial
+                errors[index] = "La cantidad del movimiento debe ser un número entero"
+                continue
+            movement.quantity = int(movement.quantity)
+            if movement.movement_type in OUTBOUND_TYPES:
+                if balances[movement.product_id] < movement.quantity:
+                    errors[index] = "No hay suficiente stock disponible"
+                    continue
+                balances[movement.product_id] -= movement.quantity
+            elif movement.movement_type in INBOUND_TYPES:
+                balances[movement.product_id] += movement.quantity
+            else:
+                errors[index] = f"Tipo de movimiento inválido: {movement.movement_type}"
+                continue
+            movement.order_id = movement.order_id or movement.movement_id
+            accepted.append(movement)
+
+        InventoryMovement.objects.bulk_create(accepted, batch_size=BULK_BATCH_SIZE)
+        invalidate_snapshots_before(movement.date for movement in accepted)
+
+        now = timezone.now()
+        touched = {movement.product_id for movement in accepted}
+        changed, created = [], []
+        for product_id in touched:
+            stock = stocks.get(product_id)
+            if stock is None:
+                stock = CurrentStock(product=products[product_id], quantity=balances[product_id])
+                created.append(stock)
+            else:
+                stock.product = products[product_id]
+                stock.quantity = balances[product_id]
+                changed.append(stock)
+            stock.last_updated = now
+            stock.refresh_derived_fields()
+
+        CurrentStock.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        CurrentStock.objects.bulk_update(
+            changed,
+            ['quantity', 'stock_status', 'total_inventory_cost', 'last_updated'],
+            batch_size=BULK_BATCH_SIZE
+        )
+        # Los INSERT/UPDATE masivos no emiten señales
+        transaction.on_commit(invalidate_dashboard)
+
+    return errors, {product_id: balances[product_id] for product_id in products}
+
+
+def net_quantities(movements) -> Dict[str, int]:
+    """Entradas menos salidas por producto de un queryset de movimientos, en una consulta agrupada"""
+    rows = movements.values('product_id').annotate(
+        net=Sum(Case(
+            When(movement_type__in=INBOUND_TYPES, then=F('quantity')),
+            default=-F('quantity')
+        ))
+    ).values_list('product_id', 'net')
+    return {product_id: net or 0 for product_id, net in rows.order_by()}
+
+
+def net_stock_quantities() -> Dict[str, int]:
+    """
+    Stock de cada producto según todos sus movimientos (entradas menos salidas
+    y ajustes), calculado con una sola consulta agrupada.
+    """
+    return net_quantities(InventoryMovement.objects.all())
+
+
+def stock_discrepancies(expected: Optional[Dict[str, int]] = None) -> List[Tuple[str, Optional[int], int]]:
+    """
+    Productos cuyo CurrentStock no coincide con sus movimientos.
+
+    Args:
+        expected: Stock esperado por producto; por defecto net_stock_quantities()
+
+    Returns:
+        Lista de (product_id, cantidad registrada o None si no hay fila,
+        cantidad según movimientos) ordenada por product_id
+    """
+    if expected is None:
+        expected = net_stock_quantities()
+    recorded = dict(CurrentStock.objects.values_list('product_id', 'quantity'))
+
+    differences = []
+    for product_id in sorted(expected.keys() | recorded.keys()):
+        quantity = expected.get(product_id, 0)
+        if recorded.get(product_id) != quantity:
+            differences.append((product_id, recorded.get(product_id), quantity))
+    return differences
+
+
+def rebuild_current_stock(discrepancies: Optional[List[Tuple[str, Optional[int], int]]] = None) -> int:
+    """
+    Corrige CurrentStock a partir de los movimientos con bulk_update de las
+    filas existentes y bulk_create de las que faltan.
+
+    Args:
+        discrepancies: Resultado de stock_discrepancies(); se calcula si no se pasa
+
+    Returns:
+        Cantidad de filas corregidas
+    """
+    if discrepancies is None:
+        discrepancies = stock_discrepancies()
+    now = timezone.now()
+
+    for start in range(0, len(discrepancies), BULK_BATCH_SIZE):
+        batch = {product_id: quantity for product_id, _, quantity in discrepancies[start:start + BULK_BATCH_SIZE]}
+        with transaction.atomic():
+            stocks = CurrentStock.objects.select_related('product').filter(product_id__in=batch.keys())
+            changed = []
+            for stock in stocks:
+                stock.quantity = batch.pop(stock.product_id)
+                stock.last_updated = now
+                stock.refresh_derived_fields()
+                changed.append(stock)
+
+            # Lo que queda en el lote son productos sin fila de stock
+            created = []
+            for product in Product.objects.filter(product_id__in=batch.keys()):
+                stock = CurrentStock(product=product, quantity=batch[product.product_id], last_updated=now)
+                stock.refresh_derived_fields()
+                created.append(stock)
+
+            CurrentStock.objects.bulk_update(
+                changed, ['quantity', 'stock_status', 'total_inventory_cost', 'last_updated']
+            )
+            CurrentStock.objects.bulk_create(created)
+
+    if discrepancies:
+        transaction.on_commit(invalidate_dashboard)
+    return len(discrepancies)
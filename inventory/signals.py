@@ -0,0 +1,95 @@
+"""
+Invalidación de la caché del dashboard, de los puntos de control de stock y
+del índice de búsqueda cuando cambian sus datos.
+
+bulk_create, bulk_update y QuerySet.update no emiten señales: quien los usa
+llama a inventory.dashboard.invalidate_dashboard, si guarda movimientos a
+inventory.services.invalidate_snapshots_before y, si guarda productos, a
+inventory.search.invalidate_search_index al terminar.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models import Min, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from .dashboard import DASHBOARD_BLOCKS, invalidate_blocks
+from .models import CurrentStock, InventoryMovement, Product, StockForecast
+from .search import index_product, unindex_product
+from .services import invalidate_snapshots_before
+
+# Bloques que dependen de cada modelo
+DEPENDENT_BLOCKS = {
+    Product: DASHBOARD_BLOCKS,
+    CurrentStock: ('totals', 'critical_stock', 'predictions'),
+    InventoryMovement: ('activity',),
+    StockForecast: ('totals', 'predictions'),
+}
+
+
+def invalidate_dashboard_blocks(sender, **kwargs):
+    # Recién al confirmar: antes otra visita podría volver a cachear los datos viejos
+    blocks = DEPENDENT_BLOCKS[sender]
+    transaction.on_commit(lambda: invalidate_blocks(*blocks))
+
+
+for model in DEPENDENT_BLOCKS:
+    post_save.connect(invalidate_dashboard_blocks, sender=model, dispatch_uid=f"dashboard-save-{model.__name__}")
+    post_delete.connect(invalidate_dashboard_blocks, sender=model, dispatch_uid=f"dashboard-delete-{model.__name__}")
+
+
+def remember_movement_date(sender, instance, raw=False, **kwargs):
+    # Al editar un movimiento, los puntos de control desde su fecha anterior
+    # también dejan de valer
+    instance._previous_date = None
+    if not raw and not instance._state.adding:
+        instance._previous_date = InventoryMovement.objects.filter(pk=instance.pk).values_list(
+            'date', flat=True
+        ).first()
+
+
+def invalidate_saved_movement(sender, instance, **kwargs):
+    # Un movimiento con fecha pasada (alta o edición) puede caer antes de la última marca
+    dates = [instance.date]
+    if getattr(instance, '_previous_date', None) is not None:
+        dates.append(instance._previous_date)
+    invalidate_snapshots_before(dates)
+
+
+_deletes = threading.local()
+
+
+def invalidate_deleted_movement(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Product) or (isinstance(origin, QuerySet) and origin.model is Product):
+        # Al borrar el producto, sus puntos de control se borran en la misma cascada
+        return
+    if isinstance(origin, QuerySet) and origin.model is InventoryMovement:
+        # QuerySet.delete envía una señal por fila: una sola invalidación por operación
+        if getattr(_deletes, 'origin', None) is not origin:
+            _deletes.origin = origin
+            first = origin.aggregate(first=Min('date'))['first']
+            if first is not None:
+                invalidate_snapshots_before([first])
+        return
+    invalidate_snapshots_before([instance.date])
+
+
+pre_save.connect(remember_movement_date, sender=InventoryMovement, dispatch_uid="snapshots-movement-pre-save")
+post_save.connect(invalidate_saved_movement, sender=InventoryMovement, dispatch_uid="snapshots-movement-save")
+# pre_delete: las filas todavía existen para calcular la fecha más antigua del borrado
+pre_delete.connect(invalidate_deleted_movement, sender=InventoryMovement, dispatch_uid="snapshots-movement-delete")
+
+
+def update_search_index(sender, instance, **kwargs):
+    # Sólo el producto editado cambia en el trie, y recién al confirmar
+    transaction.on_commit(lambda: index_product(instance))
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    # delete() deja el pk de la instancia en None antes de confirmar
+    product_id = instance.product_id
+    transaction.on_commit(lambda: unindex_product(product_id))
+
+
+post_save.connect(update_search_index, sender=Product, dispatch_uid="search-product-save")
+post_delete.connect(remove_from_search_index, sender=Product, dispatch_uid="search-product-delete")
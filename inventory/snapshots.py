@@ -0,0 +1,231 @@
+"""
+Puntos de control del stock por producto.
+
+``StockSnapshot`` guarda la cantidad neta de cada producto hasta una marca
+(fecha, movement_id). ``advance_stock_snapshots`` sólo suma los movimientos
+posteriores a la última marca, de modo que la reconciliación procesa los
+movimientos nuevos y no todo el historial.
+
+Los movimientos más recientes que STOCK_SNAPSHOT_LAG_SECONDS no se incluyen
+en el punto de control, para no saltear los que todavía se están confirmando
+con una fecha apenas anterior. Los movimientos guardados con una fecha
+anterior a esa ventana (importación de historial, datos de ejemplo, ediciones)
+dejan una ``StockSnapshotInvalidation``: los puntos de control desde su fecha
+se ignoran al leer y la próxima reconciliación los borra y los recalcula.
+
+Los puntos de control también responden el stock a una fecha: se parte del
+último punto de control anterior a la fecha y se suman sólo los movimientos
+entre su marca y la fecha pedida.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Product, InventoryMovement, StockSnapshot, StockSnapshotInvalidation
+from .services import BULK_BATCH_SIZE, net_quantities, rebuild_current_stock, stock_discrepancies
+
+Mark = Tuple[datetime, str]
+
+
+def _after(mark: Mark) -> Q:
+    """Movimientos estrictamente posteriores a la marca en el orden (date, movement_id)"""
+    date, movement_id = mark
+    return Q(date__gt=date) | Q(date=date, movement_id__gt=movement_id)
+
+
+def _up_to(mark: Mark) -> Q:
+    """Movimientos hasta la marca inclusive"""
+    date, movement_id = mark
+    return Q(date__lt=date) | Q(date=date, movement_id__lte=movement_id)
+
+
+def valid_snapshots():
+    """
+    Puntos de control que incluyen todos sus movimientos: los anteriores a la
+    fecha del movimiento retroactivo más antiguo todavía no reconciliado.
+    """
+    snapshots = StockSnapshot.objects.all()
+    since = StockSnapshotInvalidation.objects.aggregate(since=Min('since'))['since']
+    if since is not None:
+        snapshots = snapshots.filter(as_of_date__lt=since)
+    return snapshots
+
+
+def latest_mark(snapshots=None) -> Optional[Mark]:
+    """Marca del último punto de control válido o None si todavía no hay ninguno"""
+    snapshots = valid_snapshots() if snapshots is None else snapshots
+    return snapshots.order_by('-as_of_date', '-as_of_movement_id').values_list(
+        'as_of_date', 'as_of_movement_id'
+    ).first()
+
+
+def latest_snapshot_quantities(product_ids: Optional[Iterable[str]] = None, snapshots=None) -> Dict[str, int]:
+    """Cantidad del punto de control válido más reciente de cada producto (o de los indicados)"""
+    snapshots = valid_snapshots() if snapshots is None else snapshots
+    latest = snapshots.filter(product=OuterRef('pk')).order_by('-as_of_date', '-as_of_movement_id')
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(product_id__in=list(product_ids))
+    rows = products.annotate(
+        snapshot_quantity=Subquery(latest.values('quantity')[:1])
+    ).filter(snapshot_quantity__isnull=False).values_list('product_id', 'snapshot_quantity')
+    return dict(rows)
+
+
+def advance_stock_snapshots(full: bool = False) -> int:
+    """
+    Descarta los puntos de control invalidados por movimientos retroactivos y
+    agrega puntos de control con los movimientos posteriores a la última marca.
+
+    Args:
+        full: Descartar los puntos de control y recalcular desde todo el historial
+
+    Returns:
+        Cantidad de productos con un punto de control nuevo
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.STOCK_SNAPSHOT_LAG_SECONDS)
+    new_mark = InventoryMovement.objects.filter(date__lte=cutoff).order_by('-date', '-movement_id').values_list(
+        'date', 'movement_id'
+    ).first()
+    if new_mark is None:
+        return 0
+
+    with transaction.atomic():
+        # Sólo se borran las invalidaciones leídas: las que se confirmen
+        # durante esta transacción quedan para la próxima reconciliación
+        pending = dict(StockSnapshotInvalidation.objects.values_list('pk', 'since'))
+        StockSnapshotInvalidation.objects.filter(pk__in=list(pending)).delete()
+        if full:
+            StockSnapshot.objects.all().delete()
+            previous_mark = None
+        else:
+            if pending:
+                StockSnapshot.objects.filter(as_of_date__gte=min(pending.values())).delete()
+            previous_mark = latest_mark(StockSnapshot.objects.all())
+            if previous_mark is not None and tuple(previous_mark) >= tuple(new_mark):
+                return 0
+
+        window = InventoryMovement.objects.filter(_up_to(new_mark))
+        if previous_mark is not None:
+            window = window.filter(_after(previous_mark))
+        deltas = net_quantities(window)
+
+        base = {}
+        if previous_mark is not None:
+            base = latest_snapshot_quantities(deltas.keys(), StockSnapshot.objects.all())
+        StockSnapshot.objects.bulk_create(
+            [
+                StockSnapshot(
+                    product_id=product_id,
+                    quantity=base.get(product_id, 0) + delta,
+                    as_of_date=new_mark[0],
+                    as_of_movement_id=new_mark[1],
+                )
+                for product_id, delta in deltas.items()
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+    return len(deltas)
+
+
+def expected_stock_quantities() -> Dict[str, int]:
+    """
+    Stock esperado de cada producto: su último punto de control más los
+    movimientos posteriores a la última marca.
+    """
+    snapshots = valid_snapshots()
+    quantities = latest_snapshot_quantities(snapshots=snapshots)
+    mark = latest_mark(snapshots)
+    tail = InventoryMovement.objects.all()
+    if mark is not None:
+        tail = tail.filter(_after(mark))
+    for product_id, delta in net_quantities(tail).items():
+        quantities[product_id] = quantities.get(product_id, 0) + delta
+    return quantities
+
+
+def reconcile_stock(full: bool = False, dry_run: bool = False) -> List[Tuple[str, Optional[int], int]]:
+    """
+    Avanza los puntos de control y corrige las filas de CurrentStock que no
+    coinciden con ellos.
+
+    Returns:
+        Diferencias encontradas (product_id, cantidad registrada o None, cantidad esperada)
+    """
+    if not dry_run:
+        advance_stock_snapshots(full=full)
+        expected = expected_stock_quantities()
+    elif full:
+        expected = net_quantities(InventoryMovement.objects.all())
+    else:
+        expected = expected_stock_quantities()
+
+    differences = stock_discrepancies(expected)
+    if differences and not dry_run:
+        rebuild_current_stock(differences)
+    return differences
+
+
+def stock_as_of(product_id: str, when: datetime) -> Tuple[int, Optional[Mark]]:
+    """
+    Stock de un producto al momento ``when``.
+
+    Returns:
+        Tupla (cantidad, marca del punto de control usado o None si no había)
+    """
+    checkpoint = valid_snapshots().filter(
+        product_id=product_id, as_of_date__lte=when
+    ).order_by('-as_of_date', '-as_of_movement_id').values_list(
+        'quantity', 'as_of_date', 'as_of_movement_id'
+    ).first()
+
+    movements = InventoryMovement.objects.filter(product_id=product_id, date__lte=when)
+    quantity, mark = 0, None
+    if checkpoint is not None:
+        quantity, mark = checkpoint[0], (checkpoint[1], checkpoint[2])
+        movements = movements.filter(_after(mark))
+    return quantity + net_quantities(movements).get(product_id, 0), mark
+
+
+def stocks_as_of(when: datetime, product_ids: Optional[Iterable[str]] = None) -> Tuple[Dict[str, int], Optional[Mark]]:
+    """
+    Stock de varios productos (todos por defecto) al momento ``when``.
+
+    Cada reconciliación crea puntos de control para todos los productos con
+    movimientos en su ventana, así que un producto no tiene movimientos entre
+    su último punto de control y la última marca global anterior a ``when``:
+    basta sumar los movimientos entre esa marca y ``when`` en una consulta agrupada.
+
+    Returns:
+        Tupla (cantidad por producto, marca global usada o None si no había)
+    """
+    snapshots = valid_snapshots()
+    mark = snapshots.filter(as_of_date__lte=when).order_by(
+        '-as_of_date', '-as_of_movement_id'
+    ).values_list('as_of_date', 'as_of_movement_id').first()
+
+    products = Product.objects.all()
+    movements = InventoryMovement.objects.filter(date__lte=when)
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        products = products.filter(product_id__in=product_ids)
+        movements = movements.filter(product_id__in=product_ids)
+
+    # Todos los puntos de control con fecha <= when tienen una marca <= mark
+    latest = snapshots.filter(
+        product=OuterRef('pk'), as_of_date__lte=when
+    ).order_by('-as_of_date', '-as_of_movement_id')
+    rows = products.annotate(
+        snapshot_quantity=Subquery(latest.values('quantity')[:1])
+    ).values_list('product_id', 'snapshot_quantity')
+    quantities = {product_id: snapshot_quantity or 0 for product_id, snapshot_quantity in rows}
+
+    if mark is not None:
+        movements = movements.filter(_after(mark))
+    for product_id, delta in net_quantities(movements).items():
+        quantities[product_id] = quantities.get(product_id, 0) + delta
+    return quantities, mark
@@ -1,6 +1,47 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.test.utils import CaptureQueriesContext
+from fastapi import HTTPException, Response
+from fastapi.security import OAuth2PasswordRequestForm
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
-from .models import Product, CurrentStock
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import FrozenInstanceError
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib.util import find_spec
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from .models import Product, CurrentStock, InventoryMovement, StockForecast, StockSnapshot, StockSnapshotInvalidation
+from .forecasting import refresh_forecasts, stale_products
+from .services import InsufficientStock, apply_movement, apply_movements_bulk, refresh_stock_cost
+from . import search
+from .search import search_products
+from .snapshots import advance_stock_snapshots, expected_stock_quantities, reconcile_stock, stock_as_of, stocks_as_of
+from api import main as api_main
+from api import realtime
+from api.auth import (
+    check_revocation_store, decode_access_token, get_current_claims, revocation_cache, revoke_token, revoke_user_tokens
+)
+from api.executor import BoundedExecutor, ExecutorOverloaded
+from api.predictor import (
+    AdvancedStockPredictor, ModelRegistry, build_features, fit_stock_model, forecast_stock,
+    shutdown_process_pool, start_process_pool
+)
 
 # Create your tests here.
 
@@ -71,3 +112,1286 @@ class CurrentStockModelTest(TestCase):
     def test_total_inventory_cost(self):
         """Test que verifica el cálculo del costo total del inventario"""
         self.assertEqual(self.stock.total_inventory_cost, 200.00)  # 10 unidades * $20.00
+
+class ModelRegistryTest(TestCase):
+    def test_lru_eviction(self):
+        """Test que verifica que se desaloja el modelo menos usado"""
+        registry = ModelRegistry(max_entries=2)
+        registry.put("A", (1,), {"model": "a"})
+        registry.put("B", (1,), {"model": "b"})
+        registry.get("A", (1,))
+        registry.put("C", (1,), {"model": "c"})
+
+        self.assertIsNotNone(registry.get("A", (1,)))
+        self.assertIsNone(registry.get("B", (1,)))
+        self.assertIsNotNone(registry.get("C", (1,)))
+
+    def test_ttl_and_watermark_expiry(self):
+        """Test que verifica que un modelo vencido o con otro historial no se reutiliza"""
+        registry = ModelRegistry(ttl_seconds=60)
+        registry.put("A", (1,), {"model": "a"})
+        self.assertIsNone(registry.get("A", (2,)))
+
+        registry.put("A", (1,), {"model": "a"})
+        with patch("api.predictor.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(registry.get("A", (1,)))
+
+class PredictorCacheTest(TestCase):
+    def setUp(self):
+        base_date = timezone.now() - timedelta(days=20)
+        self.history = [
+            {
+                'movement_id': f"M{i:03d}",
+                'date': base_date + timedelta(days=i),
+                'quantity': 10 + (i % 4),
+            }
+            for i in range(20)
+        ]
+
+    def test_unchanged_history_skips_training(self):
+        """Test que verifica que no se reentrena si no hay movimientos nuevos"""
+        predictor = AdvancedStockPredictor(registry=ModelRegistry())
+        first = predictor.predict_next_days(self.history, 7, product_id="P1")
+
+        with patch('api.predictor.fit_stock_model') as fit:
+            second = predictor.predict_next_days(self.history, 7, product_id="P1")
+            fit.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_new_movement_retrains(self):
+        """Test que verifica que un movimiento nuevo invalida el modelo guardado"""
+        predictor = AdvancedStockPredictor(registry=ModelRegistry())
+        predictor.predict_next_days(self.history, 7, product_id="P1")
+
+        history = self.history + [{
+            'movement_id': "M999",
+            'date': self.history[-1]['date'] + timedelta(days=1),
+            'quantity': 12,
+        }]
+        with patch('api.predictor.fit_stock_model', wraps=fit_stock_model) as fit:
+            predictor.predict_next_days(history, 7, product_id="P1")
+            fit.assert_called_once()
+
+class StockForecastRefreshTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            product_id="TEST003",
+            product_name="Test Product 3",
+            sku="SKU003",
+            unit_of_measure="UN",
+            cost=5.00,
+            sale_price=8.00,
+            category="Test",
+            location="A3",
+            active=True
+        )
+        CurrentStock.objects.create(product=self.product, quantity=40, threshold=5)
+        base_date = timezone.now() - timedelta(days=10)
+        for i in range(10):
+            InventoryMovement.objects.create(
+                movement_id=f"F{i:03d}",
+                date=base_date + timedelta(days=i),
+                product=self.product,
+                movement_type='OUTBOUND',
+                quantity=5 + (i % 3),
+                order_id=f"ORD{i:03d}"
+            )
+
+    def test_command_stores_forecast(self):
+        """Test que verifica que el comando guarda el pronóstico del producto"""
+        # Dentro de la transacción del TestCase, close_old_connections cerraría
+        # la conexión (autocommit desactivado) y con ella los datos del test
+        with patch('inventory.management.commands.refresh_forecasts.close_old_connections'):
+            call_command('refresh_forecasts', stdout=StringIO())
+
+        forecast = StockForecast.objects.get(product=self.product)
+        self.assertEqual(len(forecast.predictions), forecast.horizon_days)
+        self.assertEqual(forecast.last_movement_id, "F009")
+        self.assertFalse(stale_products().exists())
+
+    def test_new_movement_marks_forecast_stale(self):
+        """Test que verifica que un movimiento nuevo vuelve a encolar el producto"""
+        refresh_forecasts()
+        InventoryMovement.objects.create(
+            movement_id="F999",
+            date=timezone.now(),
+            product=self.product,
+            movement_type='INBOUND',
+            quantity=20,
+            order_id="ORD999"
+        )
+        self.assertEqual(list(stale_products()), [self.product])
+
+        refresh_forecasts()
+        self.assertEqual(StockForecast.objects.get(product=self.product).last_movement_id, "F999")
+
+    def test_home_reads_precomputed_forecasts(self):
+        """Test que verifica que el dashboard no entrena modelos en la petición"""
+        cache.clear()
+        refresh_forecasts()
+        with patch('api.predictor.fit_stock_model') as fit:
+            response = self.client.get('/')
+            forecasts = self.client.get('/dashboard/forecasts/')
+            fit.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['has_forecasts'])
+        self.assertNotIn('predictions', response.context)
+        self.assertEqual(forecasts.json()['results'][0]['product']['id'], self.product.product_id)
+
+class PredictManyTest(TestCase):
+    def setUp(self):
+        base_date = timezone.now() - timedelta(days=15)
+        self.histories = {
+            f"P{p}": [
+                {
+                    'movement_id': f"M{p}{i:03d}",
+                    'date': base_date + timedelta(days=i),
+                    'quantity': 10 + p + (i % 3),
+                }
+                for i in range(15)
+            ]
+            for p in range(3)
+        }
+
+    def test_process_pool_matches_serial_predictions(self):
+        """Test que verifica que el pool de procesos devuelve lo mismo que el cálculo secuencial"""
+        registry = ModelRegistry()
+        parallel = AdvancedStockPredictor(registry=registry).predict_many(
+            self.histories, 7, max_workers=2, chunk_size=1
+        )
+        serial = {
+            product_id: AdvancedStockPredictor(registry=ModelRegistry()).predict_next_days(history, 7)
+            for product_id, history in self.histories.items()
+        }
+
+        self.assertEqual(parallel, serial)
+        self.assertEqual(len(registry), 3)
+
+    def test_cached_products_skip_the_pool(self):
+        """Test que verifica que los productos con modelo vigente no se reentrenan"""
+        predictor = AdvancedStockPredictor(registry=ModelRegistry())
+        predictor.predict_many(self.histories, 7, max_workers=1)
+
+        with patch('api.predictor._fit_chunk') as fit_chunk:
+            results = predictor.predict_many(self.histories, 7, max_workers=2)
+            fit_chunk.assert_not_called()
+        self.assertEqual(set(results), set(self.histories))
+
+    def test_process_pool_is_spawned_once(self):
+        """Test que verifica que las llamadas reutilizan un pool creado con 'spawn'"""
+        self.addCleanup(shutdown_process_pool)
+        pool = start_process_pool(2)
+        AdvancedStockPredictor(registry=ModelRegistry()).predict_many(self.histories, 7, max_workers=2)
+        AdvancedStockPredictor(registry=ModelRegistry()).predict_many(self.histories, 7, max_workers=2)
+
+        self.assertIs(start_process_pool(), pool)
+        self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+
+class FeatureEngineeringTest(TestCase):
+    def test_vectorized_features_match_datetime_fields(self):
+        """Test que verifica que las features vectorizadas coinciden con los campos de cada fecha"""
+        base_date = timezone.now() - timedelta(days=400)
+        dates = [base_date + timedelta(hours=37 * i) for i in range(300)]
+
+        features = build_features(dates, base_date)
+
+        expected = [[(d - base_date).days, d.weekday(), d.day, d.month] for d in dates]
+        self.assertEqual(features.tolist(), expected)
+
+    def test_columnar_input_matches_row_input(self):
+        """Test que verifica que el camino columnar (datetime64) equivale al de diccionarios"""
+        dates = np.arange('2025-01-01', '2025-03-01', dtype='datetime64[D]').astype('datetime64[s]')
+        quantities = np.arange(len(dates)) % 7
+        history = [
+            {'date': d.astype(datetime), 'quantity': q}
+            for d, q in zip(dates, quantities)
+        ]
+
+        X_rows, y_rows = AdvancedStockPredictor().prepare_data(history)
+        X_cols, y_cols = AdvancedStockPredictor().prepare_columns(pd.Series(dates), quantities)
+
+        np.testing.assert_allclose(X_rows, X_cols)
+        np.testing.assert_array_equal(y_rows, y_cols)
+
+class StatelessForecastTest(TestCase):
+    def setUp(self):
+        base_date = timezone.now() - timedelta(days=20)
+        self.histories = {
+            f"P{p}": [
+                {
+                    'movement_id': f"M{p}{i:03d}",
+                    'date': base_date + timedelta(days=i),
+                    'quantity': (i * (p + 1)) % 11,
+                }
+                for i in range(20)
+            ]
+            for p in range(6)
+        }
+
+    def test_fitted_model_is_immutable(self):
+        """Test que verifica que el modelo entrenado no puede modificarse"""
+        fitted = fit_stock_model(self.histories["P0"])
+        with self.assertRaises(FrozenInstanceError):
+            fitted.confidence_score = 1.0
+
+    def test_concurrent_forecasts_do_not_interleave(self):
+        """Test que verifica que pronósticos concurrentes no mezclan modelos entre productos"""
+        expected = {
+            product_id: forecast_stock(history, 7, product_id=product_id, registry=ModelRegistry())
+            for product_id, history in self.histories.items()
+        }
+
+        registry = ModelRegistry()
+        jobs = list(self.histories.items()) * 3
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(
+                lambda job: (job[0], forecast_stock(job[1], 7, product_id=job[0], registry=registry)),
+                jobs
+            ))
+
+        for product_id, predictions in results:
+            self.assertEqual(predictions, expected[product_id])
+
+class BoundedExecutorTest(TestCase):
+    def test_rejects_when_queue_is_full(self):
+        """Test que verifica que el ejecutor rechaza tareas cuando la cola está llena"""
+        executor = BoundedExecutor(max_workers=1, max_pending=1, name='test')
+        release = threading.Event()
+
+        async def scenario():
+            blocked = asyncio.ensure_future(executor.run(release.wait, 5))
+            await asyncio.sleep(0.05)
+            with self.assertRaises(ExecutorOverloaded):
+                await executor.run(sum, [1, 2])
+            release.set()
+            await blocked
+            return await executor.run(sum, [1, 2])
+
+        self.assertEqual(asyncio.run(scenario()), 3)
+        stats = executor.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['completed'], 2)
+        self.assertEqual(stats['pending'], 0)
+        executor.shutdown()
+
+    def test_records_queue_and_compute_time(self):
+        """Test que verifica que se mide por separado el tiempo en cola y el de cómputo"""
+        executor = BoundedExecutor(max_workers=1, max_pending=4, name='test')
+
+        async def scenario():
+            await asyncio.gather(executor.run(time.sleep, 0.05), executor.run(time.sleep, 0.05))
+
+        asyncio.run(scenario())
+        stats = executor.stats()
+        # La segunda tarea esperó en cola a que terminara la primera
+        self.assertGreaterEqual(stats['queued']['max_ms'], 40)
+        self.assertGreaterEqual(stats['compute']['p50_ms'], 40)
+        executor.shutdown()
+
+class MovementListingQueryCountTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for p in range(3):
+            product = Product.objects.create(
+                product_id=f"QC{p}",
+                product_name=f"Query Product {p}",
+                sku=f"QC-{p}",
+                unit_of_measure="UN",
+                cost=1.00,
+                sale_price=2.00,
+                category="Test",
+                location="Q1"
+            )
+            CurrentStock.objects.create(product=product, quantity=100 + p)
+            for i in range(10):
+                InventoryMovement.objects.create(
+                    movement_id=f"QC{p}{i:03d}",
+                    date=now - timedelta(hours=i // 2),
+                    product=product,
+                    movement_type='INBOUND',
+                    quantity=i + 1,
+                    order_id=f"ORD{p}{i}"
+                )
+
+    def list_movements(self, **kwargs):
+        params = dict(
+            product_id=None, movement_type=None, start_date=None, end_date=None,
+            cursor=None, limit=100, format=None, accept=None, claims=None
+        )
+        params.update(kwargs)
+        return async_to_sync(api_main.get_movements)(**params)
+
+    def test_movements_use_constant_number_of_queries(self):
+        """Test que verifica que listar movimientos no hace una consulta por fila"""
+        with self.assertNumQueries(1):
+            movements = self.list_movements()["items"]
+
+        self.assertEqual(len(movements), 30)
+        stock_by_product = {m["product_id"]: m["current_stock"] for m in movements}
+        self.assertEqual(stock_by_product, {"QC0": 100, "QC1": 101, "QC2": 102})
+
+    def test_cursor_pagination_walks_all_movements_once(self):
+        """Test que verifica que la paginación por cursor recorre todo sin repetir filas"""
+        # Movimientos con la misma fecha: el desempate es por movement_id
+        seen = []
+        cursor = None
+        while True:
+            page = self.list_movements(cursor=cursor, limit=7)
+            seen.extend(m["id"] for m in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        expected = list(
+            InventoryMovement.objects.order_by('-date', '-movement_id').values_list('movement_id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test que verifica que un cursor inválido devuelve 400"""
+        with self.assertRaises(HTTPException) as ctx:
+            self.list_movements(cursor="no-es-un-cursor")
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_ndjson_stream(self):
+        """Test que verifica el modo NDJSON leyendo el resultado por bloques"""
+        async def read_body(response):
+            return "".join([chunk async for chunk in response.body_iterator])
+
+        with patch.object(api_main, 'MOVEMENT_STREAM_CHUNK_SIZE', 4):
+            response = self.list_movements(accept="application/x-ndjson", product_id="QC1")
+            body = async_to_sync(read_body)(response)
+
+        self.assertEqual(response.media_type, "application/x-ndjson")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 10)
+        self.assertTrue(all(row["current_stock"] == 101 for row in rows))
+
+class QueryPlanIndexTest(TestCase):
+    """Verifica con EXPLAIN que las consultas frecuentes usan los índices y no recorren la tabla completa"""
+
+    def assertUsesIndex(self, queryset):
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            # Con tablas chicas el planificador prefiere Seq Scan; se desactiva
+            # para que sólo aparezca si no hay un índice aplicable
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn(f"Seq Scan on {table}", plan, plan)
+        else:
+            # SQLite no puede usar un índice parcial con parámetros (?): se
+            # explica la consulta con los valores literales, como la envía psycopg2
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                literal_sql = connection.ops.last_executed_query(cursor, sql, params)
+                cursor.execute(f"EXPLAIN QUERY PLAN {literal_sql}")
+                plan = "\n".join(row[-1] for row in cursor.fetchall())
+            full_scans = [
+                line for line in plan.splitlines()
+                if f"SCAN {table}" in line and "USING" not in line
+            ]
+            self.assertEqual(full_scans, [], plan)
+
+    def test_product_history_uses_index(self):
+        since = timezone.now() - timedelta(days=30)
+        self.assertUsesIndex(
+            InventoryMovement.objects.filter(product_id="P001", date__gte=since).order_by('date', 'movement_id')
+        )
+
+    def test_movements_today_uses_index(self):
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.assertUsesIndex(InventoryMovement.objects.filter(date__gte=today))
+
+    def test_recent_movements_use_index(self):
+        self.assertUsesIndex(InventoryMovement.objects.order_by('-date', '-movement_id')[:10])
+
+    def test_movement_type_filter_uses_index(self):
+        self.assertUsesIndex(
+            InventoryMovement.objects.filter(movement_type='OUTBOUND').order_by('-date', '-movement_id')[:100]
+        )
+
+    def test_totals_by_product_and_type_use_index(self):
+        self.assertUsesIndex(
+            InventoryMovement.objects.filter(product_id="P001", movement_type='INBOUND').values('quantity')
+        )
+
+    def test_critical_stock_uses_partial_index(self):
+        self.assertUsesIndex(CurrentStock.objects.filter(stock_status__in=['CRITICAL', 'OUT_OF_STOCK']))
+
+class TokenAuthTest(TestCase):
+    """Tests de los tokens firmados de la API"""
+
+    def setUp(self):
+        revocation_cache().clear()
+        self.addCleanup(revocation_cache().clear)
+        self.admin = User.objects.create_user(username="admin_api", password="clave123")
+        self.admin.groups.add(Group.objects.create(name="Administrador"))
+        self.reader = User.objects.create_user(username="lector_api", password="clave123")
+        self.reader.groups.add(Group.objects.create(name="Lectura"))
+
+    def login(self, username):
+        form = OAuth2PasswordRequestForm(username=username, password="clave123")
+        return async_to_sync(api_main.login)(form_data=form)["access_token"]
+
+    def test_token_carries_user_and_role_without_queries(self):
+        """Test que verifica que validar el token no consulta la base"""
+        token = self.login("admin_api")
+        with self.assertNumQueries(0):
+            claims = decode_access_token(token)
+        self.assertEqual(claims.user_id, self.admin.id)
+        self.assertEqual(claims.username, "admin_api")
+        self.assertTrue(claims.is_admin)
+        self.assertFalse(decode_access_token(self.login("lector_api")).is_admin)
+
+    def test_invalid_token_is_rejected(self):
+        token = self.login("admin_api")
+        for invalid in ("admin_api", token[:-2] + "xx"):
+            with self.assertRaises(HTTPException) as ctx:
+                decode_access_token(invalid)
+            self.assertEqual(ctx.exception.status_code, 401)
+
+    def test_reader_cannot_update_products(self):
+        claims = decode_access_token(self.login("lector_api"))
+        update = api_main.ProductUpdate(product_name="Otro")
+        with self.assertNumQueries(0), self.assertRaises(HTTPException) as ctx:
+            async_to_sync(api_main.update_product)(product_id="P001", product_update=update, claims=claims)
+        self.assertEqual(ctx.exception.status_code, 403)
+
+    def test_revoked_tokens_are_rejected(self):
+        token = self.login("admin_api")
+        revoke_token(decode_access_token(token))
+        with self.assertRaises(HTTPException) as ctx:
+            decode_access_token(token)
+        self.assertEqual(ctx.exception.status_code, 401)
+
+        reader_token = self.login("lector_api")
+        revoke_user_tokens(self.reader.id)
+        with self.assertRaises(HTTPException):
+            decode_access_token(reader_token)
+
+        # Un token emitido después de la revocación vale aunque sea en el mismo segundo
+        claims = async_to_sync(get_current_claims)(token=self.login("lector_api"))
+        self.assertEqual(claims.user_id, self.reader.id)
+
+    def test_local_revocation_store_is_rejected_when_shared_is_required(self):
+        with override_settings(API_REQUIRE_SHARED_REVOCATIONS=True):
+            with self.assertRaises(ImproperlyConfigured):
+                check_revocation_store()
+        with override_settings(API_REQUIRE_SHARED_REVOCATIONS=False):
+            check_revocation_store()
+
+@skipUnless(find_spec("email_validator"), "inventory.api.schemas requiere email-validator")
+class AsyncInventoryRouterTest(TransactionTestCase):
+    """Tests de los endpoints de inventory/api/endpoints.py ejecutados dentro del event loop"""
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            product_id="AR001",
+            product_name="Async Product",
+            sku="SKUAR1",
+            unit_of_measure="UN",
+            cost=10.00,
+            sale_price=15.00,
+            category="Test",
+            location="A1",
+            active=True
+        )
+        CurrentStock.objects.create(product=self.product, quantity=50)
+
+    def test_handlers_run_off_the_event_loop(self):
+        """Test que verifica que los endpoints no usan el ORM desde el event loop"""
+        from inventory.api import endpoints
+        from inventory.api.schemas import StockMovement
+
+        sold = async_to_sync(endpoints.sell_product)("AR001", StockMovement(quantity=3, order_id="ORD1"))
+        self.assertEqual(sold.current_stock, 47)
+
+        async def list_concurrently():
+            return await asyncio.gather(*[
+                endpoints.get_movements(product_id="AR001", movement_type="salida") for _ in range(5)
+            ])
+
+        for movements in async_to_sync(list_concurrently)():
+            self.assertEqual(len(movements), 1)
+            self.assertEqual(movements[0]["current_stock"], 47)
+
+class ApplyMovementConcurrencyTest(TransactionTestCase):
+    """Tests de inventory.services.apply_movement con escrituras concurrentes"""
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            product_id="CC001",
+            product_name="Concurrent Product",
+            sku="SKUCC1",
+            unit_of_measure="UN",
+            cost=10.00,
+            sale_price=15.00,
+            category="Test",
+            location="A1",
+            active=True
+        )
+        CurrentStock.objects.create(product=self.product, quantity=100)
+
+    def sell_one(self, i):
+        # Cada petición usa su propia conexión, como un worker de la API
+        close_old_connections()
+        try:
+            apply_movement(self.product, 'OUTBOUND', 1, movement_id=f"CC{i:05d}")
+            return True
+        except InsufficientStock:
+            return False
+        finally:
+            connection.close()
+
+    def test_parallel_sales_never_oversell(self):
+        """
+        Test que verifica que 200 salidas desde conexiones independientes sobre
+        100 unidades no dejan stock negativo.
+
+        Limitación: en SQLite cada escritura toma el lock de toda la base, así
+        que las transacciones se serializan y este test no ejercita el lock de
+        fila del UPDATE condicional (quantity >= n) del que depende
+        apply_movement en PostgreSQL. Sólo comprueba el resultado cuando las
+        salidas llegan intercaladas; no es una prueba de ese mecanismo.
+        """
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(self.sell_one, range(200)))
+
+        stock = CurrentStock.objects.get(product=self.product)
+        self.assertEqual(results.count(True), 100)
+        self.assertEqual(stock.quantity, 0)
+        self.assertEqual(stock.stock_status, 'OUT_OF_STOCK')
+        self.assertEqual(
+            InventoryMovement.objects.filter(product=self.product, movement_type='OUTBOUND').count(), 100
+        )
+
+    def test_failed_outbound_leaves_no_movement(self):
+        with self.assertRaises(InsufficientStock):
+            apply_movement(self.product, 'OUTBOUND', 101, movement_id="CCBIG")
+
+        self.assertEqual(CurrentStock.objects.get(product=self.product).quantity, 100)
+        self.assertFalse(InventoryMovement.objects.filter(movement_id="CCBIG").exists())
+
+    def test_inbound_creates_missing_stock_row(self):
+        CurrentStock.objects.all().delete()
+        _, stock = apply_movement(self.product, 'INBOUND', 3, movement_id="CCIN1")
+
+        self.assertEqual(stock.quantity, 3)
+        self.assertEqual(stock.stock_status, 'CRITICAL')
+        self.assertEqual(stock.total_inventory_cost, 30)
+
+class BulkMovementTest(TestCase):
+    """Tests del endpoint POST /api/inventory/movements/bulk"""
+
+    def setUp(self):
+        for product_id in ("BK001", "BK002"):
+            Product.objects.create(
+                product_id=product_id,
+                product_name=f"Bulk {product_id}",
+                sku=f"SKU{product_id}",
+                unit_of_measure="UN",
+                cost=10.00,
+                sale_price=15.00,
+                category="Test",
+                location="A1",
+                active=True
+            )
+        CurrentStock.objects.create(product_id="BK001", quantity=5)
+        self.claims = decode_access_token(api_main.create_access_token(1, "admin", "Administrador"))
+
+    def post_bulk(self, items):
+        request = api_main.BulkMovementRequest(movements=[
+            api_main.MovementCreate(product_id=p, quantity=q, movement_type=t) for p, q, t in items
+        ])
+        return async_to_sync(api_main.create_movements_bulk)(request=request, claims=self.claims)
+
+    def test_items_are_validated_in_order_against_running_stock(self):
+        response = self.post_bulk([
+            ("BK001", 3, "salida"),
+            ("BK001", 3, "salida"),
+            ("BK002", 10, "entrada"),
+            ("NOEXISTE", 1, "entrada"),
+            ("BK001", 1, "entrada"),
+        ])
+
+        self.assertEqual((response.created, response.rejected), (3, 2))
+        self.assertEqual(
+            [result.error for result in response.results],
+            [None, "No hay suficiente stock disponible", None, "Producto no encontrado", None]
+        )
+        self.assertEqual(response.current_stock, {"BK001": 3, "BK002": 10})
+        self.assertEqual(CurrentStock.objects.get(product_id="BK001").quantity, 3)
+        stock = CurrentStock.objects.get(product_id="BK002")
+        self.assertEqual((stock.quantity, stock.total_inventory_cost), (10, 100))
+        self.assertEqual(InventoryMovement.objects.count(), 3)
+
+    def test_fractional_quantities_are_rejected(self):
+        response = self.post_bulk([
+            ("BK001", Decimal("2.5"), "entrada"),
+            ("BK001", Decimal("2"), "entrada"),
+        ])
+
+        self.assertEqual(
+            [result.error for result in response.results],
+            ["La cantidad del movimiento debe ser un número entero", None]
+        )
+        self.assertEqual(response.current_stock, {"BK001": 7})
+        self.assertEqual(CurrentStock.objects.get(product_id="BK001").quantity, 7)
+        self.assertEqual(InventoryMovement.objects.get().quantity, 2)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        """Test que verifica que la cantidad de consultas no depende de la cantidad de movimientos"""
+        with self.assertNumQueries(7):  # incluye el INSERT del stock de BK002
+            self.post_bulk([("BK001", 1, "entrada"), ("BK002", 1, "entrada")])
+        with self.assertNumQueries(6):
+            self.post_bulk([("BK001" if i % 2 else "BK002", 1, "entrada") for i in range(100)])
+        self.assertEqual(InventoryMovement.objects.count(), 102)
+
+class ImportMovementsCommandTest(TestCase):
+    """Tests del comando import_movements"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        Product.objects.create(
+            product_id="IM002",
+            product_name="Existing Product",
+            sku="SKUIM2",
+            unit_of_measure="UN",
+            cost=2.00,
+            sale_price=3.00,
+            category="Test",
+            location="A1",
+            active=True
+        )
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import_upserts_products_and_rebuilds_stock(self):
+        path = self.write("movimientos.csv", (
+            "movement_id,date,product_id,movement_type,quantity,order_id,product_name,sku,unit_of_measure,cost,sale_price,category,location\n"
+            "IMP1,2024-01-01T10:00:00,IM001,INBOUND,20,ORD1,Imported,SKUIM1,UN,5.00,8.00,Test,B1\n"
+            "IMP2,2024-01-02,IM001,salida,8,,,,,,,,\n"
+            "IMP3,2024-01-03,IM002,entrada,4,,,,,,,,\n"
+            "IMP4,2024-01-03,IM999,entrada,4,,,,,,,,\n"
+            "IMP5,no-es-fecha,IM001,entrada,4,,,,,,,,\n"
+        ))
+        out = StringIO()
+        call_command('import_movements', path, '--batch-size', '2', stdout=out, stderr=StringIO())
+
+        self.assertEqual(Product.objects.get(product_id="IM001").product_name, "Imported")
+        self.assertEqual(
+            sorted(InventoryMovement.objects.values_list('movement_id', flat=True)), ["IMP1", "IMP2", "IMP3"]
+        )
+        self.assertEqual(InventoryMovement.objects.get(movement_id="IMP2").order_id, "IMP2")
+        stock = CurrentStock.objects.get(product_id="IM001")
+        self.assertEqual((stock.quantity, stock.total_inventory_cost), (12, 60))
+        self.assertEqual(CurrentStock.objects.get(product_id="IM002").quantity, 4)
+        self.assertIn("Filas ignoradas: 2", out.getvalue())
+
+    def test_ndjson_import_is_idempotent(self):
+        path = self.write("movimientos.ndjson", "\n".join(json.dumps(row) for row in [
+            {"movement_id": "IMJ1", "date": "2024-02-01T09:00:00Z", "product_id": "IM002",
+             "movement_type": "INBOUND", "quantity": 7},
+            {"movement_id": "IMJ2", "date": "2024-02-02T09:00:00Z", "product_id": "IM002",
+             "movement_type": "OUTBOUND", "quantity": 2},
+        ]))
+        call_command('import_movements', path, stdout=StringIO())
+        call_command('import_movements', path, stdout=StringIO())
+
+        self.assertEqual(InventoryMovement.objects.count(), 2)
+        self.assertEqual(CurrentStock.objects.get(product_id="IM002").quantity, 5)
+
+    def test_import_before_snapshot_mark_survives_reconciliation(self):
+        product = Product.objects.get(product_id="IM002")
+        apply_movement(product, 'INBOUND', 10, movement_id="IMR1", date=timezone.now() - timedelta(hours=1))
+        reconcile_stock()
+
+        path = self.write("historial.ndjson", json.dumps(
+            {"movement_id": "IMH1", "date": "2024-02-01T09:00:00Z", "product_id": "IM002",
+             "movement_type": "INBOUND", "quantity": 7}
+        ))
+        call_command('import_movements', path, stdout=StringIO())
+        self.assertEqual(CurrentStock.objects.get(product_id="IM002").quantity, 17)
+
+        self.assertEqual(reconcile_stock(), [])
+        self.assertEqual(CurrentStock.objects.get(product_id="IM002").quantity, 17)
+        self.assertEqual(stock_as_of("IM002", datetime(2024, 3, 1, tzinfo=dt_timezone.utc))[0], 7)
+
+class UpdateStockReconciliationTest(TestCase):
+    """Tests de la reconciliación masiva de update_stock.py"""
+
+    def setUp(self):
+        now = timezone.now()
+        for i, price in enumerate([5, 50, 50]):
+            product = Product.objects.create(
+                product_id=f"US{i}",
+                product_name=f"Reconcile {i}",
+                sku=f"SKUUS{i}",
+                unit_of_measure="UN",
+                cost=1.00,
+                sale_price=price,
+                category="Test",
+                location="A1",
+                active=True
+            )
+            for j, (movement_type, quantity) in enumerate([('INBOUND', 30), ('OUTBOUND', 4), ('ADJUSTMENT_OUT', 1)]):
+                InventoryMovement.objects.create(
+                    movement_id=f"US{i}{j}", date=now, product=product,
+                    movement_type=movement_type, quantity=quantity, order_id=f"ORDUS{i}{j}"
+                )
+        # US0 con umbral desactualizado, US1 correcto y US2 sin registro de stock
+        CurrentStock.objects.create(product_id="US0", quantity=25, threshold=5)
+        CurrentStock.objects.create(product_id="US1", quantity=25, threshold=15)
+
+    def calculate_stock(self, **kwargs):
+        import update_stock
+        with redirect_stdout(StringIO()):
+            return update_stock.calculate_stock(**kwargs)
+
+    def test_dry_run_reports_without_writing(self):
+        with self.assertNumQueries(2):
+            differences = self.calculate_stock(dry_run=True)
+
+        self.assertEqual([product.product_id for product, *_ in differences], ["US0", "US2"])
+        self.assertEqual(CurrentStock.objects.get(product_id="US0").threshold, 5)
+        self.assertFalse(CurrentStock.objects.filter(product_id="US2").exists())
+
+    def test_reconciliation_fixes_only_differences(self):
+        self.calculate_stock()
+
+        stocks = {stock.product_id: stock for stock in CurrentStock.objects.all()}
+        self.assertEqual({pid: (s.quantity, s.threshold) for pid, s in stocks.items()},
+                         {"US0": (25, 50), "US1": (25, 15), "US2": (25, 15)})
+        self.assertEqual(stocks["US0"].stock_status, 'CRITICAL')
+        self.assertEqual(stocks["US2"].total_inventory_cost, 25)
+        self.assertEqual(self.calculate_stock(dry_run=True), [])
+
+class StockSnapshotTest(TestCase):
+    """Tests de los puntos de control de stock y la reconciliación incremental"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        for product_id in ("SN001", "SN002"):
+            Product.objects.create(
+                product_id=product_id,
+                product_name=f"Snapshot {product_id}",
+                sku=f"SKU{product_id}",
+                unit_of_measure="UN",
+                cost=1.00,
+                sale_price=2.00,
+                category="Test",
+                location="A1",
+                active=True
+            )
+        self.add_movement("SNA1", "SN001", 'INBOUND', 10, days_ago=5)
+        self.add_movement("SNA2", "SN001", 'OUTBOUND', 3, days_ago=4)
+        self.add_movement("SNB1", "SN002", 'INBOUND', 7, days_ago=3)
+
+    def add_movement(self, movement_id, product_id, movement_type, quantity, days_ago=0, seconds_ago=0):
+        InventoryMovement.objects.create(
+            movement_id=movement_id,
+            date=self.now - timedelta(days=days_ago, seconds=seconds_ago),
+            product_id=product_id,
+            movement_type=movement_type,
+            quantity=quantity,
+            order_id=movement_id
+        )
+
+    def snapshots(self, product_id):
+        return list(
+            StockSnapshot.objects.filter(product_id=product_id)
+            .order_by('as_of_date', 'as_of_movement_id').values_list('quantity', flat=True)
+        )
+
+    def test_reconciliation_only_adds_new_movements(self):
+        self.assertEqual(len(reconcile_stock()), 2)
+        self.assertEqual(self.snapshots("SN001"), [7])
+        self.assertEqual(CurrentStock.objects.get(product_id="SN002").quantity, 7)
+
+        # Movimiento nuevo de SN001 y uno dentro de la ventana de confirmación
+        self.add_movement("SNA3", "SN001", 'OUTBOUND', 2, days_ago=1)
+        self.add_movement("SNB2", "SN002", 'INBOUND', 1, seconds_ago=10)
+        self.assertEqual(advance_stock_snapshots(), 1)
+
+        self.assertEqual(self.snapshots("SN001"), [7, 5])
+        self.assertEqual(self.snapshots("SN002"), [7])
+        self.assertEqual(expected_stock_quantities(), {"SN001": 5, "SN002": 8})
+
+    def test_backdated_movements_invalidate_later_snapshots(self):
+        reconcile_stock()
+        self.add_movement("SNOLD", "SN002", 'INBOUND', 5, days_ago=10)
+
+        out = StringIO()
+        call_command('reconcile_stock', '--dry-run', stdout=out)
+        self.assertIn("Productos con diferencias: 1", out.getvalue())
+        self.assertEqual(stock_as_of("SN002", self.now)[0], 12)
+
+        reconcile_stock()
+        self.assertEqual(self.snapshots("SN002"), [12])
+        self.assertEqual(CurrentStock.objects.get(product_id="SN002").quantity, 12)
+        self.assertFalse(StockSnapshotInvalidation.objects.exists())
+
+    def test_editing_a_movement_date_invalidates_from_the_old_date(self):
+        reconcile_stock()
+        movement = InventoryMovement.objects.get(movement_id="SNA1")
+        movement.date = self.now - timedelta(days=1)
+        movement.save()
+
+        self.assertEqual(stock_as_of("SN001", self.now - timedelta(days=2))[0], -3)
+        self.assertEqual(stocks_as_of(self.now)[0]["SN001"], 7)
+
+    def test_bulk_deletes_record_one_invalidation(self):
+        reconcile_stock()
+        InventoryMovement.objects.filter(product_id="SN001").delete()
+        self.assertEqual(StockSnapshotInvalidation.objects.count(), 1)
+        self.assertEqual(stocks_as_of(self.now)[0]["SN001"], 0)
+
+        # Al borrar el producto sus puntos de control se van en la misma cascada
+        Product.objects.filter(product_id="SN002").delete()
+        self.assertEqual(StockSnapshotInvalidation.objects.count(), 1)
+        self.assertFalse(StockSnapshot.objects.filter(product_id="SN002").exists())
+
+    def test_backdated_apply_movement_survives_reconciliation(self):
+        product = Product.objects.create(
+            product_id="SN003", product_name="Snapshot SN003", sku="SKUSN003", unit_of_measure="UN",
+            cost=1.00, sale_price=2.00, category="Test", location="A1"
+        )
+        apply_movement(product, 'INBOUND', 10, movement_id="SNC1", date=self.now - timedelta(hours=1))
+        reconcile_stock()
+        apply_movement(product, 'INBOUND', 5, movement_id="SNC2", date=self.now - timedelta(days=3))
+        self.assertEqual(CurrentStock.objects.get(product_id="SN003").quantity, 15)
+
+        self.assertEqual(reconcile_stock(), [])
+        self.assertEqual(CurrentStock.objects.get(product_id="SN003").quantity, 15)
+        self.assertEqual(stocks_as_of(self.now)[0]["SN003"], 15)
+        self.assertEqual(stock_as_of("SN003", self.now - timedelta(days=2))[0], 5)
+
+    def test_stock_as_of_uses_checkpoint_and_delta(self):
+        reconcile_stock()
+        self.add_movement("SNA3", "SN001", 'OUTBOUND', 2, days_ago=1)
+        self.add_movement("SNB2", "SN002", 'INBOUND', 4, days_ago=1)
+        advance_stock_snapshots()
+        self.add_movement("SNA4", "SN001", 'INBOUND', 6, seconds_ago=10)
+
+        # Antes de cualquier punto de control se suman los movimientos hasta la fecha
+        quantity, mark = stock_as_of("SN001", self.now - timedelta(days=4, hours=12))
+        self.assertEqual((quantity, mark), (10, None))
+        self.assertEqual(stock_as_of("SN001", self.now - timedelta(days=2))[0], 7)
+        self.assertEqual(stock_as_of("SN001", self.now)[0], 11)
+
+        quantities, _ = stocks_as_of(self.now - timedelta(days=2))
+        self.assertEqual(quantities, {"SN001": 7, "SN002": 7})
+        self.assertEqual(stocks_as_of(self.now)[0], {"SN001": 11, "SN002": 11})
+
+    def test_as_of_endpoints(self):
+        reconcile_stock()
+        claims = decode_access_token(api_main.create_access_token(1, "admin", "Administrador"))
+        when = (self.now - timedelta(days=3, hours=12)).replace(tzinfo=None)
+
+        response = async_to_sync(api_main.get_stock_as_of)(product_id="SN001", date=self.now, claims=claims)
+        self.assertEqual(response["quantity"], 7)
+        self.assertEqual(response["checkpoint_movement_id"], "SNB1")
+
+        first = async_to_sync(api_main.get_stocks_as_of)(date=when, cursor=None, limit=1, claims=claims)
+        self.assertEqual([item["product_id"] for item in first["items"]], ["SN001"])
+        second = async_to_sync(api_main.get_stocks_as_of)(
+            date=when, cursor=first["next_cursor"], limit=1, claims=claims
+        )
+        self.assertEqual(second["items"][0]["quantity"], 0)
+        self.assertIsNone(second["next_cursor"])
+
+        with self.assertRaises(HTTPException) as error:
+            async_to_sync(api_main.get_stock_as_of)(product_id="NOPE", date=self.now, claims=claims)
+        self.assertEqual(error.exception.status_code, 404)
+
+class DashboardAggregatesTest(TestCase):
+    """Tests de los totales del dashboard calculados sólo con lecturas"""
+
+    def setUp(self):
+        for i, quantity in enumerate([0, 3, 40]):
+            product = Product.objects.create(
+                product_id=f"DB{i}",
+                product_name=f"Dashboard {i}",
+                sku=f"DB-{i}",
+                unit_of_measure="UN",
+                cost=2.00,
+                sale_price=5.00,
+                category="Test",
+                location="D1"
+            )
+            CurrentStock.objects.create(product=product, quantity=quantity, threshold=5)
+        cache.clear()
+
+    def test_home_does_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        statements = [query['sql'].split()[0].upper() for query in queries]
+        self.assertEqual(set(statements), {'SELECT'})
+        self.assertLessEqual(len(statements), 6)
+
+        self.assertEqual(response.context['total_stock'], 43)
+        self.assertEqual(response.context['critical_stock_count'], 2)
+        self.assertEqual([stock.product_id for stock in response.context['critical_stock']], ["DB0", "DB1"])
+
+    def test_cost_change_refreshes_stock_cost(self):
+        product = Product.objects.get(product_id="DB2")
+        product.cost = 3
+        product.save()
+        refresh_stock_cost(product)
+        self.assertEqual(CurrentStock.objects.get(product=product).total_inventory_cost, 120)
+
+    def test_blocks_are_cached_until_a_write_invalidates_them(self):
+        self.client.get('/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+        self.assertEqual(response.context['total_stock'], 43)
+
+        # Una venta invalida los totales y la actividad pero no se recalcula hasta confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_movement(Product.objects.get(product_id="DB2"), 'OUTBOUND', 38, movement_id="DBOUT1")
+        response = self.client.get('/')
+        self.assertEqual(response.context['total_stock'], 5)
+        self.assertEqual(response.context['critical_stock_count'], 3)
+        self.assertEqual(response.context['movements_today'], 1)
+
+    def test_bulk_writes_invalidate_dashboard(self):
+        self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_movements_bulk([
+                InventoryMovement(
+                    movement_id="DBIN1", date=timezone.now(), product_id="DB0",
+                    movement_type='INBOUND', quantity=10, order_id="DBIN1"
+                )
+            ])
+        self.assertEqual(self.client.get('/').context['critical_stock_count'], 1)
+
+    def test_forecasts_endpoint_pages_by_risk(self):
+        for stock in CurrentStock.objects.select_related('product'):
+            StockForecast.objects.create(product=stock.product, predictions=[])
+
+        first = self.client.get('/dashboard/forecasts/', {'limit': 2}).json()
+        self.assertEqual([p['product']['id'] for p in first['results']], ["DB0", "DB1"])
+        second = self.client.get('/dashboard/forecasts/', {'limit': 2, 'cursor': first['next_cursor']}).json()
+        self.assertEqual([p['product']['id'] for p in second['results']], ["DB2"])
+        self.assertIsNone(second['next_cursor'])
+
+        self.assertEqual(self.client.get('/dashboard/forecasts/', {'cursor': 'x'}).status_code, 400)
+
+class ProductCatalogTest(TestCase):
+    """Tests del listado de productos paginado, filtrado y con ETag"""
+
+    def setUp(self):
+        for i in range(5):
+            Product.objects.create(
+                product_id=f"CAT{i}",
+                product_name=f"Catálogo {i}",
+                sku=f"CAT-{i}",
+                unit_of_measure="UN",
+                cost=1.00,
+                sale_price=2.00,
+                category="Bebidas" if i % 2 == 0 else "Limpieza",
+                location="C1",
+                active=i != 4
+            )
+
+    def list_products(self, **kwargs):
+        params = dict(
+            response=Response(), category=None, location=None, active=None, fields=None,
+            cursor=None, limit=100, if_none_match=None, if_modified_since=None, claims=None
+        )
+        params.update(kwargs)
+        return async_to_sync(api_main.get_products)(**params)
+
+    def test_filters_pagination_and_fields(self):
+        first = self.list_products(category="Bebidas", active=True, fields="sku", limit=1)
+        self.assertEqual(first["items"], [{"product_id": "CAT0", "sku": "CAT-0"}])
+        second = self.list_products(category="Bebidas", active=True, fields="sku", limit=1, cursor=first["next_cursor"])
+        self.assertEqual([item["product_id"] for item in second["items"]], ["CAT2"])
+        self.assertIsNone(second["next_cursor"])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.list_products(fields="sku")
+        self.assertNotIn("product_name", queries[-1]['sql'])
+
+        with self.assertRaises(HTTPException) as error:
+            self.list_products(fields="sku,secreto")
+        self.assertEqual(error.exception.status_code, 400)
+
+    def test_etag_not_modified_until_catalog_changes(self):
+        response = Response()
+        self.list_products(response=response)
+        etag = response.headers["ETag"]
+
+        with self.assertNumQueries(1):
+            cached = self.list_products(if_none_match=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        product = Product.objects.get(product_id="CAT1")
+        product.sale_price = 3
+        product.save()
+        self.assertEqual(self.list_products(if_none_match=etag, response=Response())["items"][1]["sale_price"], 3)
+
+class ProductSearchTest(TestCase):
+    """Tests de la búsqueda de productos (trie en SQLite)"""
+
+    def setUp(self):
+        for product_id, name, sku in [
+            ("7790001", "Gaseosa Cola 500ml", "GAS-500"),
+            ("7790002", "Gaseosa Naranja 500ml", "GAS-501"),
+            ("7790003", "Agua Mineral 2L", "AGU-2000"),
+        ]:
+            Product.objects.create(
+                product_id=product_id, product_name=name, sku=sku, unit_of_measure="UN",
+                cost=1.00, sale_price=2.00, category="Bebidas", location="S1"
+            )
+        # Los productos de cada test se revierten sin confirmar: el trie se rehace
+        search.invalidate_search_index()
+
+    def ids(self, query):
+        return [product.product_id for product in search_products(query)]
+
+    def test_prefix_and_exact_matches(self):
+        self.assertEqual(self.ids("gaseosa"), ["7790001", "7790002"])
+        self.assertEqual(self.ids("gas nar"), ["7790002"])
+        # Un código escaneado coincide exacto y va primero
+        self.assertEqual(self.ids("GAS-501"), ["7790002"])
+        self.assertEqual(self.ids("7790003"), ["7790003"])
+        self.assertEqual(self.ids("café"), [])
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.ids("agua"), ["7790003"])
+        product = Product.objects.get(product_id="7790003")
+        product.product_name = "Soda 2L"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.ids("agua"), [])
+        self.assertEqual(self.ids("soda"), ["7790003"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(product_id="7790001").delete()
+        self.assertEqual(self.ids("gaseosa"), ["7790002"])
+
+    def test_single_edit_updates_the_trie_without_rebuilding(self):
+        self.ids("gaseosa")
+        product = Product.objects.get(product_id="7790002")
+        product.product_name = "Gaseosa Pomelo 500ml"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        # Sin recorrer el catálogo: sólo la consulta de los resultados
+        with self.assertNumQueries(1):
+            self.assertEqual(self.ids("pomelo"), ["7790002"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids("naranja"), [])
+        # Las palabras que ya no usa ningún producto se podan del trie
+        self.assertNotIn("n", search._get_trie().root)
+
+    def test_changes_from_other_processes_rebuild_the_trie(self):
+        self.assertEqual(self.ids("agua"), ["7790003"])
+        Product.objects.filter(product_id="7790003").update(product_name="Soda 2L")
+        # Otro proceso guardó el producto e incrementó la versión compartida
+        cache.incr(search.CATALOG_VERSION_KEY)
+        self.assertEqual(self.ids("soda"), ["7790003"])
+        self.assertEqual(self.ids("agua"), [])
+
+    def test_endpoint_is_not_shadowed_by_product_id_route(self):
+        paths = [route.path for route in api_main.app.routes]
+        self.assertLess(paths.index("/api/products/search"), paths.index("/api/products/{product_id}"))
+        results = async_to_sync(api_main.search_products_endpoint)(q="mineral", limit=5, claims=None)
+        self.assertEqual([product.product_id for product in results], ["7790003"])
+
+
+class ConditionalGetTest(TestCase):
+    """Tests de ETag/Last-Modified en el stock actual y el detalle de producto"""
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            product_id="CG1", product_name="Condicional", sku="CG-1", unit_of_measure="UN",
+            cost=1.00, sale_price=2.00, category="Test", location="G1"
+        )
+        CurrentStock.objects.create(product=self.product, quantity=10)
+
+    def get_stock(self, **headers):
+        response = Response()
+        result = async_to_sync(api_main.get_current_stock)(
+            response=response, if_none_match=headers.get('etag'),
+            if_modified_since=headers.get('since'), claims=None
+        )
+        return result, response
+
+    def test_stock_not_modified_until_a_movement(self):
+        body, response = self.get_stock()
+        self.assertEqual(body[0]["quantity"], 10)
+        etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+
+        with self.assertNumQueries(1):
+            cached, _ = self.get_stock(etag=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.headers["ETag"], etag)
+        self.assertEqual(self.get_stock(since=last_modified)[0].status_code, 304)
+
+        apply_movement(self.product, 'OUTBOUND', 3, movement_id="CGOUT1")
+        body, _ = self.get_stock(etag=etag)
+        self.assertEqual(body[0]["quantity"], 7)
+
+    def test_product_etag(self):
+        response = Response()
+        async_to_sync(api_main.get_product)(
+            product_id="CG1", response=response, if_none_match=None, if_modified_since=None, claims=None
+        )
+        etag = response.headers["ETag"]
+        cached = async_to_sync(api_main.get_product)(
+            product_id="CG1", response=Response(), if_none_match=etag, if_modified_since=None, claims=None
+        )
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.body, b"")
+
+        self.product.sale_price = 3
+        self.product.save()
+        product = async_to_sync(api_main.get_product)(
+            product_id="CG1", response=Response(), if_none_match=etag, if_modified_since=None, claims=None
+        )
+        self.assertEqual(product.sale_price, 3)
+
+@override_settings(STOCK_CHANGES_LAG_SECONDS=0)
+class StockChangesTest(TestCase):
+    """Tests de la sincronización incremental de stock por cursor"""
+
+    def setUp(self):
+        for i in range(3):
+            product = Product.objects.create(
+                product_id=f"SY{i}", product_name=f"Sync {i}", sku=f"SY-{i}", unit_of_measure="UN",
+                cost=1.00, sale_price=2.00, category="Test", location="Y1"
+            )
+            CurrentStock.objects.create(product=product, quantity=10 + i)
+        CurrentStock.objects.update(last_updated=timezone.now() - timedelta(minutes=5))
+
+    def changes(self, since=None, limit=1000):
+        return async_to_sync(api_main.get_stock_changes)(since=since, limit=limit, claims=None)
+
+    def test_only_rows_changed_since_cursor(self):
+        first = self.changes(limit=2)
+        self.assertEqual([row["product_id"] for row in first["items"]], ["SY0", "SY1"])
+        self.assertTrue(first["has_more"])
+        rest = self.changes(first["next_cursor"])
+        self.assertEqual([row["product_id"] for row in rest["items"]], ["SY2"])
+        self.assertFalse(rest["has_more"])
+
+        # Sin cambios el cursor no avanza
+        idle = self.changes(rest["next_cursor"])
+        self.assertEqual((idle["items"], idle["next_cursor"]), ([], rest["next_cursor"]))
+
+        apply_movement(Product.objects.get(product_id="SY1"), 'OUTBOUND', 4, movement_id="SYOUT1")
+        delta = self.changes(rest["next_cursor"])
+        self.assertEqual([(row["product_id"], row["quantity"]) for row in delta["items"]], [("SY1", 7)])
+
+    @override_settings(STOCK_CHANGES_LAG_SECONDS=60)
+    def test_recent_writes_wait_for_the_lag(self):
+        cursor = self.changes()["next_cursor"]
+        apply_movement(Product.objects.get(product_id="SY0"), 'INBOUND', 1, movement_id="SYIN1")
+        self.assertEqual(self.changes(cursor)["items"], [])
+
+class RealtimeFeedTest(TestCase):
+    """Tests del canal de cambios de stock en tiempo real"""
+
+    def setUp(self):
+        self.milk = Product.objects.create(
+            product_id="RT1", product_name="Leche", sku="RT-1", unit_of_measure="UN",
+            cost=1.00, sale_price=2.00, category="Lácteos", location="R1"
+        )
+        self.soap = Product.objects.create(
+            product_id="RT2", product_name="Jabón", sku="RT-2", unit_of_measure="UN",
+            cost=1.00, sale_price=2.00, category="Limpieza", location="R1"
+        )
+
+    def write_movements(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_movement(self.milk, 'INBOUND', 5, movement_id="RTIN1")
+            apply_movement(self.soap, 'INBOUND', 5, movement_id="RTIN2")
+
+    def test_committed_changes_reach_filtered_subscribers(self):
+        async def scenario():
+            subscriber = realtime.broker.subscribe(realtime.SubscriptionFilter.from_params(category="Lácteos"))
+            try:
+                await sync_to_async(self.write_movements)()
+                events = []
+                while not events or events[-1]["type"] != realtime.HEARTBEAT_EVENT:
+                    events.append(await subscriber.get(0.2))
+            finally:
+                realtime.broker.unsubscribe(subscriber)
+            return events[:-1]
+
+        events = async_to_sync(scenario)()
+        # Sólo llegan los cambios de la categoría pedida, un stock por movimiento
+        self.assertEqual({event["product_id"] for event in events}, {"RT1"})
+        self.assertEqual([event["type"] for event in events], ["movement", "stock"])
+        self.assertEqual(events[-1]["quantity"], 5)
+
+    def test_api_movement_events_are_json(self):
+        claims = decode_access_token(api_main.create_access_token(1, "admin", "Administrador"))
+        movement = api_main.MovementCreate(product_id="RT1", quantity=Decimal("5"), movement_type="entrada")
+
+        def create_movement():
+            with self.captureOnCommitCallbacks(execute=True):
+                async_to_sync(api_main.create_movement)(movement=movement, claims=claims)
+
+        async def scenario():
+            subscriber = realtime.broker.subscribe(realtime.SubscriptionFilter())
+            stream = realtime.sse_events(subscriber)
+            try:
+                await sync_to_async(create_movement)()
+                return [await stream.__anext__() for _ in range(2)]
+            finally:
+                await stream.aclose()
+
+        chunks = async_to_sync(scenario)()
+        self.assertTrue(chunks[0].startswith("event: movement\n"))
+        self.assertTrue(chunks[1].startswith("event: stock\n"))
+        self.assertEqual(json.loads(chunks[1].split("data: ", 1)[1])["quantity"], 5)
+        self.assertFalse(realtime.broker.has_subscribers)
+
+    def test_slow_subscriber_gets_overflow(self):
+        async def scenario():
+            subscriber = realtime.Subscriber(asyncio.get_running_loop(), realtime.SubscriptionFilter(), max_queue=2)
+            for quantity in range(3):
+                subscriber.offer({"type": "stock", "product_id": "RT1", "category": "Lácteos",
+                                  "stock_status": "OK", "quantity": quantity})
+            return [await subscriber.get(0.1) for _ in range(2)]
+
+        events = async_to_sync(scenario)()
+        self.assertEqual([event["type"] for event in events], ["overflow", "heartbeat"])
+
+    def test_websocket_streams_events(self):
+        token = api_main.create_access_token(1, "admin", "Administrador")
+
+        async def scenario():
+            incoming, sent = asyncio.Queue(), []
+            await incoming.put({"type": "websocket.connect"})
+            scope = {
+                "type": "websocket", "path": "/api/ws/stock", "raw_path": b"/api/ws/stock",
+                "query_string": f"token={token}&types=stock".encode(), "headers": [],
+                "scheme": "ws", "server": ("testserver", 80), "client": ("test", 1),
+                "root_path": "", "subprotocols": [],
+            }
+
+            async def send(message):
+                sent.append(message)
+                if message["type"] == "websocket.accept":
+                    realtime.broker.publish({"type": "movement", "product_id": "RT1", "category": "Lácteos"})
+                    realtime.broker.publish({"type": "stock", "product_id": "RT1", "category": "Lácteos",
+                                             "stock_status": "OK", "quantity": 5})
+                elif message["type"] == "websocket.send":
+                    await incoming.put({"type": "websocket.disconnect", "code": 1000})
+
+            await asyncio.wait_for(api_main.app(scope, incoming.get, send), 5)
+            return sent
+
+        sent = async_to_sync(scenario)()
+        self.assertEqual(sent[0]["type"], "websocket.accept")
+        self.assertEqual(json.loads(sent[1]["text"])["type"], "stock")
+        self.assertFalse(realtime.broker.has_subscribers)
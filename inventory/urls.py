@@ -5,4 +5,5 @@ app_name = 'inventory'
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('dashboard/forecasts/', views.dashboard_forecasts, name='dashboard_forecasts'),
 ] 
\ No newline at end of file
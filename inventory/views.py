@@ -1,10 +1,13 @@
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Sum, F, Q
-from .models import Product, InventoryMovement, CurrentStock
+from django.db.models import Count, Sum, F, Q
+from .models import Product, InventoryMovement, CurrentStock, StockForecast
+from .dashboard import get_block
+from api.pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor
 from django.views.decorators.csrf import csrf_exempt
-from api.predictor import AdvancedStockPredictor
 from django.core.serializers.json import DjangoJSONEncoder
 import json
 import logging
@@ -12,6 +15,9 @@ import logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Estados de CurrentStock que se muestran como alerta en el dashboard
+CRITICAL_STATUSES = ('CRITICAL', 'OUT_OF_STOCK')
+
 # Create your views here.
 
 def get_stock_threshold(product):
@@ -54,109 +60,123 @@ def serialize_prediction_data(prediction):
         logger.error(f"Error serializando predicción: {str(e)}")
         return None
 
+def _totals_block():
+    """Productos activos, stock total y cantidad de productos en alerta"""
+    total_products = Product.objects.filter(active=True).count()
+    logger.info(f"Total productos activos: {total_products}")
+
+    # Totales con agregados en la base; el estado de cada fila lo mantienen
+    # las escrituras (CurrentStock.save, apply_movement y las cargas masivas)
+    totals = CurrentStock.objects.aggregate(
+        total_stock=Sum('quantity'),
+        critical_stock_count=Count('pk', filter=Q(stock_status__in=CRITICAL_STATUSES))
+    )
+    logger.info(f"Stock total: {totals['total_stock'] or 0}")
+    return {
+        'total_products': total_products,
+        'total_stock': totals['total_stock'] or 0,
+        'critical_stock_count': totals['critical_stock_count'],
+        'has_forecasts': StockForecast.objects.filter(product__active=True).exists(),
+    }
+
+def _critical_stock_block():
+    # Productos con stock crítico o agotado (usa el índice parcial curstock_critical_idx)
+    critical_stock = list(
+        CurrentStock.objects.filter(stock_status__in=CRITICAL_STATUSES)
+        .select_related('product').order_by('quantity', 'product_id')
+    )
+    logger.info(f"Productos en stock crítico: {len(critical_stock)}")
+    return {'critical_stock': critical_stock}
+
+def _activity_block():
+    """Movimientos de hoy y los 10 más recientes"""
+    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    movements_today = InventoryMovement.objects.filter(
+        date__gte=today_start
+    ).count()
+    logger.info(f"Movimientos hoy: {movements_today}")
+
+    recent_movements = list(InventoryMovement.objects.select_related('product').all().order_by('-date')[:10])
+    return {'movements_today': movements_today, 'recent_movements': recent_movements}
+
+def _forecasts_page(after, limit):
+    """
+    Página de pronósticos ordenada por riesgo: primero los productos con menos
+    stock por encima de su umbral. Devuelve (pronósticos serializados, clave
+    de la última fila o None si no hay más).
+    """
+    forecasts = StockForecast.objects.filter(
+        product__active=True,
+        product__currentstock__isnull=False
+    ).select_related('product', 'product__currentstock').annotate(
+        margin=F('product__currentstock__quantity') - F('product__currentstock__threshold')
+    ).order_by('margin', 'product_id')
+    if after is not None:
+        margin, product_id = after
+        forecasts = forecasts.filter(Q(margin__gt=margin) | Q(margin=margin, product_id__gt=product_id))
+
+    page = list(forecasts[:limit + 1])
+    serialized_predictions = []
+    for forecast in page[:limit]:
+        stock = forecast.product.currentstock
+        prediction_data = {
+            'product': forecast.product,
+            'current_stock': stock.quantity,
+            'threshold': stock.threshold,
+            'predictions': forecast.predictions
+        }
+        serialized_prediction = serialize_prediction_data(prediction_data)
+        if serialized_prediction:
+            serialized_predictions.append(serialized_prediction)
+
+    next_key = None
+    if len(page) > limit:
+        last = page[limit - 1]
+        next_key = [last.margin, last.product_id]
+    logger.info(f"Pronósticos devueltos: {len(serialized_predictions)}")
+    return serialized_predictions, next_key
+
+def _first_forecasts_block():
+    predictions, next_key = _forecasts_page(None, settings.DASHBOARD_FORECAST_PAGE_SIZE)
+    return {'results': predictions, 'next_cursor': encode_cursor(*next_key) if next_key else None}
+
+def dashboard_forecasts(request):
+    """
+    Pronósticos del dashboard en JSON, paginados por cursor y con los
+    productos en riesgo primero. main.js los pide después de mostrar la página.
+    """
+    cursor = request.GET.get('cursor')
+    try:
+        limit = int(request.GET.get('limit', settings.DASHBOARD_FORECAST_PAGE_SIZE))
+        after = decode_cursor(cursor, 2) if cursor else None
+        if after is not None and not isinstance(after[0], int):
+            raise ValueError("Cursor inválido")
+    except ValueError as e:
+        return JsonResponse({'error': str(e) or 'Parámetros inválidos'}, status=400)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    # La primera página es la que piden todas las visitas: se guarda en caché
+    if after is None and limit == settings.DASHBOARD_FORECAST_PAGE_SIZE:
+        return JsonResponse(get_block('predictions', _first_forecasts_block))
+
+    predictions, next_key = _forecasts_page(after, limit)
+    return JsonResponse({
+        'results': predictions,
+        'next_cursor': encode_cursor(*next_key) if next_key else None
+    })
+
 @csrf_exempt
 def home(request):
     try:
         logger.info("Iniciando vista home")
-        
-        # Get dashboard statistics
-        total_products = Product.objects.filter(active=True).count()
-        logger.info(f"Total productos activos: {total_products}")
-        
-        # Obtener todos los stocks actuales
-        current_stocks = CurrentStock.objects.select_related('product').all()
-        total_stock = sum(stock.quantity for stock in current_stocks)
-        logger.info(f"Stock total: {total_stock}")
-        
-        # Filtrar productos con stock crítico o agotado
-        critical_stock = []
-        critical_stock_count = 0
-        
-        for stock in current_stocks:
-            if stock.quantity <= 0:
-                stock.stock_status = 'OUT_OF_STOCK'
-                critical_stock.append(stock)
-                critical_stock_count += 1
-            elif stock.quantity <= stock.threshold:
-                stock.stock_status = 'CRITICAL'
-                critical_stock.append(stock)
-                critical_stock_count += 1
-            else:
-                stock.stock_status = 'OK'
-            stock.save()
-        
-        logger.info(f"Productos en stock crítico: {critical_stock_count}")
-        
-        # Get today's movements
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        movements_today = InventoryMovement.objects.filter(
-            date__gte=today_start
-        ).count()
-        logger.info(f"Movimientos hoy: {movements_today}")
-        
-        # Get recent movements (last 10)
-        recent_movements = InventoryMovement.objects.select_related('product').all().order_by('-date')[:10]
-        
-        # Obtener predicciones para todos los productos
-        predictor = AdvancedStockPredictor()
-        serialized_predictions = []
-        
-        logger.info("Generando predicciones para productos")
-        for stock in current_stocks:
-            try:
-                logger.info(f"Procesando predicción para {stock.product.product_name}")
-                # Obtener historial de movimientos de los últimos 30 días
-                thirty_days_ago = timezone.now() - timedelta(days=30)
-                movements = InventoryMovement.objects.filter(
-                    product=stock.product,
-                    date__gte=thirty_days_ago
-                ).order_by('date')
-                
-                logger.info(f"Movimientos encontrados: {movements.count()}")
-                
-                historical_data = [
-                    {
-                        'date': movement.date,
-                        'quantity': movement.quantity
-                    }
-                    for movement in movements
-                ]
-                
-                if len(historical_data) >= 2:
-                    logger.info("Generando predicción...")
-                    next_week_pred = predictor.predict_next_days(historical_data, 7)
-                    prediction_data = {
-                        'product': stock.product,
-                        'current_stock': stock.quantity,
-                        'threshold': stock.threshold,
-                        'predictions': next_week_pred
-                    }
-                    serialized_prediction = serialize_prediction_data(prediction_data)
-                    if serialized_prediction:
-                        serialized_predictions.append(serialized_prediction)
-                        logger.info(f"Predicción generada exitosamente para {stock.product.product_name}")
-                else:
-                    logger.warning(f"No hay suficientes datos históricos para {stock.product.product_name}")
-            except Exception as e:
-                logger.error(f"Error al predecir para {stock.product.product_name}: {str(e)}")
-        
-        # Convertir predicciones a JSON
-        try:
-            predictions_json = json.dumps(serialized_predictions, cls=DjangoJSONEncoder)
-            logger.info(f"Total de predicciones generadas: {len(serialized_predictions)}")
-        except Exception as e:
-            logger.error(f"Error al serializar predicciones a JSON: {str(e)}")
-            predictions_json = "[]"
-        
-        context = {
-            'total_products': total_products,
-            'total_stock': total_stock,
-            'movements_today': movements_today,
-            'critical_stock_count': critical_stock_count,
-            'recent_movements': recent_movements,
-            'critical_stock': critical_stock,
-            'predictions': predictions_json,
-        }
+
+        # Cada bloque se lee de la caché y sólo se recalcula si venció o si
+        # una escritura lo invalidó (ver inventory/signals.py). Los pronósticos
+        # no se incluyen: main.js los pide a dashboard_forecasts
+        context = {}
+        context.update(get_block('totals', _totals_block))
+        context.update(get_block('critical_stock', _critical_stock_block))
+        context.update(get_block('activity', _activity_block))
         
         logger.info("Vista home completada exitosamente")
         return render(request, 'home.html', context)
@@ -17,6 +17,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
 django_app = get_asgi_application()
 
 async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        # Django no maneja lifespan: los eventos de arranque y cierre de FastAPI
+        # (pool de predicciones, verificación de revocaciones) van a la API
+        return await fastapi_app(scope, receive, send)
     if scope["type"] == "http":
         path = scope["path"]
         # Rutas que deben ser manejadas por FastAPI
@@ -24,4 +28,7 @@ async def application(scope, receive, send):
             return await fastapi_app(scope, receive, send)
         # Para todas las demás rutas, usar Django
         return await django_app(scope, receive, send)
+    if scope["type"] == "websocket" and scope["path"].startswith("/api/"):
+        # Canal de stock en tiempo real (/api/ws/stock)
+        return await fastapi_app(scope, receive, send)
     return await django_app(scope, receive, send)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 import sys
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -92,10 +93,17 @@ DATABASES = {
 
 # Configuración de base de datos para tests
 if 'test' in sys.argv:
+    # Base en archivo (y no en memoria) para que los tests de concurrencia
+    # usen conexiones independientes que esperan el lock de escritura. Va al
+    # directorio temporal con el pid en el nombre: no queda en el repositorio
+    # y dos ejecuciones simultáneas no comparten la base
+    TEST_DB_PATH = os.path.join(tempfile.gettempdir(), f'inventory_test_{os.getpid()}.sqlite3')
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': ':memory:',
+            'NAME': TEST_DB_PATH,
+            'OPTIONS': {'timeout': 30},
+            'TEST': {'NAME': TEST_DB_PATH},
         }
     }
 
@@ -144,3 +152,85 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Pronósticos de stock precalculados (ver inventory/forecasting.py)
+FORECAST_HORIZON_DAYS = 7
+FORECAST_HISTORY_DAYS = 30
+# Antigüedad máxima de un pronóstico aunque no lleguen movimientos nuevos
+FORECAST_MAX_AGE_SECONDS = 24 * 60 * 60
+# Productos por lote del worker y paralelismo de AdvancedStockPredictor.predict_many
+FORECAST_BATCH_SIZE = 500
+FORECAST_MAX_WORKERS = None  # Procesos del pool compartido; None = cantidad de CPUs
+FORECAST_CHUNK_SIZE = None  # None = unas cuatro tareas por proceso
+# Ejecutor de la API para entrenar modelos fuera del event loop: hilos
+# dedicados y máximo de predicciones en cola antes de responder 503
+FORECAST_EXECUTOR_WORKERS = 2
+FORECAST_EXECUTOR_MAX_PENDING = 16
+# Intervalo entre pasadas del worker `manage.py refresh_forecasts --loop`
+FORECAST_REFRESH_INTERVAL_SECONDS = 300
+
+# Tokens de la API: JWT firmados con SECRET_KEY que llevan el id y el rol del
+# usuario, de modo que cada petición se autentica sin consultar la base
+API_TOKEN_EXPIRE_MINUTES = int(os.environ.get('API_TOKEN_EXPIRE_MINUTES', 60))
+# Un cierre de sesión o una revocación por usuario se guarda en CACHES['auth']
+# hasta que el token vence. Con varios procesos (WEB_CONCURRENCY > 1 en uvicorn
+# o gunicorn) o fuera de DEBUG esa caché debe ser compartida (REDIS_URL): con
+# LocMemCache la revocación sólo valdría en el proceso que la atendió, así que
+# la API no arranca (api.auth.check_revocation_store)
+API_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+API_REQUIRE_SHARED_REVOCATIONS = not DEBUG or API_WORKERS > 1
+API_ALGORITHM = os.environ.get('API_ALGORITHM', 'HS256')
+
+# Los puntos de control de stock (StockSnapshot) no incluyen los movimientos
+# de los últimos segundos, que todavía pueden estar confirmándose
+STOCK_SNAPSHOT_LAG_SECONDS = 300
+# /api/inventory/stock/changes no entrega las filas de los últimos segundos,
+# para no saltear escrituras que confirmen con un last_updated anterior
+STOCK_CHANGES_LAG_SECONDS = 5
+
+# Caché: memoria local por defecto. Con REDIS_URL (requiere el paquete redis)
+# la comparten todos los procesos, de modo que una escritura desde la API
+# invalida también el dashboard y las revocaciones de tokens se ven en todos lados.
+# El alias 'auth' guarda las revocaciones de tokens (ver api/auth.py)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'auth': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'auth',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'inventory',
+        },
+        'auth': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'auth',
+        },
+    }
+
+# Segundos que vive en caché cada bloque del dashboard (ver inventory/dashboard.py)
+DASHBOARD_CACHE_TIMEOUTS = {
+    'totals': 60,
+    'critical_stock': 60,
+    'activity': 30,
+    'predictions': 300,
+}
+# Pronósticos por página del endpoint JSON del dashboard (los de mayor riesgo primero)
+DASHBOARD_FORECAST_PAGE_SIZE = 20
+
+# Canal en tiempo real de la API (api/realtime.py): eventos pendientes por
+# cliente antes de pedirle que se resincronice, máximo de conexiones abiertas
+# y segundos sin eventos entre heartbeats
+REALTIME_QUEUE_SIZE = 100
+REALTIME_MAX_SUBSCRIBERS = 1000
+REALTIME_HEARTBEAT_SECONDS = 15
@@ -1,12 +1,14 @@
 import os
 import django
 from datetime import datetime
+from django.utils import timezone
 
 # Configurar Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
 django.setup()
 
 from inventory.models import Product, InventoryMovement, CurrentStock, PredictorStock
+from inventory.services import apply_movement
 
 # Limpiar datos existentes
 Product.objects.all().delete()
@@ -77,8 +79,18 @@ products_data = [
 for product_data in products_data:
     Product.objects.create(**product_data)
 
-# Crear movimientos de inventario
+# Crear movimientos de inventario. El stock actual resulta de aplicarlos con
+# apply_movement, empezando por el stock inicial de cada producto
 movements_data = [
+    {
+        'movement_id': 'M000',
+        'date': datetime(2024, 5, 19, 9, 0),
+        'product_id': 'P004',
+        'movement_type': 'INBOUND',
+        'quantity': 20,
+        'order_id': 'INIT-P004',
+        'notes': 'Initial stock'
+    },
     {
         'movement_id': 'M001',
         'date': datetime(2024, 5, 20, 9, 0),
@@ -153,52 +165,18 @@ movements_data = [
     }
 ]
 
-# Insertar movimientos
-for movement_data in movements_data:
-    product = Product.objects.get(product_id=movement_data['product_id'])
-    movement_data['product'] = product
-    del movement_data['product_id']
-    InventoryMovement.objects.create(**movement_data)
-
-# Crear stock actual
-current_stock_data = [
-    {
-        'product_id': 'P001',
-        'quantity': 8,
-        'last_updated': datetime(2024, 5, 21, 13, 0),
-        'total_inventory_cost': 9600
-    },
-    {
-        'product_id': 'P002',
-        'quantity': 5,
-        'last_updated': datetime(2024, 5, 21, 9, 0),
-        'total_inventory_cost': 1750
-    },
-    {
-        'product_id': 'P003',
-        'quantity': 19,
-        'last_updated': datetime(2024, 5, 21, 15, 30),
-        'total_inventory_cost': 1520
-    },
-    {
-        'product_id': 'P004',
-        'quantity': 18,
-        'last_updated': datetime(2024, 5, 21, 11, 45),
-        'total_inventory_cost': 900
-    },
-    {
-        'product_id': 'P005',
-        'quantity': 50,
-        'last_updated': datetime(2024, 5, 20, 16, 0),
-        'total_inventory_cost': 250
-    }
-]
-
-# Insertar stock actual
-for stock_data in current_stock_data:
-    product = Product.objects.get(product_id=stock_data['product_id'])
-    del stock_data['product_id']
-    CurrentStock.objects.create(product=product, **stock_data)
+# Insertar movimientos en orden cronológico; cada uno actualiza CurrentStock
+for movement_data in sorted(movements_data, key=lambda data: data['date']):
+    product = Product.objects.get(product_id=movement_data.pop('product_id'))
+    apply_movement(
+        product,
+        movement_data['movement_type'],
+        movement_data['quantity'],
+        movement_id=movement_data['movement_id'],
+        order_id=movement_data['order_id'],
+        notes=movement_data['notes'],
+        date=timezone.make_aware(movement_data['date'])
+    )
 
 # Crear datos de predicción
 predictor_data = [
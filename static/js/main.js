@@ -47,107 +47,115 @@ document.addEventListener('DOMContentLoaded', function() {
         row.style.animation = `fadeIn 0.5s ease forwards ${index * 0.1}s`;
     });
 
-    // Initialize charts and predictions table if predictions data exists
-    const predictionsElement = document.getElementById('predictions-data');
-    if (predictionsElement) {
-        try {
-            const predictions = JSON.parse(predictionsElement.textContent);
-            if (predictions && predictions.length > 0) {
-                initializeCharts(predictions);
-                populatePredictionsTable(predictions);
-            } else {
-                console.warn('No hay datos de predicción disponibles');
-            }
-        } catch (error) {
-            console.error('Error al procesar los datos de predicción:', error);
-        }
+    // Los pronósticos se piden después de mostrar la página, de a una página
+    // por vez (primero los productos en riesgo), y se van sumando a la tabla y los gráficos
+    const dashboard = document.getElementById('dashboard');
+    if (dashboard && dashboard.dataset.forecastsUrl) {
+        loadForecasts(dashboard.dataset.forecastsUrl);
     }
 });
 
-function initializeCharts(predictions) {
-    // Prepare data for trend chart
-    const trendChartData = {
-        labels: [],
-        datasets: []
-    };
+// Cantidad máxima de pronósticos que se muestran en el dashboard
+const MAX_DASHBOARD_FORECASTS = 200;
+
+async function loadForecasts(url) {
+    const charts = initializeCharts();
+    let cursor = null;
+    let loaded = 0;
 
-    // Create a dataset for each product
-    predictions.forEach((prediction, index) => {
-        const colors = [
-            'rgba(255, 99, 132, 0.7)',
-            'rgba(54, 162, 235, 0.7)',
-            'rgba(255, 206, 86, 0.7)',
-            'rgba(75, 192, 192, 0.7)',
-            'rgba(153, 102, 255, 0.7)'
-        ];
+    try {
+        do {
+            const pageUrl = cursor ? `${url}?cursor=${encodeURIComponent(cursor)}` : url;
+            const response = await fetch(pageUrl, { headers: { 'Accept': 'application/json' } });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const page = await response.json();
+
+            populatePredictionsTable(page.results);
+            updateCharts(charts, page.results);
+            loaded += page.results.length;
+            cursor = page.next_cursor;
+        } while (cursor && loaded < MAX_DASHBOARD_FORECASTS);
 
-        // Get dates for labels (use first product's dates)
-        if (index === 0) {
-            trendChartData.labels = prediction.predictions.map(p => 
-                new Date(p.date).toLocaleDateString()
-            );
+        if (loaded === 0) {
+            showPredictionsMessage('No hay pronósticos disponibles');
         }
+    } catch (error) {
+        console.error('Error al cargar los pronósticos:', error);
+        showPredictionsMessage('No se pudieron cargar los pronósticos');
+    }
+}
 
-        // Add dataset for this product
-        trendChartData.datasets.push({
-            label: prediction.product.product_name,
-            data: prediction.predictions.map(p => p.predicted_quantity),
-            borderColor: colors[index % colors.length],
-            backgroundColor: colors[index % colors.length].replace('0.7', '0.1'),
-            tension: 0.4
-        });
-    });
+function showPredictionsMessage(message) {
+    const tbody = document.getElementById('predictions-table-body');
+    if (tbody && !tbody.querySelector('tr:not(#predictions-loading)')) {
+        tbody.innerHTML = `<tr><td colspan="5" class="text-center text-muted">${message}</td></tr>`;
+    }
+}
 
-    // Initialize trend chart
-    const trendChart = new Chart(
-        document.getElementById('stockTrendChart'),
-        {
-            type: 'line',
-            data: trendChartData,
-            options: {
-                responsive: true,
-                plugins: {
-                    title: {
-                        display: true,
-                        text: 'Tendencias de Stock por Producto'
-                    }
-                },
-                scales: {
-                    y: {
-                        beginAtZero: true,
-                        title: {
-                            display: true,
-                            text: 'Cantidad'
-                        }
-                    }
+function lastPredictedQuantity(prediction) {
+    const last = prediction.predictions[prediction.predictions.length - 1];
+    return last ? last.predicted_quantity : null;
+}
+
+function initializeCharts() {
+    const options = (title) => ({
+        responsive: true,
+        plugins: {
+            title: {
+                display: true,
+                text: title
+            }
+        },
+        scales: {
+            y: {
+                beginAtZero: true,
+                title: {
+                    display: true,
+                    text: 'Cantidad'
                 }
             }
         }
-    );
-
-    // Prepare data for status chart
-    const statusData = {
-        labels: ['Stock Normal', 'Stock Crítico', 'Sin Stock'],
-        datasets: [{
-            data: [
-                predictions.filter(p => p.current_stock > p.threshold).length,
-                predictions.filter(p => p.current_stock <= p.threshold && p.current_stock > 0).length,
-                predictions.filter(p => p.current_stock === 0).length
-            ],
-            backgroundColor: [
-                'rgba(75, 192, 192, 0.7)',
-                'rgba(255, 206, 86, 0.7)',
-                'rgba(255, 99, 132, 0.7)'
-            ]
-        }]
+    });
+    const create = (id, config) => {
+        const canvas = document.getElementById(id);
+        return canvas ? new Chart(canvas, config) : null;
     };
 
-    // Initialize status chart
-    const statusChart = new Chart(
-        document.getElementById('stockStatusChart'),
-        {
+    return {
+        // Stock actual y predicho por producto
+        trend: create('stockTrendChart', {
+            type: 'line',
+            data: {
+                labels: [],
+                datasets: [{
+                    label: 'Stock Actual',
+                    data: [],
+                    borderColor: 'rgba(75, 192, 192, 0.7)',
+                    tension: 0.1
+                }, {
+                    label: 'Stock Predicho',
+                    data: [],
+                    borderColor: 'rgba(255, 99, 132, 0.7)',
+                    tension: 0.1
+                }]
+            },
+            options: options('Tendencias de Stock por Producto')
+        }),
+        status: create('stockStatusChart', {
             type: 'pie',
-            data: statusData,
+            data: {
+                labels: ['Stock Normal', 'Stock Crítico', 'Sin Stock'],
+                datasets: [{
+                    data: [0, 0, 0],
+                    backgroundColor: [
+                        'rgba(75, 192, 192, 0.7)',
+                        'rgba(255, 206, 86, 0.7)',
+                        'rgba(255, 99, 132, 0.7)'
+                    ]
+                }]
+            },
             options: {
                 responsive: true,
                 plugins: {
@@ -157,49 +165,60 @@ function initializeCharts(predictions) {
                     }
                 }
             }
-        }
-    );
-
-    // Prepare data for comparison chart
-    const comparisonData = {
-        labels: predictions.map(p => p.product.product_name),
-        datasets: [{
-            label: 'Stock Actual',
-            data: predictions.map(p => p.current_stock),
-            backgroundColor: 'rgba(54, 162, 235, 0.7)',
-        }, {
-            label: 'Stock Mínimo',
-            data: predictions.map(p => p.threshold),
-            backgroundColor: 'rgba(255, 99, 132, 0.7)',
-        }]
+        }),
+        comparison: create('stockComparisonChart', {
+            type: 'bar',
+            data: {
+                labels: [],
+                datasets: [{
+                    label: 'Stock Actual',
+                    data: [],
+                    backgroundColor: 'rgba(54, 162, 235, 0.7)',
+                }, {
+                    label: 'Stock Mínimo',
+                    data: [],
+                    backgroundColor: 'rgba(255, 99, 132, 0.7)',
+                }]
+            },
+            options: options('Comparación Stock Actual vs. Mínimo')
+        })
     };
+}
 
-    // Initialize comparison chart
-    const comparisonChart = new Chart(
-        document.getElementById('stockComparisonChart'),
-        {
-            type: 'bar',
-            data: comparisonData,
-            options: {
-                responsive: true,
-                plugins: {
-                    title: {
-                        display: true,
-                        text: 'Comparación Stock Actual vs. Mínimo'
-                    }
-                },
-                scales: {
-                    y: {
-                        beginAtZero: true,
-                        title: {
-                            display: true,
-                            text: 'Cantidad'
-                        }
-                    }
-                }
+function updateCharts(charts, predictions) {
+    if (charts.trend) {
+        const data = charts.trend.data;
+        predictions.forEach(p => {
+            data.labels.push(p.product.product_name);
+            data.datasets[0].data.push(p.current_stock);
+            data.datasets[1].data.push(lastPredictedQuantity(p));
+        });
+        charts.trend.update();
+    }
+
+    if (charts.status) {
+        const counts = charts.status.data.datasets[0].data;
+        predictions.forEach(p => {
+            if (p.current_stock <= 0) {
+                counts[2] += 1;
+            } else if (p.current_stock <= p.threshold) {
+                counts[1] += 1;
+            } else {
+                counts[0] += 1;
             }
-        }
-    );
+        });
+        charts.status.update();
+    }
+
+    if (charts.comparison) {
+        const data = charts.comparison.data;
+        predictions.forEach(p => {
+            data.labels.push(p.product.product_name);
+            data.datasets[0].data.push(p.current_stock);
+            data.datasets[1].data.push(p.threshold);
+        });
+        charts.comparison.update();
+    }
 }
 
 function populatePredictionsTable(predictions) {
@@ -209,8 +228,12 @@ function populatePredictionsTable(predictions) {
         return;
     }
 
-    // Limpiar la tabla primero
-    tbody.innerHTML = '';
+    // Las filas se agregan a medida que llegan las páginas
+    const loadingRow = document.getElementById('predictions-loading');
+    if (loadingRow) {
+        loadingRow.remove();
+    }
+    const firstNewRow = tbody.children.length;
 
     predictions.forEach(prediction => {
         try {
@@ -264,7 +287,7 @@ function populatePredictionsTable(predictions) {
     });
 
     // Aplicar animación de fade-in a las nuevas filas
-    const newRows = tbody.querySelectorAll('tr');
+    const newRows = Array.from(tbody.children).slice(firstNewRow);
     newRows.forEach((row, index) => {
         row.style.opacity = '0';
         row.style.animation = `fadeIn 0.5s ease forwards ${index * 0.1}s`;
@@ -1,13 +1,16 @@
+import argparse
 import os
 import django
-from decimal import Decimal
 
 # Configurar Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_system.settings')
 django.setup()
 
-from inventory.models import Product, InventoryMovement, CurrentStock
-from django.db.models import Sum, Case, When, F, Q
+from inventory.dashboard import invalidate_dashboard
+from inventory.models import Product, CurrentStock
+from inventory.services import BULK_BATCH_SIZE, net_stock_quantities
+from django.db import transaction
+from django.db.models import Sum, Q
 from django.utils import timezone
 
 def get_threshold_for_product(product):
@@ -21,70 +24,77 @@ def get_threshold_for_product(product):
     else:  # Productos premium
         return 3
 
-def calculate_stock():
+def calculate_stock(dry_run=False):
+    """
+    Reconcilia CurrentStock con los movimientos de forma masiva: las cantidades
+    netas de todos los productos salen de una sola consulta agrupada y las
+    filas que difieren se corrigen con bulk_update/bulk_create.
+
+    Args:
+        dry_run: Sólo informar las diferencias, sin escribir
+
+    Returns:
+        Lista de diferencias (producto, stock registrado o None, cantidad y umbral esperados)
+    """
     print("Iniciando cálculo de stock actual...")
-    
-    # Obtener todos los productos
-    products = Product.objects.filter(active=True)
-    
-    for product in products:
-        try:
-            # Calcular movimientos netos
-            movements = InventoryMovement.objects.filter(product=product)
-            
-            inbound_total = movements.filter(
-                movement_type='INBOUND'
-            ).aggregate(
-                total=Sum('quantity')
-            )['total'] or 0
-            
-            outbound_total = movements.filter(
-                movement_type__in=['OUTBOUND', 'ADJUSTMENT_OUT']
-            ).aggregate(
-                total=Sum('quantity')
-            )['total'] or 0
-            
-            # Calcular stock actual
-            current_quantity = inbound_total - outbound_total
-            
-            # Calcular costo total del inventario
-            total_cost = Decimal(current_quantity) * product.cost
-            
-            # Obtener el umbral específico para este producto
-            threshold = get_threshold_for_product(product)
-            
-            # Determinar el estado del stock
-            stock_status = 'CRITICAL' if current_quantity <= threshold else 'OK'
-            if current_quantity <= 0:
-                stock_status = 'OUT_OF_STOCK'
-            
-            # Actualizar o crear registro de stock actual
-            current_stock, created = CurrentStock.objects.update_or_create(
-                product=product,
-                defaults={
-                    'quantity': current_quantity,
-                    'total_inventory_cost': total_cost,
-                    'last_updated': timezone.now(),
-                    'stock_status': stock_status,
-                    'threshold': threshold
-                }
+
+    # Entradas menos salidas de cada producto en una sola consulta
+    expected = net_stock_quantities()
+
+    differences = []
+    products = Product.objects.filter(active=True).select_related('currentstock').order_by('product_id')
+    for product in products.iterator(chunk_size=BULK_BATCH_SIZE):
+        current_quantity = expected.get(product.product_id, 0)
+        threshold = get_threshold_for_product(product)
+        stock = getattr(product, 'currentstock', None)
+        if stock is None or stock.quantity != current_quantity or stock.threshold != threshold:
+            differences.append((product, stock, current_quantity, threshold))
+
+    for product, stock, current_quantity, threshold in differences:
+        if stock is None:
+            print(f"- {product.product_name} ({product.product_id}): sin registro -> {current_quantity} (umbral {threshold})")
+        else:
+            print(
+                f"- {product.product_name} ({product.product_id}): "
+                f"{stock.quantity} -> {current_quantity}, umbral {stock.threshold} -> {threshold}"
             )
-            
-            status = "creado" if created else "actualizado"
-            print(f"✓ Stock {status} para {product.product_name}:")
-            print(f"  - Cantidad actual: {current_quantity}")
-            print(f"  - Umbral: {threshold}")
-            print(f"  - Estado: {stock_status}")
-            print(f"  - Costo total: ${total_cost:,.2f}")
-            print(f"  - Entradas totales: {inbound_total}")
-            print(f"  - Salidas totales: {outbound_total}")
-            
-        except Exception as e:
-            print(f"✗ Error procesando {product.product_name}: {str(e)}")
+    print(f"Productos con diferencias: {len(differences)}")
+
+    if dry_run or not differences:
+        return differences
+
+    now = timezone.now()
+    changed, created = [], []
+    for product, stock, current_quantity, threshold in differences:
+        if stock is None:
+            stock = CurrentStock(product=product)
+            created.append(stock)
+        else:
+            changed.append(stock)
+        stock.quantity = current_quantity
+        stock.threshold = threshold
+        stock.last_updated = now
+        stock.refresh_derived_fields()
+
+    with transaction.atomic():
+        CurrentStock.objects.bulk_update(
+            changed,
+            ['quantity', 'threshold', 'stock_status', 'total_inventory_cost', 'last_updated'],
+            batch_size=BULK_BATCH_SIZE
+        )
+        CurrentStock.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        transaction.on_commit(invalidate_dashboard)
+
+    print(f"✓ Stock actualizado: {len(changed)} registros corregidos, {len(created)} creados")
+    return differences
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcilia el stock actual con los movimientos registrados")
+    parser.add_argument('--dry-run', action='store_true', help="Sólo mostrar las diferencias, sin guardar cambios")
+    args = parser.parse_args()
+
     print("=== Actualización de Stock ===")
-    calculate_stock()
+    calculate_stock(dry_run=args.dry_run)
     print("\nProceso completado.")
     
     # Mostrar resumen
@@ -93,7 +103,7 @@ if __name__ == "__main__":
         Q(stock_status='CRITICAL') | Q(stock_status='OUT_OF_STOCK')
     ).select_related('product')
     
-    total_value = sum(stock.total_inventory_cost for stock in CurrentStock.objects.all())
+    total_value = CurrentStock.objects.aggregate(total=Sum('total_inventory_cost'))['total'] or 0
     
     print(f"\nValor total del inventario: ${total_value:,.2f}")
     print(f"Productos en estado crítico: {critical_stock.count()}")